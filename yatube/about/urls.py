@@ -1,11 +1,15 @@
 from django.urls import path
 
+from core.routers import replica_safe
+
 from . import views
 
 
 app_name = 'about'
 
 urlpatterns = [
-    path('author/', views.AboutAuthorView.as_view(), name='author'),
-    path('tech/', views.AboutTechView.as_view(), name='tech'),
+    path('author/', replica_safe(views.AboutAuthorView.as_view()),
+         name='author'),
+    path('tech/', replica_safe(views.AboutTechView.as_view()),
+         name='tech'),
 ]
@@ -0,0 +1,62 @@
+"""Счётчики поколений для версионированных ключей кэша.
+
+Фрагмент кэшируется под ключом, в который входит текущее поколение
+его области (scope). Запись увеличивает поколение, и старые фрагменты
+просто перестают читаться, дожидаясь вытеснения. Начальное значение
+берётся из времени, поэтому вытесненный счётчик не вернётся к уже
+использованному номеру.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _key(scope):
+    return f'gen:{scope}'
+
+
+def _time_key(scope):
+    return f'gen_time:{scope}'
+
+
+def _seed():
+    return int(time.time() * 1000)
+
+
+def generations(scopes):
+    """Текущие поколения областей: {scope: номер}."""
+    keys = {_key(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    for key, scope in keys.items():
+        if key not in found:
+            # счётчик заведён только что: считаем область изменённой сейчас
+            if cache.add(key, _seed(), None):
+                cache.set(_time_key(scope), time.time(), None)
+            found[key] = cache.get(key)
+    return {scope: found[key] for key, scope in keys.items()}
+
+
+def generation(*scopes):
+    """Общая версия для набора областей, например '1650000000000.3'."""
+    current = generations(scopes)
+    return '.'.join(str(current[scope]) for scope in scopes)
+
+
+def bump(*scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.add(_key(scope), _seed(), None)
+    now = time.time()
+    cache.set_many({_time_key(scope): now for scope in scopes}, None)
+
+
+def last_bumped(scopes):
+    """Время последнего сброса любой из областей или None, если
+    для какой-то из них оно неизвестно."""
+    keys = [_time_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    if not keys or len(found) < len(keys):
+        return None
+    return max(found.values())
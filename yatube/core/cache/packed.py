@@ -0,0 +1,130 @@
+"""Процессный кэш упакованных массивов целых чисел.
+
+Значения хранятся как есть, без pickle: array('q') занимает 8 байт
+на элемент. Вытеснение — LRU по суммарному размеру значений
+(OPTIONS['MAX_BYTES']), а не по числу ключей.
+"""
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_stores = {}
+_locks = {}
+
+
+class _Store:
+    def __init__(self):
+        self.data = OrderedDict()
+        self.bytes = 0
+
+
+class PackedIdCache(BaseCache):
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.max_bytes = int(options.get('MAX_BYTES', 16 * 1024 * 1024))
+        self._store = _stores.setdefault(name, _Store())
+        self._cache = self._store.data
+        self._lock = _locks.setdefault(name, Lock())
+
+    @staticmethod
+    def _pack(value):
+        # срез даёт буфер ровно по длине, без запаса на рост
+        if isinstance(value, array) and value.typecode == 'q':
+            return value[:]
+        return array('q', list(value))
+
+    @staticmethod
+    def _sizeof(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def _alive(self, key):
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        expires = item[0]
+        if expires is not None and expires <= time.time():
+            self._delete(key)
+            return None
+        return item
+
+    def _delete(self, key):
+        item = self._cache.pop(key, None)
+        if item is not None:
+            self._store.bytes -= item[2]
+
+    def _set(self, key, value, timeout):
+        self._delete(key)
+        size = self._sizeof(key, value)
+        self._cache[key] = (self.get_backend_timeout(timeout), value, size)
+        self._store.bytes += size
+        while self._store.bytes > self.max_bytes and len(self._cache) > 1:
+            self._delete(next(iter(self._cache)))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            if self._alive(key) is not None:
+                return False
+            self._set(key, self._pack(value), timeout)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            item = self._alive(key)
+            if item is None:
+                return default
+            self._cache.move_to_end(key)
+            return item[1][:]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._set(key, self._pack(value), timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        with self._lock:
+            item = self._alive(key)
+            if item is None:
+                return False
+            self._cache[key] = (self.get_backend_timeout(timeout),) + item[1:]
+            return True
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            return self._alive(key) is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._store.bytes = 0
+
+    def stats(self):
+        """Число записей и занятая память, в том числе на одну запись."""
+        with self._lock:
+            entries = len(self._cache)
+            used = self._store.bytes
+        return {
+            'entries': entries,
+            'bytes': used,
+            'bytes_per_entry': used // entries if entries else 0,
+            'max_bytes': self.max_bytes,
+        }
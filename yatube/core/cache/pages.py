@@ -0,0 +1,128 @@
+"""Кэш целых страниц для анонимных пользователей.
+
+Вьюха помечает страницу областями (scope), от которых та зависит,
+вызовом tag_page(). Вместе с ответом сохраняются поколения этих
+областей на момент начала рендера; ответ отдаётся из кэша, только
+пока ни одно из них не увеличилось. Поэтому сброс любой области —
+один incr, сколько бы страниц от неё ни зависело, а проверка при
+чтении — один get_many на число областей страницы.
+
+Ключ страницы — путь и параметры из PAGE_CACHE_PARAMS, без хоста и
+прочих параметров, которые присылает клиент. Вьюха сообщает, какие
+параметры она на самом деле приняла (page_params()); ответ на адрес с
+другими значениями отдаётся, но не кэшируется, так что мусорные
+значения не плодят записей.
+
+Из тех же поколений строятся валидаторы условного GET: ETag — хеш
+того же адреса и поколений (для вошедшего пользователя ещё его id и CSRF-
+cookie), Last-Modified — время последнего сброса областей страницы,
+округлённое вверх до секунды. Пока эта секунда не кончилась, в неё
+может попасть ещё один сброс с тем же Last-Modified, поэтому до её
+конца заголовок не отдаётся и If-Modified-Since не проверяется.
+Запрос с совпавшим If-None-Match / If-Modified-Since получает 304
+до того, как вьюха сделает хоть один запрос ленты.
+"""
+import hashlib
+import time
+from math import ceil
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from core import routers
+
+from .generations import generations, last_bumped
+
+HITS = 'page_cache:hits'
+MISSES = 'page_cache:misses'
+
+
+def tag_page(request, *scopes):
+    """Помечает страницу областями; возвращает 304, если у клиента
+    актуальная копия, иначе None."""
+    versions = generations(scopes)
+    modified = last_bumped(scopes)
+    if routers.reading_replica() and not routers.covers(modified):
+        # реплика не догнала поколения: дальше — основная БД, а ответ,
+        # собранный в том числе по реплике, не кэшируется
+        routers.use_primary()
+        routers.forbid_caching()
+    request.page_cache_versions = versions
+    request.page_etag = page_etag(request, versions)
+    request.page_last_modified = None
+    if not request.user.is_authenticated:
+        if modified is not None and ceil(modified) <= time.time():
+            request.page_last_modified = ceil(modified)
+    not_modified = get_conditional_response(
+        request, etag=request.page_etag,
+        last_modified=request.page_last_modified,
+    )
+    if not routers.caching_allowed():
+        # валидаторы клиента сверены, но свои не выдаём
+        request.page_cache_versions = None
+        request.page_etag = request.page_last_modified = None
+    return not_modified
+
+
+def page_etag(request, versions):
+    parts = [location(request)]
+    parts += [f'{scope}={versions[scope]}' for scope in sorted(versions)]
+    if request.user.is_authenticated:
+        parts += [f'user={request.user.pk}',
+                  request.META.get('CSRF_COOKIE', '')]
+    return quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
+
+
+def location(request, params=None):
+    """Путь и параметры из PAGE_CACHE_PARAMS (или params) в постоянном
+    порядке."""
+    if params is None:
+        params = {name: request.GET[name]
+                  for name in settings.PAGE_CACHE_PARAMS
+                  if request.GET.get(name)}
+    return f'{request.path}?{urlencode(sorted(params.items()))}'
+
+
+def page_key(request, params=None):
+    url = location(request, params)
+    return 'page:' + hashlib.md5(url.encode()).hexdigest()
+
+
+def page_params(request, **params):
+    """Запоминает проверенные параметры, которыми вьюха определила
+    страницу; пустые значения отбрасываются."""
+    request.page_cache_params = {name: str(value)
+                                 for name, value in params.items() if value}
+
+
+def canonical_key(request):
+    """Ключ, под которым можно сохранить отрисованную страницу: по
+    параметрам, которые приняла вьюха (без page_params() — никаким)."""
+    return page_key(request, getattr(request, 'page_cache_params', {}))
+
+
+def is_fresh(versions):
+    return generations(versions) == versions
+
+
+def count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def stats():
+    counters = cache.get_many([HITS, MISSES])
+    hits, misses = counters.get(HITS, 0), counters.get(MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 3) if total else 0,
+        'ttl': settings.PAGE_CACHE_TTL,
+    }
@@ -0,0 +1,239 @@
+"""Общий для всех процессов хоста кэш в отдельном файле SQLite.
+
+Файл открыт в режиме WAL: читатели не ждут писателей, а запись из
+любого воркера сразу видна остальным. Целые числа хранятся как
+INTEGER, поэтому incr — один атомарный UPDATE. Остальные значения
+сериализуются pickle. Объём значений считают триггеры в cache_meta;
+при превышении OPTIONS['MAX_BYTES'] сначала удаляются просроченные
+записи, затем давно не читанные (LRU по полю accessed).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_meta VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache
+BEGIN
+    UPDATE cache_meta SET bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache
+BEGIN
+    UPDATE cache_meta SET bytes = bytes - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_meta SET bytes = bytes + NEW.size - OLD.size;
+END;
+'''
+UPSERT = '''
+INSERT INTO cache (key, value, expires, accessed, size)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, expires = excluded.expires,
+    accessed = excluded.accessed, size = excluded.size
+'''
+ALIVE = '(expires IS NULL OR expires > ?)'
+# accessed обновляется не чаще раза в секунду, чтобы чтение
+# не превращалось в запись на каждом get
+ACCESS_RESOLUTION = 1.0
+MAX_VARIABLES = 500
+
+
+class SQLiteCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.max_bytes = int(options.get('MAX_BYTES', 64 * 1024 * 1024))
+        self.busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self.cull_batch = int(options.get('CULL_BATCH', 100))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # соединение своё у каждого потока и у каждого процесса после fork
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = pid
+        return self._local.conn
+
+    @staticmethod
+    def _encode(value):
+        if type(value) is int:
+            return value, 8
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return blob, len(blob)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _keys(self, keys, version):
+        keys = {self.make_key(key, version=version): key for key in keys}
+        for key in keys:
+            self.validate_key(key)
+        return keys
+
+    def _row(self, key, timeout, value):
+        encoded, size = self._encode(value)
+        return (key, encoded, self.get_backend_timeout(timeout),
+                time.time(), size + len(key))
+
+    def _cull(self):
+        db = self._db
+        (used,) = db.execute('SELECT bytes FROM cache_meta').fetchone()
+        if used <= self.max_bytes:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        while db.execute('SELECT bytes FROM cache_meta').fetchone()[0] \
+                > self.max_bytes:
+            deleted = db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)', (self.cull_batch,)).rowcount
+            if not deleted:
+                break
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        added = self._db.execute(
+            UPSERT + ' WHERE cache.expires <= ?',
+            self._row(key, timeout, value) + (time.time(),),
+        ).rowcount
+        if added:
+            self._cull()
+        return bool(added)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        row = self._db.execute(
+            f'SELECT value, accessed FROM cache WHERE key = ? AND {ALIVE}',
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return default
+        if now - row[1] > ACCESS_RESOLUTION:
+            self._db.execute('UPDATE cache SET accessed = ? WHERE key = ?',
+                             (now, key))
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = self._keys(keys, version)
+        now = time.time()
+        found = {}
+        names = list(keys)
+        for start in range(0, len(names), MAX_VARIABLES):
+            chunk = names[start:start + MAX_VARIABLES]
+            marks = ', '.join('?' * len(chunk))
+            rows = self._db.execute(
+                f'SELECT key, value FROM cache WHERE key IN ({marks}) '
+                f'AND {ALIVE}', chunk + [now],
+            )
+            found.update((keys[key], self._decode(value))
+                         for key, value in rows)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._db.execute(UPSERT, self._row(key, timeout, value))
+        self._cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        keys = self._keys(data, version)
+        rows = [self._row(key, timeout, data[original])
+                for key, original in keys.items()]
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(UPSERT, rows)
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        self._cull()
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self._db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {ALIVE}',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        ).rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self._db.execute(
+            f'UPDATE cache SET value = value + ? WHERE key = ? AND {ALIVE} '
+            f"AND typeof(value) = 'integer' RETURNING value",
+            (delta, key, time.time()),
+        ).fetchone()
+        if row is None:
+            if self._alive(key):
+                raise TypeError(f"Value of '{key}' is not an integer")
+            raise ValueError(f"Key '{key}' not found")
+        return row[0]
+
+    def _alive(self, key):
+        return self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._alive(key)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        names = list(self._keys(keys, version))
+        for start in range(0, len(names), MAX_VARIABLES):
+            chunk = names[start:start + MAX_VARIABLES]
+            marks = ', '.join('?' * len(chunk))
+            self._db.execute(f'DELETE FROM cache WHERE key IN ({marks})',
+                             chunk)
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def stats(self):
+        entries, = self._db.execute('SELECT count(*) FROM cache').fetchone()
+        used, = self._db.execute('SELECT bytes FROM cache_meta').fetchone()
+        return {'entries': entries, 'bytes': used,
+                'max_bytes': self.max_bytes}
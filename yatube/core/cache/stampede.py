@@ -0,0 +1,88 @@
+"""Защита от одновременного пересчёта одной и той же записи кэша.
+
+Запись хранится вместе с мягким сроком годности и временем, которое
+ушло на её расчёт. Пересчитывает только тот, кто взял блокировку
+(cache.add на ключ lock:…); остальные в это время получают старое
+значение. Чтобы горячая запись не истекала у всех разом, её
+обновляют заранее с вероятностью, растущей к концу срока
+(XFetch: now - delta * beta * log(random()) >= expires).
+
+Жёсткий таймаут записи в кэше на STALE_TTL больше мягкого, поэтому
+старое значение остаётся доступным, пока новое считается.
+"""
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_PREFIX = 'lock:'
+
+
+def acquire(key):
+    return cache.add(LOCK_PREFIX + key, 1, settings.STAMPEDE_LOCK_TIMEOUT)
+
+
+def release(key):
+    cache.delete(LOCK_PREFIX + key)
+
+
+def envelope(value, ttl, delta):
+    """Запись с мягким сроком годности и временем расчёта."""
+    expires = None if ttl is None else time.time() + ttl
+    return {'value': value, 'expires': expires, 'delta': delta}
+
+
+def hard_timeout(ttl):
+    return None if ttl is None else ttl + settings.STALE_TTL
+
+
+def should_refresh(entry, beta=None):
+    """Пора ли пересчитать запись: истекла или выпал ранний пересчёт."""
+    if entry['expires'] is None:
+        return False
+    beta = settings.STAMPEDE_BETA if beta is None else beta
+    gap = -entry['delta'] * beta * math.log(1 - random.random())
+    return time.time() + gap >= entry['expires']
+
+
+def fetch(key, compute, ttl, stale_key=None):
+    """Значение из кэша, пересчитанное не более чем одним процессом.
+
+    stale_key — ключ, под которым лежит последнее значение прошлой
+    версии (например, фрагмент до сброса поколения); его отдают, пока
+    новая версия считается.
+    """
+    entry = cache.get(key)
+    if entry is not None and not should_refresh(entry):
+        return entry['value']
+    locked = acquire(key)
+    if not locked:
+        if entry is None and stale_key is not None:
+            entry = cache.get(stale_key)
+        if entry is None:
+            entry = _wait(key)
+        if entry is not None:
+            return entry['value']
+    try:
+        start = time.perf_counter()
+        value = compute()
+        entry = envelope(value, ttl, time.perf_counter() - start)
+        keys = [key] if stale_key is None else [key, stale_key]
+        cache.set_many(dict.fromkeys(keys, entry), hard_timeout(ttl))
+    finally:
+        if locked:
+            release(key)
+    return value
+
+
+def _wait(key):
+    """Ждёт, пока значение посчитает владелец блокировки."""
+    deadline = time.monotonic() + settings.STAMPEDE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
@@ -0,0 +1,262 @@
+"""Двухуровневый кэш: маленький LRU в памяти процесса (L1) перед
+общим бэкендом (L2) из CACHES.
+
+Чтение сначала смотрит в L1 и идёт в L2 только при промахе. Запись
+идёт сквозь L1 в L2. Запись в L1 живёт не дольше OPTIONS['L1_TTL']
+секунд — это верхняя граница устаревания для любого ключа.
+
+incr, decr, delete и delete_many ещё и записывают изменённые ключи
+в журнал в L2: номер записи — счётчик в L2, сама запись живёт
+OPTIONS['LOG_TTL'] секунд. Каждый процесс не чаще раза в
+OPTIONS['POLL_INTERVAL'] секунд читает записи журнала, которых ещё
+не видел, и выбрасывает из своего L1 только эти ключи. Если записей
+больше OPTIONS['LOG_LENGTH'] или какая-то уже пропала, L1 очищается
+целиком. Так сброс поколений из core.cache.generations (создание и
+правка постов, комментарии) доходит до всех процессов не позже чем
+через POLL_INTERVAL, а остальной L1 остаётся. set журнал не трогает:
+ключи фрагментов, карточек и страниц версионированы и не
+перезаписываются другим содержимым.
+
+Ключи с префиксами из OPTIONS['L1_EXCLUDE'] (счётчики статистики,
+которые пишутся на каждом запросе) в L1 не попадают и в журнал не
+пишутся.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+LOG_KEY = 'l1_log'
+
+
+def _entry_key(number):
+    return f'l1_log:{number}'
+
+
+class TieredCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'shared')
+        self.max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_ttl = float(options.get('L1_TTL', 5))
+        self.poll_interval = float(options.get('POLL_INTERVAL', 1))
+        self.exclude = tuple(options.get('L1_EXCLUDE', ()))
+        self.log_length = int(options.get('LOG_LENGTH', 1000))
+        self.log_ttl = float(options.get('LOG_TTL', 60))
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        # номер последней прочитанной записи журнала и время опроса
+        self._state_lock = threading.Lock()
+        self._seen = None
+        self._polled = 0
+        self.hits = self.misses = 0
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _local(self, key):
+        return not key.startswith(self.exclude)
+
+    def _l1_key(self, key, version):
+        return self.l2.make_key(key, version=version)
+
+    def _ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.l2.default_timeout
+        if timeout is None:
+            return self.l1_ttl
+        return min(timeout, self.l1_ttl)
+
+    def _remember(self, l1_key, value, ttl=None):
+        ttl = self.l1_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return self._forget(l1_key)
+        with self._lock:
+            self._l1[l1_key] = (time.monotonic() + ttl, value)
+            self._l1.move_to_end(l1_key)
+            while len(self._l1) > self.max_entries:
+                self._l1.popitem(last=False)
+
+    def _forget(self, l1_key):
+        with self._lock:
+            self._l1.pop(l1_key, None)
+
+    def _lookup(self, l1_key):
+        with self._lock:
+            entry = self._l1.get(l1_key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic():
+                del self._l1[l1_key]
+                return False, None
+            self._l1.move_to_end(l1_key)
+            return True, entry[1]
+
+    def _poll(self):
+        now = time.monotonic()
+        with self._state_lock:
+            if now - self._polled < self.poll_interval:
+                return
+            self._polled = now
+            seen = self._seen
+        current = self.l2.get(LOG_KEY)
+        if current is None:
+            self.l2.add(LOG_KEY, int(time.time() * 1000), None)
+            current = self.l2.get(LOG_KEY)
+        if current == seen:
+            return
+        changed = self._changed(seen, current)
+        with self._lock:
+            if changed is None:
+                self._l1.clear()
+            for l1_key in changed or ():
+                self._l1.pop(l1_key, None)
+        with self._state_lock:
+            if self._seen == seen:
+                self._seen = current
+
+    def _changed(self, seen, current):
+        """Ключи из записей журнала после seen до current или None, если
+        их не восстановить."""
+        if seen is None or not 0 < current - seen <= self.log_length:
+            return None
+        keys = [_entry_key(number) for number in range(seen + 1, current + 1)]
+        entries = self.l2.get_many(keys)
+        if len(entries) < len(keys):
+            return None
+        return {l1_key for entry in entries.values() for l1_key in entry}
+
+    def _clear_l1(self):
+        with self._lock:
+            self._l1.clear()
+
+    def _invalidate(self, l1_keys):
+        """Сообщает остальным процессам, что эти ключи в их L1
+        устарели."""
+        try:
+            number = self.l2.incr(LOG_KEY)
+        except ValueError:
+            # журнал начат заново: остальные очистят L1 целиком
+            self.l2.add(LOG_KEY, int(time.time() * 1000), None)
+            return
+        self.l2.set(_entry_key(number), list(l1_keys), self.log_ttl)
+        with self._state_lock:
+            # если журнал между опросами никто другой не двигал,
+            # свой L1 остаётся согласованным
+            if self._seen is not None and number == self._seen + 1:
+                self._seen = number
+            else:
+                self._polled = 0
+
+    def get(self, key, default=None, version=None):
+        if not self._local(key):
+            return self.l2.get(key, default, version=version)
+        self._poll()
+        l1_key = self._l1_key(key, version)
+        found, value = self._lookup(l1_key)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self.l2.get(key, version=version)
+        if value is None:
+            return default
+        self._remember(l1_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._poll()
+        found, missing = {}, []
+        for key in keys:
+            hit, value = (self._lookup(self._l1_key(key, version))
+                          if self._local(key) else (False, None))
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            fetched = self.l2.get_many(missing, version=version)
+            for key, value in fetched.items():
+                if self._local(key):
+                    self._remember(self._l1_key(key, version), value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._poll()
+        self.l2.set(key, value, timeout, version=version)
+        if self._local(key):
+            self._remember(self._l1_key(key, version), value,
+                           self._ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._poll()
+        failed = self.l2.set_many(data, timeout, version=version)
+        ttl = self._ttl(timeout)
+        for key, value in data.items():
+            if self._local(key) and key not in (failed or ()):
+                self._remember(self._l1_key(key, version), value, ttl)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._poll()
+        added = self.l2.add(key, value, timeout, version=version)
+        if added and self._local(key):
+            self._remember(self._l1_key(key, version), value,
+                           self._ttl(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._forget(self._l1_key(key, version))
+        return self.l2.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        if self._local(key):
+            l1_key = self._l1_key(key, version)
+            self._invalidate([l1_key])
+            self._remember(l1_key, value)
+        return value
+
+    def delete(self, key, version=None):
+        self.l2.delete(key, version=version)
+        if self._local(key):
+            l1_key = self._l1_key(key, version)
+            self._forget(l1_key)
+            self._invalidate([l1_key])
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        l1_keys = [self._l1_key(key, version)
+                   for key in keys if self._local(key)]
+        self.l2.delete_many(keys, version=version)
+        for l1_key in l1_keys:
+            self._forget(l1_key)
+        if l1_keys:
+            self._invalidate(l1_keys)
+
+    def clear(self):
+        self.l2.clear()
+        self._clear_l1()
+        with self._state_lock:
+            self._seen = None
+            self._polled = 0
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'l1_entries': len(self._l1),
+            'l1_hits': self.hits,
+            'l1_misses': self.misses,
+            'l1_hit_ratio': round(self.hits / total, 3) if total else 0,
+        }
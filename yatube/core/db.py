@@ -0,0 +1,18 @@
+"""Настройка соединений SQLite для боевого режима.
+
+Прагмы из SQLITE_PRAGMAS выполняются на каждом новом соединении.
+В режиме WAL читатели не ждут, пока post_create или add_comment
+допишут транзакцию, а synchronous=NORMAL сбрасывает журнал на диск
+только на контрольных точках. Вместе с CONN_MAX_AGE соединение и его
+страничный кэш живут дольше одного запроса.
+"""
+from django.conf import settings
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
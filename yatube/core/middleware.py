@@ -0,0 +1,132 @@
+import time
+
+from django.core.cache import cache
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import routers
+from .cache import pages, stampede
+
+
+class AnonymousPageCacheMiddleware:
+    """Отдаёт анонимам закэшированные страницы, помеченные tag_page(),
+    и проставляет всем таким страницам ETag и Last-Modified.
+
+    Сохраняется только ответ на канонический адрес страницы (см.
+    core.cache.pages.page_params). Устаревшую страницу перерисовывает
+    один запрос (см.
+    core.cache.stampede), остальные в это время получают старую копию
+    с X-Page-Cache: STALE.
+
+    Должен стоять после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        if request.user.is_authenticated:
+            return self._validators(request, self.get_response(request))
+        key = pages.page_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            return self._render(request, key)
+        fresh = pages.is_fresh(entry['versions'])
+        if fresh and not stampede.should_refresh(entry):
+            pages.count(pages.HITS)
+            return self._restore(request, entry, 'HIT')
+        # страницу уже перерисовывает другой запрос: отдаём старую копию
+        if not stampede.acquire(key):
+            pages.count(pages.HITS)
+            return self._restore(request, entry, 'HIT' if fresh else 'STALE')
+        try:
+            return self._render(request, key)
+        finally:
+            stampede.release(key)
+
+    def _render(self, request, key):
+        pages.count(pages.MISSES)
+        start = time.perf_counter()
+        response = self._validators(request, self.get_response(request))
+        if (getattr(request, 'page_cache_versions', None)
+                and self._cacheable(response)
+                and pages.canonical_key(request) == key):
+            entry = self._store(request, response,
+                                time.perf_counter() - start)
+            cache.set(key, entry,
+                      stampede.hard_timeout(settings.PAGE_CACHE_TTL))
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    @staticmethod
+    def _validators(request, response):
+        etag = getattr(request, 'page_etag', None)
+        if etag is None or response.status_code not in (200, 304):
+            return response
+        response['ETag'] = etag
+        if request.page_last_modified is not None:
+            response['Last-Modified'] = http_date(request.page_last_modified)
+        return response
+
+    @staticmethod
+    def _cacheable(response):
+        return (response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not response.has_header('Vary'))
+
+    @staticmethod
+    def _store(request, response, delta):
+        return {
+            'expires': time.time() + settings.PAGE_CACHE_TTL,
+            'delta': delta,
+            'versions': request.page_cache_versions,
+            'last_modified': request.page_last_modified,
+            'content': response.content,
+            'headers': list(response.items()),
+        }
+
+    @staticmethod
+    def _restore(request, entry, state):
+        response = HttpResponse(entry['content'])
+        for header, value in entry['headers']:
+            response[header] = value
+        response['X-Page-Cache'] = state
+        return get_conditional_response(
+            request, etag=response.get('ETag'),
+            last_modified=entry['last_modified'], response=response,
+        )
+
+
+class ReplicaMiddleware:
+    """Включает чтение с реплики для вьюх с @replica_safe и ставит
+    cookie read-your-writes после запросов с записью."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.use_primary()
+        if routers.has_written() and routers.replica_configured():
+            response.set_cookie(routers.PIN_COOKIE, str(time.time()),
+                                max_age=settings.REPLICA_MAX_LAG,
+                                httponly=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(view_func, 'replica_safe', False):
+            return None
+        if not routers.replica_configured() or routers.pinned(request):
+            return None
+        lag = routers.replica_lag()
+        if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+            routers.use_replica()
+        return None
@@ -0,0 +1,22 @@
+"""Пул процессов для команд управления.
+
+Пул берёт метод запуска по умолчанию: на Windows и macOS это spawn, и
+процесс пула начинает с чистого интерпретатора, поэтому сам поднимает
+Django. С fork (Linux) повторный django.setup() ничего не делает.
+"""
+import multiprocessing
+import os
+
+import django
+
+
+def _setup(settings_module):
+    if settings_module:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def pool(processes):
+    return multiprocessing.Pool(
+        processes, initializer=_setup,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),))
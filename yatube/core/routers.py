@@ -0,0 +1,155 @@
+"""Чтение с реплики для вьюх, которые ничего не пишут.
+
+Реплика — отдельный файл SQLite под алиасом 'replica', который
+команда refresh_replica держит в актуальном состоянии через backup
+API. Вьюха, помеченная @replica_safe, читает с реплики, если:
+
+- реплика настроена и отстаёт не больше REPLICA_MAX_LAG секунд
+  (отставание считается от времени, которое refresh_replica
+  записывает рядом с файлом после backup());
+- у клиента нет cookie о недавней записи, которой на реплике ещё нет.
+
+Поколения кэша (core.cache.generations) всегда текущие, а реплика
+может их не догнать. Если последний сброс областей страницы случился
+позже обновления реплики, tag_page() переводит остаток запроса на
+основную БД и запрещает кэшировать ответ (forbid_caching()): уже
+прочитанное с реплики нельзя сохранять под новыми поколениями.
+Модели из REPLICA_PRIMARY_MODELS всегда читаются с основной БД.
+
+Первая же запись в запросе возвращает все последующие чтения этого
+запроса на основную БД. После запроса с записью ставится cookie со
+временем записи: пока реплику не обновят позже этого времени,
+чтения клиента идут на основную БД (read-your-writes).
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+PIN_COOKIE = 'primary_pin'
+
+_state = threading.local()
+
+
+def replica_configured():
+    return REPLICA in connections.databases
+
+
+def _stamp_path():
+    return connections.databases[REPLICA]['NAME'] + '.refreshed'
+
+
+def replica_refreshed_at():
+    """Время начала последнего обновления реплики или None.
+
+    Время изменения файла не годится: в режиме WAL страницы копии
+    могут лечь в -wal, не трогая основной файл.
+    """
+    try:
+        with open(_stamp_path()) as stamp:
+            return float(stamp.read())
+    except (KeyError, OSError, ValueError):
+        return None
+
+
+def mark_refreshed(started):
+    """Записывает время начала обновления, которое уже в реплике."""
+    path = _stamp_path()
+    with open(path + '.tmp', 'w') as stamp:
+        stamp.write(repr(started))
+    os.replace(path + '.tmp', path)
+
+
+def covers(modified):
+    """Видит ли реплика изменения, сделанные до modified. Сброс
+    поколения пишется до фиксации транзакции, отсюда запас
+    REPLICA_SETTLE."""
+    refreshed = replica_refreshed_at()
+    return (modified is not None and refreshed is not None
+            and refreshed >= modified + settings.REPLICA_SETTLE)
+
+
+def replica_lag():
+    refreshed = replica_refreshed_at()
+    return None if refreshed is None else time.time() - refreshed
+
+
+def replica_safe(view):
+    """Помечает вьюху как только читающую."""
+    view.replica_safe = True
+    return view
+
+
+def start_request():
+    _state.replica = _state.wrote = _state.uncacheable = False
+
+
+def use_replica():
+    _state.replica = True
+
+
+def reading_replica():
+    return getattr(_state, 'replica', False)
+
+
+def forbid_caching():
+    """Ответ этого запроса нельзя сохранять в кэш."""
+    _state.uncacheable = True
+
+
+def caching_allowed():
+    return not getattr(_state, 'uncacheable', False)
+
+
+def use_primary():
+    """Остаток запроса читает с основной БД."""
+    _state.replica = False
+
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+
+def pinned(request):
+    """Клиент недавно писал, а реплика этой записи ещё не видела."""
+    try:
+        written = float(request.COOKIES.get(PIN_COOKIE, ''))
+    except ValueError:
+        return False
+    refreshed = replica_refreshed_at()
+    return refreshed is None or refreshed <= written
+
+
+def stats():
+    lag = replica_lag()
+    return {
+        'configured': replica_configured(),
+        'lag': None if lag is None else round(lag, 3),
+        'max_lag': settings.REPLICA_MAX_LAG,
+    }
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if (getattr(_state, 'replica', False) and model._meta.label_lower
+                not in settings.REPLICA_PRIMARY_MODELS):
+            return REPLICA
+        # не None: иначе Django возьмёт базу объекта, прочитанного
+        # с реплики, и его связанные менеджеры останутся на реплике
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # всё, что читается после записи, читается с основной БД
+        _state.replica = False
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db != REPLICA
@@ -0,0 +1,68 @@
+from django import template
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from core import routers
+from core.cache import stampede
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on,
+                 version):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        expire_time = self.expire_time.resolve(context)
+        if expire_time is not None:
+            try:
+                expire_time = int(expire_time)
+            except (ValueError, TypeError):
+                raise template.TemplateSyntaxError(
+                    f'"cache" tag got a non-integer timeout value: '
+                    f'{expire_time!r}')
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        stale_key = None
+        if self.version is not None:
+            stale_key = 'stale.' + key
+            key = make_template_fragment_key(
+                self.fragment_name, vary_on + [self.version.resolve(context)])
+        if not routers.caching_allowed():
+            # запрос читал с отставшей реплики: готовое берём, своё
+            # не сохраняем
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['value']
+            return self.nodelist.render(context)
+        return stampede.fetch(key, lambda: self.nodelist.render(context),
+                              expire_time, stale_key)
+
+
+@register.tag('cache')
+def do_cache(parser, token):
+    """{% cache %} с защитой от одновременного пересчёта.
+
+    Синтаксис как у встроенного тега, плюс необязательный version=:
+    {% cache ttl name var1 var2 version=cache_version %}. Пока новую
+    версию фрагмента рендерит один запрос, остальные получают
+    последнюю отрендеренную версию с теми же var1 var2.
+    """
+    nodelist = parser.parse(('endcache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' tag requires at least 2 arguments.")
+    version = None
+    if len(tokens) > 3 and tokens[-1].startswith('version='):
+        version = parser.compile_filter(tokens.pop()[len('version='):])
+    return FragmentCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]], version,
+    )
@@ -1,5 +1,14 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from . import routers
+from .cache import pages
+
+# разделы /status/ от других приложений: имя -> функция без аргументов
+sections = {}
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +24,12 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+@staff_member_required
+def status(request):
+    data = {'page_cache': pages.stats(), 'replica': routers.stats()}
+    if hasattr(cache, 'stats'):
+        data['cache'] = cache.stats()
+    data.update((name, stats()) for name, stats in sections.items())
+    return JsonResponse(data)
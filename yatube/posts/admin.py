@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Post, Comment
 from .models import Group, Follow
 
@@ -12,6 +13,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # поиск по индексу FTS5 вместо LIKE '%...%' по всей таблице
+        if not search.match_expression(search_term):
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        return search.filter_matching(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
@@ -3,3 +3,17 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_migrate
+        from PIL import Image
+
+        from core.views import sections
+        from . import signals  # noqa: F401
+        from . import search, thumbnails
+        sections['thumbnails'] = thumbnails.stats
+        post_migrate.connect(search.restore_triggers, sender=self)
+        # граница декодирования и для старых картинок, и для sorl:
+        # Pillow откажется распаковывать вдвое большую
+        Image.MAX_IMAGE_PIXELS = settings.POST_IMAGE_MAX_PIXELS
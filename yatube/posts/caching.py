@@ -0,0 +1,97 @@
+import hashlib
+
+from core.cache.generations import bump, generation
+
+from .models import Comment, Post
+
+INDEX = 'posts'
+# заголовки и ссылки групп есть на карточках любой ленты
+GROUPS = 'groups'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def followers_scope(author_id):
+    return f'followers:{author_id}'
+
+
+def index_version():
+    return generation(INDEX)
+
+
+def group_version(group):
+    return generation(group_scope(group.pk), GROUPS)
+
+
+def profile_version(author):
+    return generation(author_scope(author.pk), GROUPS)
+
+
+def invalidate_post(post):
+    scopes = {INDEX, author_scope(post.author_id), post_scope(post.pk)}
+    for group_id in (post.group_id, getattr(post, '_initial_group_id', None)):
+        if group_id is not None:
+            scopes.add(group_scope(group_id))
+    bump(*scopes)
+
+
+def invalidate_posts(posts, pages=False):
+    """invalidate_post для пачки новых постов; pages=True сбрасывает
+    и страницы самих постов, если они уже опубликованы."""
+    scopes = {INDEX}
+    for post in posts:
+        scopes.add(author_scope(post.author_id))
+        if pages:
+            scopes.add(post_scope(post.pk))
+        if post.group_id is not None:
+            scopes.add(group_scope(post.group_id))
+    bump(*scopes)
+
+
+def invalidate_author(user):
+    """Новое имя автора: ленты с его карточками, его профиль и посты,
+    страницы комментариев с его комментариями."""
+    scopes = {INDEX, author_scope(user.pk)}
+    scopes.update(map(group_scope, Post.objects.filter(author=user)
+                      .exclude(group=None).values_list('group_id',
+                                                       flat=True)
+                      .distinct()))
+    scopes.update(map(post_scope, Comment.objects.filter(author=user)
+                      .values_list('post_id', flat=True).distinct()))
+    bump(*scopes)
+
+
+def invalidate_group(group):
+    bump(INDEX, GROUPS, group_scope(group.pk))
+
+
+def invalidate_comment(comment):
+    bump(post_scope(comment.post_id))
+
+
+def invalidate_follow(follow):
+    # на профиле оба счётчика: подписчики автора и подписки читателя
+    bump(followers_scope(follow.author_id), followers_scope(follow.user_id))
+
+
+def card_key(post, show_posts):
+    """Ключ карточки: id, время изменения и то, что карточка берёт
+    у автора и группы, — поэтому правки инвалидируют её сами."""
+    related = '|'.join((
+        post.author.username,
+        post.author.get_full_name(),
+        post.group.slug if post.group_id else '',
+    ))
+    digest = hashlib.md5(related.encode()).hexdigest()[:12]
+    stamp = int(post.updated_at.timestamp() * 1000000)
+    return f'post_card:{post.pk}:{stamp}:{int(bool(show_posts))}:{digest}'
@@ -0,0 +1,141 @@
+"""Денормализованные счётчики: посты, подписчики и подписки
+пользователя (AuthorStats) и комментарии поста (Post.comments_count).
+
+Счётчики двигаются UPDATE ... SET n = n ± 1 из сигналов; save()
+моделей обёрнут в transaction.atomic(), поэтому строка и счётчик
+фиксируются вместе. Уменьшение не уходит ниже нуля: разошедшийся
+счётчик не должен валить удаление на CHECK (n >= 0). Post.save()
+счётчики поста не пишет. bulk_create и сырые вставки сигналов не шлют:
+импорт сдвигает счётчики сам (posts_added), остальное расхождение
+исправляет reconcile_counters.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from core import routers
+
+from .models import AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+USER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def _shift(queryset, field, delta):
+    return queryset.update(**{field: Greatest(F(field) + delta, Value(0))})
+
+
+def user_changed(user_id, field, delta):
+    if not _shift(AuthorStats.objects.filter(user_id=user_id),
+                  field, delta) and delta > 0:
+        # строки ещё нет: заводим её по живым счётчикам,
+        # в которые новая запись уже попала
+        refresh(user_id)
+
+
+def post_changed(post_id, delta):
+    _shift(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def changed(instance, delta):
+    """Сдвигает счётчики, которые зависят от instance."""
+    if isinstance(instance, Post):
+        user_changed(instance.author_id, 'posts_count', delta)
+    elif isinstance(instance, Comment):
+        post_changed(instance.post_id, delta)
+    elif isinstance(instance, Follow):
+        user_changed(instance.author_id, 'followers_count', delta)
+        user_changed(instance.user_id, 'following_count', delta)
+
+
+def posts_added(posts):
+    """Сдвигает счётчики постов авторов пачки, вставленной bulk_create."""
+    for author_id, added in Counter(post.author_id
+                                    for post in posts).items():
+        user_changed(author_id, 'posts_count', added)
+
+
+def _grouped(queryset, field, ids):
+    return dict(queryset.filter(**{f'{field}__in': ids}).order_by()
+                .values_list(field).annotate(n=Count('pk'))
+                .values_list(field, 'n'))
+
+
+def live_user_counts(user_ids):
+    """{user_id: (posts, followers, following)} по таблицам."""
+    posts = _grouped(Post.objects, 'author_id', user_ids)
+    followers = _grouped(Follow.objects, 'author_id', user_ids)
+    following = _grouped(Follow.objects, 'user_id', user_ids)
+    return {
+        user_id: (posts.get(user_id, 0), followers.get(user_id, 0),
+                  following.get(user_id, 0))
+        for user_id in user_ids
+    }
+
+
+def refresh(user_id):
+    # счётчики считаются по основной БД, реплика может отставать
+    routers.use_primary()
+    counts = dict(zip(USER_FIELDS, live_user_counts([user_id])[user_id]))
+    stats, _ = AuthorStats.objects.update_or_create(user_id=user_id,
+                                                    defaults=counts)
+    return stats
+
+
+def user_stats(user):
+    """Счётчики пользователя; заводятся при первом обращении."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return refresh(user.pk)
+
+
+def reconcile_users(chunk=1000):
+    """Сверяет AuthorStats с таблицами пачками по chunk
+    пользователей; возвращает число исправленных строк."""
+    fixed, last = 0, 0
+    while True:
+        ids = list(User.objects.filter(pk__gt=last).order_by('pk')
+                   .values_list('pk', flat=True)[:chunk])
+        if not ids:
+            return fixed
+        last = ids[-1]
+        live = live_user_counts(ids)
+        stored = AuthorStats.objects.in_bulk(ids)
+        created, changed = [], []
+        for user_id, counts in live.items():
+            stats = stored.get(user_id)
+            if stats is None:
+                created.append(AuthorStats(
+                    user_id=user_id, **dict(zip(USER_FIELDS, counts))))
+            elif tuple(getattr(stats, field)
+                       for field in USER_FIELDS) != counts:
+                for field, value in zip(USER_FIELDS, counts):
+                    setattr(stats, field, value)
+                changed.append(stats)
+        with transaction.atomic():
+            AuthorStats.objects.bulk_create(created, ignore_conflicts=True)
+            AuthorStats.objects.bulk_update(changed, USER_FIELDS)
+        fixed += len(created) + len(changed)
+
+
+def reconcile_posts(chunk=1000):
+    """Сверяет Post.comments_count с комментариями пачками по chunk
+    постов; возвращает число исправленных постов."""
+    fixed, last = 0, 0
+    while True:
+        rows = list(Post.objects.filter(pk__gt=last).order_by('pk')
+                    .values_list('pk', 'comments_count')[:chunk])
+        if not rows:
+            return fixed
+        last = rows[-1][0]
+        live = _grouped(Comment.objects, 'post_id',
+                        [pk for pk, _ in rows])
+        changed = [Post(pk=pk, comments_count=live.get(pk, 0))
+                   for pk, stored in rows if live.get(pk, 0) != stored]
+        Post.objects.bulk_update(changed, ['comments_count'])
+        fixed += len(changed)
@@ -0,0 +1,121 @@
+"""Выгрузка данных пользователя: его посты, комментарии и подписки.
+
+Всё — генераторы: строки читаются iterator() пачками по CHUNK_SIZE и
+сразу уходят клиенту, поэтому память не зависит от числа записей.
+Записи помечены полем type (post, comment, follow); import_posts берёт
+из выгрузки только посты, остальные записи пропускает.
+
+Архив с картинками собирается в памяти по кусочкам: ZipFile пишет в
+буфер без seek (с data descriptor после каждого файла), буфер
+опустошается после каждой записи, временных файлов нет. В памяти
+остаётся только центральный каталог архива — по строке на картинку.
+"""
+import csv
+import io
+import json
+import zipfile
+
+from .models import Comment, Follow, Post
+
+CHUNK_SIZE = 2000
+IMAGE_CHUNK = 64 * 1024
+FIELDS = ('type', 'id', 'author', 'post', 'group', 'pub_date', 'text',
+          'image')
+FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'zip': 'application/zip',
+}
+
+
+def records(user):
+    posts = (Post.objects.filter(author=user).order_by('pk')
+             .values_list('pk', 'group__slug', 'pub_date', 'text', 'image')
+             .iterator(chunk_size=CHUNK_SIZE))
+    for pk, group, pub_date, text, image in posts:
+        yield {'type': 'post', 'id': pk, 'author': user.username,
+               'group': group, 'pub_date': pub_date.isoformat(),
+               'text': text, 'image': image or None}
+    comments = (Comment.objects.filter(author=user).order_by('pk')
+                .values_list('pk', 'post_id', 'created', 'text')
+                .iterator(chunk_size=CHUNK_SIZE))
+    for pk, post_id, created, text in comments:
+        yield {'type': 'comment', 'id': pk, 'author': user.username,
+               'post': post_id, 'pub_date': created.isoformat(),
+               'text': text}
+    follows = (Follow.objects.filter(user=user).order_by('pk')
+               .values_list('pk', 'author__username')
+               .iterator(chunk_size=CHUNK_SIZE))
+    for pk, author in follows:
+        yield {'type': 'follow', 'id': pk, 'author': author}
+
+
+def jsonl_lines(user):
+    for record in records(user):
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def csv_lines(user):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS, lineterminator='\n')
+    writer.writeheader()
+    for record in records(user):
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def lines(user, fmt):
+    return csv_lines(user) if fmt == 'csv' else jsonl_lines(user)
+
+
+class _Pipe:
+    """Файл только для записи без seek и tell: ZipFile с ним пишет
+    архив потоком, а накопленные байты забираются через take()."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+def zip_chunks(user, fmt):
+    """Архив с данными в data.<fmt> и картинками постов в images/."""
+    return (chunk for chunk in _zip_parts(user, fmt) if chunk)
+
+
+def _zip_parts(user, fmt):
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(f'data.{fmt}', 'w', force_zip64=True) as data:
+            for line in lines(user, fmt):
+                data.write(line.encode())
+                yield pipe.take()
+        images = (Post.objects.filter(author=user).exclude(image='')
+                  .order_by('pk').values_list('image', flat=True)
+                  .iterator(chunk_size=CHUNK_SIZE))
+        storage = Post._meta.get_field('image').storage
+        for name in images:
+            try:
+                source = storage.open(name, 'rb')
+            except OSError:
+                continue
+            # картинки уже сжаты, deflate их только замедлит
+            info = zipfile.ZipInfo(f'images/{name}')
+            with source, archive.open(info, 'w') as target:
+                for chunk in iter(lambda: source.read(IMAGE_CHUNK), b''):
+                    target.write(chunk)
+                    yield pipe.take()
+    yield pipe.take()
@@ -0,0 +1,133 @@
+"""Кэш ленты подписок в CACHES['feeds'].
+
+Для каждого читателя хранятся id FEED_CACHE_LENGTH последних постов
+его ленты упакованным массивом array('q'). Массив лежит в памяти
+процесса, поэтому в ключ входит метка ленты из общего кэша: любая
+запись в ленту читателя (новый пост, подписка, отписка, удаление)
+ставит новую метку, и остальные процессы перечитывают массив одним
+запросом по индексу ленты, а старый ждёт вытеснения или
+FEED_CACHE_TTL. Процесс, сделавший запись, дописывает новый пост в свой
+массив сам. Страница собирается одним id__in.
+"""
+import time
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from .models import Post, TimelineEntry
+from .paginator import TimelinePaginator
+
+
+def _stamp_key(user_id):
+    return f'feed_stamp:{user_id}'
+
+
+def _key(user_id, stamp):
+    return f'feed:{user_id}:{stamp}'
+
+
+def _read_timeline(user_id):
+    ids = (TimelineEntry.objects.filter(user_id=user_id)
+           .order_by('-pub_date', '-post_id')
+           .values_list('post_id', flat=True)[:settings.FEED_CACHE_LENGTH])
+    return array('q', ids)
+
+
+def _touch(user_ids):
+    """Новая метка лент читателей; возвращает её."""
+    stamp = time.time_ns()
+    cache.set_many({_stamp_key(user_id): stamp for user_id in user_ids},
+                   None)
+    return stamp
+
+
+def feed_ids(user):
+    stamp = cache.get(_stamp_key(user.pk))
+    if stamp is None:
+        stamp = _touch([user.pk])
+    feeds = caches['feeds']
+    ids = feeds.get(_key(user.pk, stamp))
+    if ids is None:
+        ids = _read_timeline(user.pk)
+        feeds.set(_key(user.pk, stamp), ids, settings.FEED_CACHE_TTL)
+    return ids
+
+
+def push(post, user_ids):
+    """Отмечает новый пост в лентах читателей; закэшированные в этом
+    процессе массивы дописываются без запроса."""
+    stamps = cache.get_many([_stamp_key(user_id) for user_id in user_ids])
+    stamp = _touch(user_ids)
+    old = {_key(user_id, stamps[_stamp_key(user_id)]): user_id
+           for user_id in user_ids if _stamp_key(user_id) in stamps}
+    feeds = caches['feeds']
+    for key, ids in feeds.get_many(old).items():
+        ids.insert(0, post.pk)
+        del ids[settings.FEED_CACHE_LENGTH:]
+        feeds.set(_key(old[key], stamp), ids, settings.FEED_CACHE_TTL)
+        feeds.delete(key)
+
+
+def invalidate(user_ids):
+    """Ленты читателей перечитываются при следующем обращении во всех
+    процессах."""
+    _touch(user_ids)
+
+
+class CachedTimelinePaginator(TimelinePaginator):
+    """Страницы в пределах закэшированного окна собираются по массиву
+    id одним запросом, за его пределами — обычным seek по ленте. Если
+    в массиве попался удалённый пост, страница тоже читается seek'ом:
+    иначе она вышла бы короче per_page."""
+
+    def __init__(self, object_list, per_page, ids, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.ids = ids
+
+    @property
+    def _complete(self):
+        return len(self.ids) < settings.FEED_CACHE_LENGTH
+
+    def _hydrate(self, ids):
+        """Посты по id или None, если какой-то уже удалён."""
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        if len(posts) < len(ids):
+            return None
+        return [posts[pk] for pk in ids]
+
+    def _fetch(self, pub_date=None, pk=None, backward=False, limit=None):
+        rows = self._fetch_cached(pub_date, pk, backward,
+                                  limit or self.per_page + 1)
+        if rows is None:
+            return super()._fetch(pub_date, pk, backward, limit)
+        return rows
+
+    def _fetch_cached(self, pub_date, pk, backward, limit):
+        """Строки по массиву id или None, если массива не хватает."""
+        if pub_date is None:
+            if backward and not self._complete:
+                return None
+            start = 0
+        else:
+            try:
+                start = self.ids.index(pk) + 1
+            except ValueError:
+                return None
+        if backward:
+            end = start - 1 if pub_date is not None else len(self.ids)
+            return self._hydrate(self.ids[max(end - limit, 0):end][::-1])
+        chunk = self.ids[start:start + limit]
+        if len(chunk) < limit and not self._complete:
+            return None
+        return self._hydrate(chunk)
+
+    def _offset(self, number):
+        bottom = (number - 1) * self.per_page
+        chunk = self.ids[bottom:bottom + self.per_page + 1]
+        rows = None
+        if len(chunk) > self.per_page or self._complete:
+            rows = self._hydrate(chunk)
+        if rows is None:
+            return super()._offset(number)
+        return rows
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Post, Comment
 
 
@@ -11,6 +13,13 @@ class PostForm(forms.ModelForm):
                       'group': 'Группа, к которой относится пост',
                       'image': 'Выберете картинку'}
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # при правке без новой картинки здесь уже сохранённый файл
+        if isinstance(image, UploadedFile):
+            return images.normalize(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,93 @@
+"""Приведение загруженных картинок постов к разумному виду.
+
+До декодирования по заголовку проверяется число пикселей
+(POST_IMAGE_MAX_PIXELS), так что «бомба» из крошечного PNG на сотни
+мегапикселей не доходит до распаковки. Картинка больше
+POST_IMAGE_MAX_SIDE уменьшается; JPEG при этом декодируется в режиме
+draft — сразу в 2, 4 или 8 раз меньше, без полного оригинала в памяти.
+Поворот из EXIF применяется к пикселям, а сами EXIF и XMP (модель
+телефона, координаты) отбрасываются; цветовой профиль остаётся.
+
+Картинка, которую менять не нужно, сохраняется байт в байт. Результат
+пишется во временный файл, а не в память: большие загрузки Django и так
+держит на диске (FILE_UPLOAD_MAX_MEMORY_SIZE).
+"""
+import math
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+
+# форматы, которые пересохраняются как есть; остальные — в PNG
+FORMATS = ('JPEG', 'PNG', 'WEBP')
+METADATA = ('exif', 'xmp', 'XML:com.adobe.xmp', 'photoshop', 'comment')
+
+
+def open_upload(upload):
+    if hasattr(upload, 'temporary_file_path'):
+        return Image.open(upload.temporary_file_path())
+    upload.seek(0)
+    return Image.open(upload)
+
+
+def check_size(image):
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            f'Картинка {width}×{height} слишком большая: можно не больше '
+            f'{settings.POST_IMAGE_MAX_PIXELS / 1e6:g} мегапикселей.',
+            code='too_many_pixels')
+
+
+def needs_changes(image):
+    return (max(image.size) > settings.POST_IMAGE_MAX_SIDE
+            or any(key in image.info for key in METADATA))
+
+
+def save_params(image, fmt):
+    params = {}
+    if image.info.get('icc_profile'):
+        params['icc_profile'] = image.info['icc_profile']
+    if fmt in ('JPEG', 'WEBP'):
+        params['quality'] = settings.POST_IMAGE_QUALITY
+    if fmt == 'JPEG':
+        params['optimize'] = True
+    return params
+
+
+def normalize(upload):
+    """Проверенная и приведённая картинка вместо upload.
+
+    Возвращает upload без изменений, если менять нечего, иначе новый
+    UploadedFile во временном файле. Слишком большая картинка —
+    ValidationError.
+    """
+    with open_upload(upload) as source:
+        check_size(source)
+        if not needs_changes(source):
+            upload.seek(0)
+            return upload
+        fmt = source.format if source.format in FORMATS else 'PNG'
+        max_side = settings.POST_IMAGE_MAX_SIDE
+        scale = min(1, max_side / max(source.size))
+        if scale < 1:
+            source.draft(source.mode, (math.ceil(source.width * scale),
+                                       math.ceil(source.height * scale)))
+        params = save_params(source, fmt)
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        name = upload.name
+        if fmt != source.format:
+            name = f'{os.path.splitext(name)[0]}.png'
+    # безымянный временный файл: хранилище скопирует его по кускам
+    # и не станет переносить, а удалится он сам при закрытии
+    result = UploadedFile(tempfile.TemporaryFile(), name, Image.MIME[fmt])
+    image.save(result.file, fmt, **params)
+    result.size = result.file.tell()
+    result.seek(0)
+    return result
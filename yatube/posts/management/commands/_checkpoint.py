@@ -0,0 +1,16 @@
+import os
+
+
+def save_checkpoint(path, done):
+    # через временный файл, чтобы обрыв не оставил половину числа
+    with open(f'{path}.tmp', 'w') as checkpoint:
+        checkpoint.write(str(done))
+    os.replace(f'{path}.tmp', path)
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return int(checkpoint.read())
+    except (OSError, ValueError):
+        return 0
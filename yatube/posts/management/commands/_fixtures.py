@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+
+from posts.models import Post
+
+User = get_user_model()
+
+
+def fill_posts(count, author=None, group=None, batch=10000, text='Пост',
+               texts=None):
+    """Быстро вставляет count постов сырыми INSERT-ами.
+
+    Даты идут с шагом в секунду в прошлое, так что лента упорядочена.
+    Тексты — «{text} {i}» или очередные из итератора texts.
+    """
+    if author is None:
+        author, _ = User.objects.get_or_create(username='bench')
+    table = Post._meta.db_table
+    now = timezone.now()
+    sql = (f'INSERT INTO {table} (text, pub_date, updated_at, author_id,'
+           f' group_id, image, comments_count)'
+           f' VALUES (%s, %s, %s, %s, %s, %s, 0)')
+    group_id = group.pk if group else None
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, count, batch):
+            rows = [
+                (next(texts) if texts else f'{text} {i}',
+                 now - timedelta(seconds=i), now, author.pk,
+                 group_id, '')
+                for i in range(start, min(start + batch, count))
+            ]
+            cursor.executemany(sql, rows)
+    return author
+
+
+def synthetic_photo(rng, size=(1600, 1066)):
+    """Картинка, похожая на фото: плавные переходы цвета, мелкие детали
+    и шум матрицы. Случайный шум без структуры сжимался бы нечестно."""
+    x, y = rng.uniform(-2, 0), rng.uniform(-1.2, 0.2)
+    scale = rng.uniform(0.3, 1.5)
+    # фрактал считается не крупнее 1600 по ширине, дальше растягивается
+    small = (min(size[0], 1600), min(size[1], size[1] * 1600 // size[0]))
+    detail = Image.effect_mandelbrot(small, (x, y, x + scale, y + scale),
+                                     rng.randint(30, 100))
+    detail = detail.resize(size, Image.BICUBIC)
+    colors = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(3)]
+    image = ImageOps.colorize(detail, *colors)
+    grain = Image.effect_noise(size, rng.uniform(5, 20)).convert('RGB')
+    image = Image.blend(image, grain, 0.08)
+    return image.filter(ImageFilter.GaussianBlur(rng.uniform(0.5, 2)))
@@ -0,0 +1,77 @@
+import os
+import random
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core import processes
+from core.cache.sqlite import SQLiteCache
+
+FRAGMENT = 'x' * 2048
+
+
+def make_cache(backend, path, keys):
+    if backend == 'locmem':
+        return LocMemCache('bench', {'OPTIONS': {'MAX_ENTRIES': keys}})
+    return SQLiteCache(path, {})
+
+
+def work(args):
+    """Один воркер: чтение фрагментов, промах — рендер и запись,
+    каждый двадцатый запрос — incr счётчика поколения."""
+    backend, path, keys, ops, seed = args
+    cache = make_cache(backend, path, keys)
+    cache.add('generation', 0)
+    rnd = random.Random(seed)
+    hits = 0
+    start = time.perf_counter()
+    for op in range(ops):
+        # популярные фрагменты запрашиваются чаще
+        key = f'fragment:{int(keys * rnd.random() ** 2)}'
+        if cache.get(key) is None:
+            cache.set(key, FRAGMENT, 300)
+        else:
+            hits += 1
+        if not op % 20:
+            cache.incr('generation')
+    elapsed = time.perf_counter() - start
+    entries = (len(cache._cache) if backend == 'locmem'
+               else cache.stats()['entries'])
+    return hits, elapsed, entries
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает LocMemCache и общий SQLiteCache под нагрузкой '
+            'из нескольких процессов: запросы в секунду, доля попаданий '
+            'и число копий фрагментов в памяти.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--ops', type=int, default=20000)
+        parser.add_argument('--keys', type=int, default=500)
+
+    def run(self, backend, path, options):
+        jobs = [(backend, path, options['keys'], options['ops'], seed)
+                for seed in range(options['workers'])]
+        with processes.pool(options['workers']) as pool:
+            results = pool.map(work, jobs)
+        total = options['ops'] * options['workers']
+        hits = sum(result[0] for result in results)
+        elapsed = max(result[1] for result in results)
+        if backend == 'locmem':
+            entries = sum(result[2] for result in results)
+        else:
+            entries = results[-1][2]
+        self.stdout.write(
+            f'{backend:<8} {total / elapsed:>10.0f} оп/с   '
+            f'попаданий {hits / total:>6.1%}   '
+            f'фрагментов в памяти {entries}'
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.cache.sqlite3')
+            for backend in ('locmem', 'sqlite'):
+                self.run(backend, path, options)
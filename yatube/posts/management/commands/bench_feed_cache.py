@@ -0,0 +1,39 @@
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from core.benchmark import scratch_database
+from posts.models import Post
+from ._fixtures import fill_posts
+
+
+class Command(BaseCommand):
+    help = ('Измеряет память на одного пользователя в кэше ленты '
+            'и сравнивает с pickle-списком постов в LocMemCache.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        length = settings.FEED_CACHE_LENGTH
+        feeds = caches['feeds']
+        feeds.clear()
+        with scratch_database():
+            fill_posts(length)
+            posts = list(Post.objects.select_related('author', 'group')
+                         .order_by('-pub_date', '-id'))
+            ids = [post.pk for post in posts]
+            for user_id in range(options['users']):
+                feeds.set(f'feed:{user_id}', ids, None)
+            pickled = len(pickle.dumps(posts, pickle.HIGHEST_PROTOCOL))
+        stats = feeds.stats()
+        feeds.clear()
+        self.stdout.write(
+            f'Пользователей в кэше: {stats["entries"]}, '
+            f'постов в ленте: {length}\n'
+            f'Массив id:          {stats["bytes_per_entry"]:>8} байт '
+            f'на пользователя, всего {stats["bytes"]} байт\n'
+            f'pickle моделей:     {pickled:>8} байт на пользователя'
+        )
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template import Template, Context
+from django.template.loader import render_to_string
+
+from core.benchmark import best_of, scratch_database
+from posts.models import Post
+from posts.paginator import KeysetPaginator, FORWARD, encode_cursor
+from ._fixtures import fill_posts
+
+LEGACY_TEMPLATE = Template(
+    '{% for i in page_obj.paginator.page_range %}'
+    '<li><a href="?page={{ i }}">{{ i }}</a></li>'
+    '{% endfor %}'
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает OFFSET-пагинатор с COUNT(*) и полным списком '
+            'страниц с курсорным пагинатором с окном номеров.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Размеры таблицы постов через запятую')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f'{"posts":>8} | {"legacy query":>12} '
+                          f'{"legacy render":>13} | {"keyset query":>12} '
+                          f'{"keyset render":>13}  (ms, середина ленты)')
+        with scratch_database():
+            filled = 0
+            for size in sizes:
+                fill_posts(size - filled)
+                filled = size
+                self.stdout.write(self.measure(size))
+
+    def measure(self, size):
+        per_page = settings.CNT_POST
+        middle = max(size // per_page // 2, 2)
+        queryset = Post.objects.all()
+
+        def legacy_query():
+            paginator = Paginator(queryset.order_by('-pub_date', '-id'),
+                                  per_page)
+            page = paginator.get_page(middle)
+            list(page)
+            return page
+
+        legacy_page = legacy_query()
+        legacy_render = best_of(lambda: LEGACY_TEMPLATE.render(
+            Context({'page_obj': legacy_page})))
+
+        anchor = queryset.order_by('-pub_date', '-id')[
+            (middle - 1) * per_page - 1]
+        cursor = encode_cursor(anchor, middle, FORWARD)
+        cache.clear()
+
+        def keyset_query():
+            return KeysetPaginator(queryset, per_page).get_cursor_page(cursor)
+
+        keyset_page = keyset_query()
+        keyset_render = best_of(lambda: render_to_string(
+            'posts/includes/paginator.html', {'page_obj': keyset_page}))
+        return (f'{size:>8} | {best_of(legacy_query):>12.2f} '
+                f'{legacy_render:>13.2f} | {best_of(keyset_query):>12.2f} '
+                f'{keyset_render:>13.2f}')
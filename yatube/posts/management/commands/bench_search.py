@@ -0,0 +1,66 @@
+import random
+import time
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand
+
+from core.benchmark import best_of, scratch_database
+from posts import search
+from posts.models import Post
+from ._fixtures import fill_posts
+
+SYLLABLES = ('ка', 'ро', 'ми', 'ле', 'то', 'на', 'ве', 'да', 'су', 'пи',
+             'зо', 'гу', 'бе', 'ры', 'шо', 'ля')
+ENDINGS = ('', 'а', 'ы', 'ом', 'ами', 'ов', 'е', 'у')
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES)
+                          for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def texts(words, rng, length=20):
+    # распределение Ципфа: немного частых слов и длинный хвост редких
+    weights = list(accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    while True:
+        yield ' '.join(word + rng.choice(ENDINGS) for word in
+                       rng.choices(words, cum_weights=weights, k=length))
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск LIKE \'%слово%\' с поиском по FTS5 '
+            '(первая страница и число найденных).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--words', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        words = vocabulary(options['words'], rng)
+        queries = {'частое': words[0], 'среднее': words[100],
+                   'редкое': words[-1]}
+        with scratch_database():
+            start = time.perf_counter()
+            fill_posts(options['posts'], texts=texts(words, rng))
+            self.stdout.write(
+                f'{options["posts"]} постов вставлено с индексацией за '
+                f'{time.perf_counter() - start:.1f} с')
+            self.stdout.write(f'{"слово":<10} {"найдено":>8} | '
+                              f'{"LIKE":>9} {"FTS5":>9}  (мс, страница '
+                              f'+ число)')
+            for label, word in queries.items():
+                self.stdout.write(self.measure(label, word))
+
+    def measure(self, label, word):
+        like = Post.objects.filter(text__contains=word)
+        fts = search.search(word)
+
+        def run(queryset):
+            return lambda: (list(queryset[:10]), queryset.count())
+
+        return (f'{label:<10} {fts.count():>8} | {best_of(run(like), 3):>9.1f}'
+                f' {best_of(run(fts), 3):>9.1f}')
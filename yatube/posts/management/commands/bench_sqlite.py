@@ -0,0 +1,95 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from core import processes
+from posts.models import Post
+from ._fixtures import fill_posts
+
+PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+
+
+def work(args):
+    """Один воркер: читатель открывает первую страницу ленты, писатель
+    создаёт посты. Без постоянных соединений соединение закрывается
+    после каждой операции, как в конце запроса при CONN_MAX_AGE=0."""
+    mode, writer, seconds, author_id, path = args
+    connections.close_all()
+    # процесс, запущенный через spawn, не видит подмены базы в родителе
+    connection.settings_dict['NAME'] = path
+    pragmas = PRODUCTION_PRAGMAS if mode == 'production' else {}
+    done = locked = 0
+    with override_settings(SQLITE_PRAGMAS=pragmas):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            try:
+                if writer:
+                    Post.objects.create(author_id=author_id, text='Пост')
+                else:
+                    list(Post.objects.select_related('author', 'group')
+                         .order_by('-pub_date', '-id')[:settings.CNT_POST])
+                done += 1
+            except OperationalError:
+                locked += 1
+            if mode != 'production':
+                connection.close()
+    connections.close_all()
+    return writer, done, locked
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает SQLite по умолчанию и боевой режим (WAL, прагмы, '
+            'постоянные соединения) на смеси чтения и записи из '
+            'нескольких процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=3)
+        parser.add_argument('--posts', type=int, default=10000)
+
+    def run(self, mode, options):
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as tmp:
+            connections.close_all()
+            path = os.path.join(tmp, 'bench.db')
+            connection.settings_dict['NAME'] = path
+            try:
+                call_command('migrate', verbosity=0)
+                author = fill_posts(options['posts'])
+                connections.close_all()
+                jobs = ([(mode, True, options['seconds'], author.pk, path)]
+                        * options['writers']
+                        + [(mode, False, options['seconds'], author.pk,
+                            path)] * options['readers'])
+                with processes.pool(len(jobs)) as pool:
+                    results = pool.map(work, jobs)
+            finally:
+                connections.close_all()
+                connection.settings_dict['NAME'] = old_name
+        seconds = options['seconds']
+        reads = sum(done for writer, done, _ in results if not writer)
+        writes = sum(done for writer, done, _ in results if writer)
+        locked = sum(result[2] for result in results)
+        self.stdout.write(
+            f'{mode:<10} чтений {reads / seconds:>8.0f}/с   '
+            f'записей {writes / seconds:>6.0f}/с   '
+            f'ошибок «database is locked» {locked}'
+        )
+
+    def handle(self, *args, **options):
+        for mode in ('default', 'production'):
+            self.run(mode, options)
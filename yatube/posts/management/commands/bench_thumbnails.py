@@ -0,0 +1,102 @@
+import os
+import random
+import tempfile
+from collections import defaultdict
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts import thumbnails
+from posts.models import Post
+from ._fixtures import synthetic_photo
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает размер в байтах нынешней миниатюры карточки '
+            '(JPEG CARD) с вариантами SIZES по ширинам и форматам. '
+            'Картинки — из путей, из постов или синтетические.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='Файлы или каталоги с картинками.')
+        parser.add_argument('--limit', type=int, default=200,
+                            help='Сколько картинок постов взять без путей.')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Сколько синтетических картинок сделать '
+                                 'вместо картинок постов.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            sources = self.sources(options, tmp)
+            totals = defaultdict(int)
+            count = 0
+            for source in sources:
+                try:
+                    encoded = thumbnails.backend.encode(source,
+                                                        thumbnails.SIZES)
+                except Exception as error:
+                    self.stderr.write(f'{source.name}: {error}')
+                    continue
+                for size, data in zip(thumbnails.SIZES, encoded):
+                    totals[self.label(size)] += len(data)
+                count += 1
+        if not count:
+            raise CommandError('Нет картинок для сравнения.')
+        self.report(totals, count)
+
+    def sources(self, options, tmp):
+        if options['paths']:
+            storage = FileSystemStorage(location='/')
+            for path in self.files(options['paths']):
+                yield ImageFile(os.path.abspath(path).lstrip('/'), storage)
+            return
+        if not options['synthetic']:
+            storage = Post._meta.get_field('image').storage
+            names = (Post.objects.exclude(image='').order_by('-pk')
+                     .values_list('image', flat=True)[:options['limit']])
+            if names:
+                for name in names:
+                    yield ImageFile(name, storage)
+                return
+            self.stdout.write('У постов нет картинок, берём синтетические')
+        storage = FileSystemStorage(location=tmp)
+        rng = random.Random(1)
+        for number in range(options['synthetic'] or options['limit']):
+            name = f'{number}.jpg'
+            synthetic_photo(rng).save(storage.path(name), quality=92)
+            yield ImageFile(name, storage)
+
+    def files(self, paths):
+        for path in paths:
+            if not os.path.isdir(path):
+                yield path
+                continue
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+
+    def label(self, size):
+        geometry, options = size
+        fmt = options.get('format', sorl_settings.THUMBNAIL_FORMAT)
+        return fmt, int(geometry.split('x')[0])
+
+    def report(self, totals, count):
+        current = totals[self.label(thumbnails.CARD)]
+        self.stdout.write(f'{count} картинок, средний размер миниатюры, КБ '
+                          f'(% от нынешней {thumbnails.CARD[0]} '
+                          f'{sorl_settings.THUMBNAIL_FORMAT})')
+        formats = sorted({fmt for fmt, _ in totals},
+                         key=lambda fmt: fmt != sorl_settings.THUMBNAIL_FORMAT)
+        self.stdout.write(f'{"":<6}' + ''.join(
+            f'{width:>16}w' for width in thumbnails.WIDTHS))
+        for fmt in formats:
+            cells = ''.join(
+                f'{totals[fmt, width] / count / 1024:>9.1f} '
+                f'({totals[fmt, width] / current:>5.0%})'
+                for width in thumbnails.WIDTHS)
+            self.stdout.write(f'{fmt:<6}{cells}')
@@ -0,0 +1,99 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+from sorl.thumbnail.images import ImageFile
+
+from posts import images, thumbnails
+from ._fixtures import synthetic_photo
+from .bench_thumbnails import IMAGE_EXTENSIONS
+
+# поворот и типичный для телефона набор тегов: модель, время, GPS
+PHONE_EXIF = {0x0112: 6, 0x010F: 'Phone', 0x0110: 'Phone 12 Pro',
+              0x0132: '2026:10:18 12:00:00', 0x8825: {2: (55.0, 45.0, 0.0)}}
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает оригиналы картинок с приведёнными при загрузке: '
+            'размер файлов, время приведения и время миниатюр SIZES '
+            'из оригинала и из приведённой картинки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='Файлы или каталоги с картинками; без них '
+                                 'берутся синтетические «фото с телефона».')
+        parser.add_argument('--count', type=int, default=10)
+        parser.add_argument('--size', default='6000x4000',
+                            help='Размер синтетических картинок.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            originals = os.path.join(tmp, 'originals')
+            normalized = os.path.join(tmp, 'normalized')
+            os.mkdir(originals)
+            os.mkdir(normalized)
+            names = self.prepare(options, originals)
+            if not names:
+                raise CommandError('Нет картинок для сравнения.')
+            sizes = {'было': 0, 'стало': 0}
+            seconds = {'приведение': 0, 'было': 0, 'стало': 0}
+            for name in names:
+                path = os.path.join(originals, name)
+                start = time.perf_counter()
+                with open(path, 'rb') as original:
+                    result = images.normalize(UploadedFile(original, name))
+                    with open(os.path.join(normalized, name), 'wb') as out:
+                        shutil.copyfileobj(result, out)
+                seconds['приведение'] += time.perf_counter() - start
+                sizes['было'] += os.path.getsize(path)
+                sizes['стало'] += os.path.getsize(
+                    os.path.join(normalized, name))
+                for label, location in (('было', originals),
+                                        ('стало', normalized)):
+                    source = ImageFile(name, FileSystemStorage(location))
+                    start = time.perf_counter()
+                    thumbnails.backend.encode(source, thumbnails.SIZES)
+                    seconds[label] += time.perf_counter() - start
+        count = len(names)
+        self.stdout.write(
+            f'{count} картинок: оригиналы {sizes["было"] / count / 2**20:.2f}'
+            f' МБ, после приведения {sizes["стало"] / count / 2**20:.2f} МБ'
+            f' ({sizes["стало"] / sizes["было"]:.0%})')
+        self.stdout.write(
+            f'приведение {seconds["приведение"] / count * 1000:.0f} мс, '
+            f'миниатюры из оригинала {seconds["было"] / count * 1000:.0f} '
+            f'мс, из приведённой {seconds["стало"] / count * 1000:.0f} мс '
+            f'на картинку')
+
+    def prepare(self, options, directory):
+        """Копирует картинки из путей или делает синтетические."""
+        names = []
+        for path in options['paths']:
+            found = [path]
+            if os.path.isdir(path):
+                found = sorted(
+                    os.path.join(root, name)
+                    for root, _, files in os.walk(path) for name in files
+                    if name.lower().endswith(IMAGE_EXTENSIONS))
+            for number, source in enumerate(found, len(names)):
+                name = f'{number}{os.path.splitext(source)[1].lower()}'
+                shutil.copy(source, os.path.join(directory, name))
+                names.append(name)
+        if options['paths']:
+            return names
+        width, height = map(int, options['size'].split('x'))
+        rng = random.Random(1)
+        exif = Image.Exif()
+        exif.update(PHONE_EXIF)
+        for number in range(options['count']):
+            name = f'{number}.jpg'
+            synthetic_photo(rng, (width, height)).save(
+                os.path.join(directory, name), quality=92, exif=exif)
+            names.append(name)
+        return names
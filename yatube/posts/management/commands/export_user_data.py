@@ -0,0 +1,42 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты, комментарии и подписки пользователя в JSONL '
+            'или CSV; с --images — zip-архив вместе с картинками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=export.FORMATS,
+                            default='jsonl')
+        parser.add_argument('--images', action='store_true')
+        parser.add_argument('--output', '-o',
+                            help='Файл; по умолчанию stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {options["username"]}')
+        if options['images']:
+            chunks = export.zip_chunks(user, options['format'])
+        else:
+            chunks = (line.encode()
+                      for line in export.lines(user, options['format']))
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                self.write(output, chunks)
+        else:
+            self.write(sys.stdout.buffer, chunks)
+
+    def write(self, output, chunks):
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
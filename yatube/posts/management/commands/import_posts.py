@@ -0,0 +1,215 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import caching, counters, thumbnails, timeline
+from posts.models import Group, Post
+from ._checkpoint import load_checkpoint, save_checkpoint
+
+User = get_user_model()
+
+FORMATS = ('jsonl', 'csv')
+
+
+class BadRecord(ValueError):
+    pass
+
+
+def read_records(stream, fmt, skip=0):
+    """Записи входа по одной, начиная с skip: в памяти только
+    текущая строка. Пустая строка JSONL — запись None."""
+    if fmt == 'csv':
+        yield from islice(csv.DictReader(stream), skip, None)
+        return
+    for line in islice(stream, skip, None):
+        if not line.strip():
+            yield None
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield BadRecord(f'некорректный JSON: {error}')
+
+
+def value(record, field):
+    return str(record.get(field) or '').strip()
+
+
+class Command(BaseCommand):
+    help = ('Импортирует посты из JSONL или CSV (файл или «-» для stdin) '
+            'пачками через bulk_create. Поля записи: author, text, '
+            'group, pub_date, image; записи с type не «post» '
+            'пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл или «-» для stdin.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='По умолчанию — по расширению файла.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--images',
+                            help='Каталог с картинками из поля image.')
+        parser.add_argument('--create-authors', action='store_true',
+                            help='Заводить неизвестных авторов без пароля.')
+        parser.add_argument('--checkpoint',
+                            help='Файл с числом обработанных записей; по '
+                                 'умолчанию <path>.checkpoint.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv')
+                                    else 'jsonl')
+        checkpoint = options['checkpoint']
+        if checkpoint is None and path != '-':
+            checkpoint = f'{path}.checkpoint'
+        self.images = options['images']
+        self.create_authors = options['create_authors']
+        self.image_field = Post._meta.get_field('image')
+        done = load_checkpoint(checkpoint) if checkpoint else 0
+        if done:
+            self.stdout.write(f'Продолжаем с записи {done + 1}')
+        self.imported = self.skipped = 0
+        start = time.perf_counter()
+        with self.open(path) as stream:
+            records = read_records(stream, fmt, done)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(enumerate(batch, done + 1))
+                done += len(batch)
+                if checkpoint:
+                    save_checkpoint(checkpoint, done)
+                rate = self.imported / (time.perf_counter() - start)
+                self.stdout.write(
+                    f'Обработано {done}: импортировано {self.imported}, '
+                    f'пропущено {self.skipped} ({rate:.0f} постов/с)')
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    @contextmanager
+    def open(self, path):
+        if path == '-':
+            yield io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8',
+                                   newline='')
+            return
+        try:
+            stream = open(path, encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with stream:
+            yield stream
+
+    def import_batch(self, batch):
+        batch = [(number, record) for number, record in batch
+                 if record is not None]
+        valid = [record for _, record in batch if isinstance(record, dict)]
+        authors = self.resolve_authors(
+            {value(record, 'author') for record in valid} - {''})
+        groups = dict(Group.objects.filter(
+            slug__in={value(record, 'group') for record in valid} - {''}
+        ).values_list('slug', 'pk'))
+        posts = []
+        for number, record in batch:
+            try:
+                posts.append(self.build(record, authors, groups))
+            except BadRecord as error:
+                self.skipped += 1
+                self.stderr.write(f'Запись {number}: {error}')
+        if not posts:
+            return
+        dated = [(post, post.pub_date) for post in posts if post.pub_date]
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+            if posts[0].pk is None:
+                # SQLite не возвращает id из bulk_create, но в транзакции
+                # AUTOINCREMENT выдаёт пачке подряд идущие id
+                last = Post.objects.order_by('-pk').values_list(
+                    'pk', flat=True).first()
+                for pk, post in enumerate(posts, last - len(posts) + 1):
+                    post.pk = pk
+            if dated:
+                # auto_now_add в pre_save затёр даты из записей временем
+                # импорта: возвращаем их отдельным UPDATE
+                for post, pub_date in dated:
+                    post.pub_date = pub_date
+                Post.objects.bulk_update([post for post, _ in dated],
+                                         ['pub_date'])
+            counters.posts_added(posts)
+            timeline.fan_out_many(posts)
+            caching.invalidate_posts(posts)
+            thumbnails.enqueue(posts)
+        self.imported += len(posts)
+
+    def resolve_authors(self, usernames):
+        authors = dict(User.objects.filter(username__in=usernames)
+                       .values_list('username', 'pk'))
+        missing = usernames - authors.keys()
+        if missing and self.create_authors:
+            User.objects.bulk_create(
+                [User(username=username, password=make_password(None))
+                 for username in missing],
+                ignore_conflicts=True)
+            authors.update(User.objects.filter(username__in=missing)
+                           .values_list('username', 'pk'))
+        return authors
+
+    def build(self, record, authors, groups):
+        if isinstance(record, BadRecord):
+            raise record
+        if not isinstance(record, dict):
+            raise BadRecord('запись должна быть объектом')
+        kind = value(record, 'type')
+        if kind and kind != 'post':
+            raise BadRecord(f'запись типа {kind!r} — не пост')
+        text = record.get('text')
+        if not isinstance(text, str) or not text.strip():
+            raise BadRecord('пустой текст')
+        author = value(record, 'author')
+        if author not in authors:
+            raise BadRecord(f'неизвестный автор {author!r}')
+        group = value(record, 'group')
+        if group and group not in groups:
+            raise BadRecord(f'неизвестная группа {group!r}')
+        pub_date = None
+        if value(record, 'pub_date'):
+            pub_date = parse_datetime(value(record, 'pub_date'))
+            if pub_date is None:
+                raise BadRecord(
+                    f'некорректная дата {value(record, "pub_date")!r}')
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+        return Post(text=text, author_id=authors[author],
+                    group_id=groups.get(group), pub_date=pub_date,
+                    image=self.attach(value(record, 'image')))
+
+    def attach(self, name):
+        """Копирует картинку в хранилище, возвращает её имя."""
+        if not name:
+            return ''
+        if not self.images:
+            raise BadRecord('картинка без --images')
+        root = os.path.realpath(self.images)
+        source = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, source]) != root:
+            raise BadRecord(f'картинка вне каталога: {name!r}')
+        try:
+            with open(source, 'rb') as image:
+                return self.image_field.storage.save(
+                    self.image_field.generate_filename(
+                        None, os.path.basename(source)),
+                    File(image))
+        except OSError as error:
+            raise BadRecord(f'картинка {name!r}: {error.strerror}')
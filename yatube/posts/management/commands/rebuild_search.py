@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.search import FTS_TABLE, REBUILD_CHUNK, rebuild_index
+
+# страниц индекса на один шаг слияния сегментов
+MERGE_PAGES = 500
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает поисковый индекс FTS5 в теневой таблице пачками '
+            'по --chunk id и подменяет им рабочий. Поиск до подмены видит '
+            'старый индекс, запись постов ждёт не дольше одной пачки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=REBUILD_CHUNK)
+
+    def handle(self, *args, **options):
+        rebuild_index(connection, options['chunk'], self.report)
+        # сегменты пачек сливаются тоже по шагам, а не одним optimize
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                before = connection.connection.total_changes
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) "
+                               f"VALUES ('merge', %s)", [MERGE_PAGES])
+                if connection.connection.total_changes - before < 2:
+                    break
+        self.stdout.write('Индекс пересобран')
+
+    def report(self, done, top):
+        self.stdout.write(f'Проиндексировано до id {min(done, top)} '
+                          f'из {top}')
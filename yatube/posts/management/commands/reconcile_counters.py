@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = ('Сверяет денормализованные счётчики с таблицами и исправляет '
+            'расхождения пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = counters.reconcile_users(options['chunk'])
+        posts = counters.reconcile_posts(options['chunk'])
+        self.stdout.write(f'Исправлено счётчиков пользователей: {users}, '
+                          f'постов: {posts}')
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import REPLICA, mark_refreshed, replica_configured
+
+
+def refresh():
+    """Копирует основную БД в файл реплики через backup API.
+
+    Копия пишется поверх файла реплики одной транзакцией, поэтому
+    открытые на реплике соединения видят либо старый снимок, либо
+    новый. Снимок не старше начала копирования: это время и
+    записывается как время обновления.
+    """
+    started = time.time()
+    source = sqlite3.connect(connections.databases[DEFAULT_DB_ALIAS]['NAME'])
+    target = sqlite3.connect(connections.databases[REPLICA]['NAME'])
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    mark_refreshed(started)
+
+
+class Command(BaseCommand):
+    help = ('Обновляет реплику SQLite из основной БД; с --interval '
+            'обновляет её периодически.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Период обновления в секундах.')
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError('Реплика не настроена: задайте '
+                               'YATUBE_REPLICA_PATH.')
+        while True:
+            start = time.perf_counter()
+            refresh()
+            self.stdout.write(f'Реплика обновлена за '
+                              f'{time.perf_counter() - start:.3f} с')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,116 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from core import processes
+from posts import caching, thumbnails
+from posts.models import Post, ThumbnailJob
+from ._checkpoint import load_checkpoint, save_checkpoint
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def render(args):
+    """Процесс пула: миниатюры всех SIZES для одной картинки. В базу
+    не ходит и возвращает только имена и размеры — kvstore пишет
+    основной процесс."""
+    pk, name = args
+    storage = Post._meta.get_field('image').storage
+    source = ImageFile(name, storage)
+    try:
+        rendered = [(source.size, thumbnail.name, thumbnail.size)
+                    for thumbnail in thumbnails.backend.render(
+                        source, thumbnails.SIZES)]
+        return pk, name, rendered, None
+    except Exception as error:
+        return pk, name, None, f'{type(error).__name__}: {error}'
+
+
+class Command(BaseCommand):
+    help = ('Заново делает миниатюры всех SIZES для всех постов с '
+            'картинками, например после смены размеров или качества. '
+            'Картинки декодируются и пережимаются в пуле процессов, '
+            'kvstore sorl пишется пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=available_cores(),
+                            help='Процессов в пуле; по умолчанию — по '
+                                 'числу доступных ядер.')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--checkpoint',
+                            default='regenerate_thumbnails.checkpoint',
+                            help='Файл с id последнего готового поста.')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        last = load_checkpoint(checkpoint)
+        if last:
+            self.stdout.write(f'Продолжаем после поста {last}')
+        self.started = timezone.now()
+        self.done = self.failed = 0
+        start = time.perf_counter()
+        with processes.pool(options['workers']) as pool:
+            # пока основной процесс пишет пачку, пул рисует следующую
+            previous = None
+            for posts in self.batches(last, options['batch_size']):
+                result = pool.map_async(
+                    render, [(post.pk, post.image.name) for post in posts])
+                if previous:
+                    self.store(*previous, checkpoint, start)
+                previous = posts, result
+            if previous:
+                self.store(*previous, checkpoint, start)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(f'Готово: {self.done} картинок, ошибок '
+                          f'{self.failed}')
+
+    def batches(self, last, size):
+        """Пачки постов с картинками по возрастанию id: каждая пачка —
+        отдельный запрос от последнего id, без долгого курсора."""
+        queryset = (Post.objects.exclude(image='').order_by('pk')
+                    .only('pk', 'image', 'author_id', 'group_id'))
+        while True:
+            posts = list(queryset.filter(pk__gt=last)[:size])
+            if not posts:
+                return
+            yield posts
+            last = posts[-1].pk
+
+    def store(self, posts, result, checkpoint, start):
+        storage = Post._meta.get_field('image').storage
+        pairs = []
+        done = []
+        for pk, name, rendered, error in result.get():
+            if error:
+                self.failed += 1
+                self.stderr.write(f'Пост {pk}: {error}')
+                continue
+            for source_size, thumbnail_name, thumbnail_size in rendered:
+                source = ImageFile(name, storage)
+                source.set_size(source_size)
+                thumbnail = ImageFile(thumbnail_name, default.storage)
+                thumbnail.set_size(thumbnail_size)
+                pairs.append((source, thumbnail))
+            done.append(pk)
+        thumbnails.store(pairs)
+        # очередь этих картинок уже не нужна; задания, поставленные
+        # после старта (новая картинка), остаются воркеру
+        ThumbnailJob.objects.filter(post_id__in=done,
+                                    created__lt=self.started).delete()
+        Post.objects.filter(pk__in=done).update(updated_at=timezone.now())
+        caching.invalidate_posts(posts, pages=True)
+        save_checkpoint(checkpoint, posts[-1].pk)
+        self.done += len(done)
+        rate = self.done / (time.perf_counter() - start)
+        self.stdout.write(f'До поста {posts[-1].pk}: готово {self.done}, '
+                          f'ошибок {self.failed} ({rate:.1f} картинок/с)')
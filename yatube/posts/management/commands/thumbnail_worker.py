@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Делает миниатюры картинок постов по очереди ThumbnailJob. '
+            'Несколько воркеров можно запускать параллельно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и выйти.')
+        parser.add_argument('--interval', type=float, default=1,
+                            help='Пауза при пустой очереди, в секундах.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            job = thumbnails.claim()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+            start = time.perf_counter()
+            if thumbnails.process(job):
+                self.stdout.write(f'Пост {job.post_id}: миниатюры за '
+                                  f'{time.perf_counter() - start:.3f} с')
+            else:
+                self.stderr.write(f'Пост {job.post_id}: ошибка, '
+                                  f'попытка {job.attempts + 1}')
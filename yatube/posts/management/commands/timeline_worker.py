@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = ('Возвращает к раскладке авторов, у которых подписчиков стало '
+            'меньше TIMELINE_FANOUT_LIMIT - TIMELINE_FANOUT_GAP: досыпает '
+            'их последние посты в ленты подписчиков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Вернуть всех подходящих авторов и выйти.')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Пауза между проверками, в секундах.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            for author_id in list(timeline.resumable()):
+                start = time.perf_counter()
+                if timeline.resume(author_id):
+                    self.stdout.write(
+                        f'Автор {author_id}: снова раскладывается, '
+                        f'досыпка за {time.perf_counter() - start:.1f} с')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+INDEXED = "replace(replace({}.text, 'ё', 'е'), 'Ё', 'Е')"
+
+FORWARD = [
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post "
+    "BEGIN "
+    "INSERT INTO posts_post_fts(rowid, text) "
+    f"VALUES (new.id, {INDEXED.format('new')}); "
+    "END",
+    "CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post "
+    "BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+    f"VALUES ('delete', old.id, {INDEXED.format('old')}); "
+    "END",
+    "CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text "
+    "ON posts_post BEGIN "
+    "INSERT INTO posts_post_fts(posts_post_fts, rowid, text) "
+    f"VALUES ('delete', old.id, {INDEXED.format('old')}); "
+    "INSERT INTO posts_post_fts(rowid, text) "
+    f"VALUES (new.id, {INDEXED.format('new')}); "
+    "END",
+    "INSERT INTO posts_post_fts(rowid, text) "
+    f"SELECT id, {INDEXED.format('posts_post')} FROM posts_post",
+]
+
+BACKWARD = [
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TABLE IF EXISTS posts_post_fts',
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 есть только в SQLite, на других СУБД поиска нет
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(BACKWARD)),
+    ]
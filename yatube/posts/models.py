@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -22,6 +22,8 @@ class Post(models.Model):
                             verbose_name='Текст поста')
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name='Дата изменения')
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -45,13 +47,45 @@ class Post(models.Model):
         blank=True,
         help_text='Изображение',
     )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев'
+    )
+
+    # счётчики двигает только posts.counters
+    COUNTERS = ('comments_count',)
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            # иначе save() загруженного раньше поста затрёт счётчики
+            # старыми значениями
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTERS
+                and field.attname not in deferred
+            ]
+        # счётчики обновляются в post_save, в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name_plural = 'Записи блогов'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_feed_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_feed_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -75,9 +109,17 @@ class Comment(models.Model):
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -101,6 +143,89 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='follow_1_time_no_self_follow')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f"'Подписчик: '{self.user}', Автор : '{self.author}'"
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число постов')
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число подписок')
+    pulled = models.BooleanField(
+        default=False, verbose_name='Посты читаются при чтении ленты')
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель ленты'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='timeline_post_once')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_feed_idx'),
+        ]
+
+
+class ThumbnailJob(models.Model):
+    """Задание воркеру: сделать миниатюры картинки поста."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='thumbnail_job',
+        verbose_name='Пост'
+    )
+    created = models.DateTimeField(verbose_name='Поставлено в очередь')
+    started = models.DateTimeField(null=True, blank=True,
+                                   verbose_name='Взято воркером')
+    attempts = models.PositiveSmallIntegerField(default=0,
+                                                verbose_name='Попыток')
+
+    class Meta:
+        verbose_name = 'Задание на миниатюры'
+        verbose_name_plural = 'Очередь миниатюр'
+
+    def __str__(self):
+        return f'Миниатюры поста {self.post_id}'
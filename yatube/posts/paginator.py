@@ -0,0 +1,383 @@
+import binascii
+import copy
+import hashlib
+from math import ceil
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from core.cache import stampede
+
+FORWARD = 'a'
+BACKWARD = 'b'
+LAST = 'last'
+
+# курсоры подписаны: принимаются только выданные сайтом, поэтому
+# по ним нельзя нагенерировать сколько угодно разных страниц
+signer = signing.Signer(salt='posts.paginator')
+
+
+def encode_cursor(post, number, direction):
+    raw = f'{direction}|{number}|{post.pub_date.isoformat()}|{post.pk}'
+    return signer.sign(urlsafe_base64_encode(raw.encode()))
+
+
+def decode_cursor(cursor):
+    """Возвращает (direction, number, pub_date, pk) или None."""
+    try:
+        raw = urlsafe_base64_decode(signer.unsign(cursor)).decode()
+        direction, number, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        number, pk = int(number), int(pk)
+    except (signing.BadSignature, binascii.Error, UnicodeDecodeError,
+            ValueError):
+        return None
+    if direction not in (FORWARD, BACKWARD) or pub_date is None:
+        return None
+    return direction, max(number, 1), pub_date, pk
+
+
+class KeysetPaginator(Paginator):
+    """Пагинатор без OFFSET: каждая страница — один seek-запрос.
+
+    Порядок ('-pub_date', '-id') стабилен при совпадающих pub_date.
+    Старые ссылки ?page=N обслуживаются через OFFSET, а дальнейшая
+    навигация идёт по курсорам.
+
+    Отдаются обычные Page: к странице привязана копия пагинатора
+    (bind()), у которой num_pages — нижняя оценка (текущая страница
+    плюс одна, если есть следующая), поэтому has_next() и
+    has_previous() не вызывают COUNT(*). Курсоры лежат в page.next_cursor и
+    page.previous_cursor.
+
+    Общее число записей нужно только окну номеров страниц; оно берётся
+    из кэша и может отставать от реального не дольше PGN_COUNT_TTL.
+    """
+    id_field = 'id'
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, **kwargs):
+        object_list = object_list.order_by('-pub_date', f'-{self.id_field}')
+        super().__init__(object_list, per_page, **kwargs)
+        self.known_num_pages = None
+
+    @property
+    def num_pages(self):
+        if self.known_num_pages is not None:
+            return self.known_num_pages
+        return Paginator.num_pages.func(self)
+
+    def bind(self, num_pages):
+        """Копия пагинатора для одной страницы с заданным num_pages."""
+        bound = copy.copy(self)
+        bound.known_num_pages = num_pages
+        return bound
+
+    @cached_property
+    def count(self):
+        try:
+            sql = str(self.object_list.query)
+        except EmptyResultSet:
+            return 0
+        key = 'pgn_count:' + hashlib.md5(sql.encode()).hexdigest()
+        return stampede.fetch(key, self.object_list.count,
+                              settings.PGN_COUNT_TTL)
+
+    @property
+    def estimated_num_pages(self):
+        return max(ceil(self.count / self.per_page), self.num_pages, 1)
+
+    def get_elided_page_range(self, number):
+        """Номера страниц вокруг текущей и по краям, остальное — «…»."""
+        on_each_side = settings.PGN_ON_EACH_SIDE
+        on_ends = settings.PGN_ON_ENDS
+        num_pages = self.estimated_num_pages
+        if num_pages <= (on_each_side + on_ends) * 2:
+            yield from range(1, num_pages + 1)
+            return
+        if number > (1 + on_each_side + on_ends) + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < (num_pages - on_each_side - on_ends) - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(num_pages - on_ends + 1, num_pages + 1)
+        else:
+            yield from range(number + 1, num_pages + 1)
+
+    def page_links(self, page):
+        """Окно get_elided_page_range парами (номер, строка запроса).
+
+        У «…» и текущей страницы строки запроса нет (None). Ни одна
+        ссылка не идёт через OFFSET: первая страница — без параметров,
+        последняя — cursor=last, остальные — курсоры. Строки для курсоров
+        добираются seek-запросами от текущей страницы или от ближнего
+        края ленты, каждый не длиннее окна. Номер, до которого лента
+        не дотянулась (устаревший count), пропускается.
+        """
+        number, per_page = page.number, self.per_page
+        window = list(self.get_elided_page_range(number))
+        last = self.estimated_num_pages
+        queries = {1: '', last: f'cursor={LAST}', number: None}
+        forward, backward, head, tail = self._split_window(
+            [i for i in window if i != self.ELLIPSIS and i not in queries],
+            number, last)
+        rows = list(page.object_list)
+        if forward and rows:
+            chain = self._chain(rows[-1], max(forward) - number - 1)
+            for i in forward:
+                self._link(queries, i, chain, (i - number - 1) * per_page,
+                           FORWARD)
+        if backward and rows:
+            chain = self._chain(rows[0], number - min(backward) - 1,
+                                backward=True)
+            for i in backward:
+                self._link(queries, i, chain, (number - i - 1) * per_page,
+                           BACKWARD)
+        if head:
+            chain = self._fetch(limit=(max(head) - 1) * per_page)
+            for i in head:
+                self._link(queries, i, chain, (i - 1) * per_page - 1,
+                           FORWARD)
+        if tail:
+            size = self._last_size(last)
+            chain = self._fetch(
+                backward=True, limit=size + (last - min(tail) - 1) * per_page)
+            for i in tail:
+                self._link(queries, i, chain,
+                           size - 1 + (last - i - 1) * per_page, BACKWARD)
+        return [(i, None) if i == self.ELLIPSIS else (i, queries[i])
+                for i in window if i == self.ELLIPSIS or i in queries]
+
+    def _split_window(self, numbers, number, last):
+        """Номера, до которых ближе от текущей страницы вперёд и назад,
+        от начала и от конца ленты."""
+        forward, backward, head, tail = [], [], [], []
+        for i in numbers:
+            if i > number:
+                (forward if i - number <= last - i else tail).append(i)
+            else:
+                (backward if number - i <= i - 1 else head).append(i)
+        return forward, backward, head, tail
+
+    def _chain(self, row, pages, backward=False):
+        """row и ещё pages страниц строк за ним."""
+        if not pages:
+            return [row]
+        return [row] + self._fetch(row.pub_date, row.pk, backward,
+                                   pages * self.per_page)
+
+    def _link(self, queries, number, rows, index, direction):
+        if 0 <= index < len(rows):
+            cursor = encode_cursor(rows[index], number, direction)
+            queries[number] = f'cursor={cursor}'
+
+    def _rows(self, queryset, id_field, pub_date=None, pk=None,
+              backward=False, limit=None):
+        if backward:
+            queryset = queryset.reverse()
+        if pub_date is not None:
+            op = 'gt' if backward else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'pub_date__{op}': pub_date})
+                | Q(**{'pub_date': pub_date, f'{id_field}__{op}': pk})
+            )
+        return list(queryset[:limit or self.per_page + 1])
+
+    def _fetch(self, pub_date=None, pk=None, backward=False, limit=None):
+        """До limit (по умолчанию per_page + 1) строк за курсором или от
+        начала ленты."""
+        return self._rows(self.object_list, self.id_field,
+                          pub_date, pk, backward, limit)
+
+    def _page(self, rows, number, cursor='', has_next=None):
+        if has_next is None:
+            has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        page = Page(rows, number,
+                    self.bind(number + 1 if has_next else number))
+        page.cursor = cursor
+        page.next_cursor = (encode_cursor(rows[-1], number + 1, FORWARD)
+                            if has_next else None)
+        page.previous_cursor = (encode_cursor(rows[0], number - 1, BACKWARD)
+                                if number > 1 and rows else None)
+        return page
+
+    def first_page(self):
+        return self._page(self._fetch(), 1)
+
+    def last_page(self):
+        """Последняя страница в той же нумерации, что и ?page=N: в ней
+        count - (num_pages - 1) * per_page постов."""
+        rows = self._fetch(backward=True)
+        if len(rows) <= self.per_page:
+            return self.first_page()
+        num_pages = max(ceil(self.count / self.per_page), 2)
+        size = self._last_size(num_pages)
+        return self._page(rows[:size][::-1], num_pages, LAST,
+                          has_next=False)
+
+    def _last_size(self, num_pages):
+        size = self.count - (num_pages - 1) * self.per_page
+        if not 0 < size <= self.per_page:
+            # закэшированное число записей отстало от ленты
+            size = self.per_page
+        return size
+
+    def page_after(self, pub_date, pk, number, cursor=''):
+        rows = self._fetch(pub_date, pk)
+        return self._page(rows, max(number, 2), cursor)
+
+    def page_before(self, pub_date, pk, number, cursor=''):
+        rows = self._fetch(pub_date, pk, backward=True)
+        if len(rows) <= self.per_page:
+            return self.first_page()
+        return self._page(rows[:self.per_page][::-1], max(number, 2),
+                          cursor, has_next=True)
+
+    def page_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return self.first_page()
+        if number <= 1:
+            return self.first_page()
+        rows = self._offset(number)
+        if not rows:
+            return self.last_page()
+        return self._page(rows, number)
+
+    def _offset(self, number):
+        bottom = (number - 1) * self.per_page
+        return list(self.object_list[bottom:bottom + self.per_page + 1])
+
+    def clean(self, cursor=None, page_number=None):
+        """Параметры страницы в каноническом виде (cursor, page_number):
+        испорченный курсор и номер меньше двух — первая страница."""
+        if cursor == LAST:
+            return LAST, None
+        if cursor:
+            return (cursor, None) if decode_cursor(cursor) else (None, None)
+        try:
+            number = int(page_number)
+        except (TypeError, ValueError):
+            return None, None
+        return (None, number) if number > 1 else (None, None)
+
+    def get_cursor_page(self, cursor=None, page_number=None):
+        if cursor == LAST:
+            return self.last_page()
+        if cursor:
+            decoded = decode_cursor(cursor)
+            if decoded is None:
+                return self.first_page()
+            direction, number, pub_date, pk = decoded
+            if direction == FORWARD:
+                return self.page_after(pub_date, pk, number, cursor)
+            return self.page_before(pub_date, pk, number, cursor)
+        if page_number is not None:
+            return self.page_number(page_number)
+        return self.first_page()
+
+
+class TimelinePaginator(KeysetPaginator):
+    """Курсорный пагинатор по материализованной ленте подписок.
+
+    object_list — записи TimelineEntry пользователя, pulled — выборки
+    постов авторов, которые в ленты не раскладываются (по одной на
+    автора, см. posts.timeline). Все выборки читаются одним и тем же
+    seek-условием и сливаются, на выходе всегда посты.
+    """
+    id_field = 'post_id'
+
+    def __init__(self, object_list, per_page, pulled=None, **kwargs):
+        object_list = object_list.select_related('post__author',
+                                                 'post__group')
+        super().__init__(object_list, per_page, **kwargs)
+        if pulled is not None:
+            pulled = [posts.select_related('author', 'group').order_by(
+                '-pub_date', '-id') for posts in pulled]
+        self.pulled = pulled
+
+    def _merge(self, entries, posts, backward, limit):
+        rows = {entry.post_id: entry.post for entry in entries}
+        rows.update((post.pk, post) for post in posts)
+        return sorted(rows.values(), key=lambda post: (post.pub_date, post.pk),
+                      reverse=not backward)[:limit]
+
+    def _fetch(self, pub_date=None, pk=None, backward=False, limit=None):
+        entries = super()._fetch(pub_date, pk, backward, limit)
+        if self.pulled is None:
+            return [entry.post for entry in entries]
+        posts = [post for queryset in self.pulled
+                 for post in self._rows(queryset, 'id', pub_date, pk,
+                                        backward, limit)]
+        return self._merge(entries, posts, backward,
+                           limit or self.per_page + 1)
+
+    def _offset(self, number):
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page + 1
+        if self.pulled is None:
+            return [entry.post for entry in self.object_list[bottom:top]]
+        posts = [post for queryset in self.pulled
+                 for post in queryset[:top]]
+        return self._merge(self.object_list[:top], posts,
+                           False, top)[bottom:]
+
+
+def encode_comment_cursor(comment):
+    raw = f'{comment.created.isoformat()}|{comment.pk}'
+    return signer.sign(urlsafe_base64_encode(raw.encode()))
+
+
+def decode_comment_cursor(cursor):
+    """Возвращает (created, pk) или None."""
+    try:
+        raw = urlsafe_base64_decode(signer.unsign(cursor)).decode()
+        created, pk = raw.split('|')
+        created, pk = parse_datetime(created), int(pk)
+    except (signing.BadSignature, binascii.Error, UnicodeDecodeError,
+            ValueError):
+        return None
+    if created is None:
+        return None
+    return created, pk
+
+
+class CommentPaginator:
+    """Комментарии поста порциями в порядке (created, id).
+
+    Порция — один seek-запрос по индексу (post, created) вместе с
+    авторами, поэтому число запросов не зависит от числа комментариев.
+    Курсор следующей порции — created и id последнего комментария;
+    навигация только вперёд («показать ещё»).
+    """
+
+    def __init__(self, comments, per_page):
+        self.object_list = comments.select_related('author').order_by(
+            'created', 'id')
+        self.per_page = per_page
+
+    def get_page(self, cursor=None):
+        """Возвращает (комментарии, курсор следующей порции или None)."""
+        comments = self.object_list
+        decoded = decode_comment_cursor(cursor) if cursor else None
+        if decoded is not None:
+            created, pk = decoded
+            comments = comments.filter(Q(created__gt=created)
+                                       | Q(created=created, id__gt=pk))
+        rows = list(comments[:self.per_page + 1])
+        if len(rows) <= self.per_page:
+            return rows, None
+        rows = rows[:self.per_page]
+        return rows, encode_comment_cursor(rows[-1])
@@ -0,0 +1,231 @@
+"""Полнотекстовый поиск по Post.text через SQLite FTS5.
+
+posts_post_fts — таблица FTS5 с внешним содержимым (content=posts_post):
+она хранит только индекс, а текст читается из posts_post. Индекс
+держат триггеры на вставку, удаление и изменение text, поэтому его
+не обходят ни bulk_create, ни сырые INSERT-ы импорта и фикстур.
+Миграция, которая в SQLite пересоздаёт posts_post копией, молча
+теряет триггеры: restore_triggers() после migrate возвращает их и
+пересобирает индекс. Пересборка (rebuild_index) идёт пачками в теневую
+таблицу, которая подменяет рабочую одной короткой транзакцией.
+
+Токенизатор unicode61 приводит кириллицу к нижнему регистру, а «ё»
+и в индексе, и в запросе заменяется на «е» (INDEXED_TEXT). Стеммера
+для русского в SQLite нет, поэтому при SEARCH_STEMMING слово запроса
+обрезается до основы (отбрасывается самое длинное окончание) и
+ищется как префикс: «котами» находит «кот», «коты» и «котов».
+Результаты упорядочены по bm25.
+"""
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+# что попадает в индекс из строки posts_post: триггеры и пересборка
+# должны индексировать одно и то же, иначе 'delete' испортит индекс
+INDEXED_TEXT = "replace(replace({}.text, 'ё', 'е'), 'Ё', 'Е')"
+# пересборка: теневой индекс и сколько id в нём уже есть
+SHADOW_TABLE = f'{FTS_TABLE}_new'
+PROGRESS_TABLE = f'{FTS_TABLE}_progress'
+CREATE_INDEX = (
+    'CREATE VIRTUAL TABLE {} USING fts5('
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+REBUILD_CHUNK = 10000
+
+
+def _triggers(table, progress=None):
+    """SQL триггеров, которые держат индекс table, по имени. С progress
+    триггер срабатывает только для id, которые пересборка уже прошла."""
+    def when(row):
+        if progress is None:
+            return ''
+        return f'WHEN {row}.id <= (SELECT done FROM {progress}) '
+    new, old = INDEXED_TEXT.format('new'), INDEXED_TEXT.format('old')
+    return {
+        f'{table}_insert':
+            f'CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT '
+            f'ON posts_post {when("new")}BEGIN '
+            f'INSERT INTO {table}(rowid, text) VALUES (new.id, {new}); END',
+        f'{table}_delete':
+            f'CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE '
+            f'ON posts_post {when("old")}BEGIN '
+            f'INSERT INTO {table}({table}, rowid, text) '
+            f"VALUES ('delete', old.id, {old}); END",
+        f'{table}_update':
+            f'CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE '
+            f'OF text ON posts_post {when("old")}BEGIN '
+            f'INSERT INTO {table}({table}, rowid, text) '
+            f"VALUES ('delete', old.id, {old}); "
+            f'INSERT INTO {table}(rowid, text) VALUES (new.id, {new}); END',
+    }
+
+
+TRIGGERS = _triggers(FTS_TABLE)
+MAX_TERMS = 10
+MIN_STEM = 3
+
+ENDINGS = sorted({
+    # прилагательные и причастия
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое',
+    'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую',
+    'юю', 'ая', 'яя', 'ою', 'ею',
+    # существительные
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ье',
+    'еи', 'ии', 'ям', 'ам', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья',
+    'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+    # глаголы
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'уй',
+    'ил', 'ыл', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит',
+    'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ла', 'на', 'ете', 'йте', 'ли',
+    'л', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь',
+}, key=len, reverse=True)
+REFLEXIVE = ('ся', 'сь')
+
+
+def missing_triggers(connection):
+    """Имена триггеров индекса, которых нет на posts_post."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = "
+                       "'trigger' AND tbl_name = 'posts_post'")
+        present = {name for name, in cursor.fetchall()}
+    return sorted(TRIGGERS.keys() - present)
+
+
+def rebuild_index(connection, chunk=REBUILD_CHUNK, report=None):
+    """Собирает индекс заново и подменяет им рабочий.
+
+    Теневой индекс заполняется пачками по chunk id, каждая — своей
+    транзакцией, так что запись постов ждёт не дольше пачки, а поиск
+    до подмены видит старый индекс. Правки уже пройденных строк теневой
+    индекс догоняет своими триггерами. Остаток и подмена — одна
+    короткая транзакция. report(done, top) вызывается после пачки.
+    """
+    using = connection.alias
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        # остатки прерванной пересборки
+        _drop_shadow(cursor)
+        cursor.execute(CREATE_INDEX.format(SHADOW_TABLE))
+        cursor.execute(f'CREATE TABLE {PROGRESS_TABLE} '
+                       f'(done INTEGER NOT NULL)')
+        cursor.execute(f'INSERT INTO {PROGRESS_TABLE} VALUES (0)')
+        for statement in _triggers(SHADOW_TABLE, PROGRESS_TABLE).values():
+            cursor.execute(statement)
+    while True:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(f'SELECT done FROM {PROGRESS_TABLE}')
+            done = cursor.fetchone()[0]
+            cursor.execute('SELECT max(id) FROM posts_post')
+            top = cursor.fetchone()[0] or 0
+            last = top - done <= chunk
+            _index(cursor, done, top if last else done + chunk)
+            if last:
+                _swap(cursor)
+                return
+        if report:
+            report(done + chunk, top)
+
+
+def _index(cursor, done, upto):
+    cursor.execute(f'INSERT INTO {SHADOW_TABLE}(rowid, text) '
+                   f"SELECT id, {INDEXED_TEXT.format('posts_post')} "
+                   f'FROM posts_post WHERE id > %s AND id <= %s',
+                   [done, upto])
+    cursor.execute(f'UPDATE {PROGRESS_TABLE} SET done = %s', [upto])
+
+
+def _drop_shadow(cursor):
+    for name in _triggers(SHADOW_TABLE):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute(f'DROP TABLE IF EXISTS {SHADOW_TABLE}')
+    cursor.execute(f'DROP TABLE IF EXISTS {PROGRESS_TABLE}')
+
+
+def _swap(cursor):
+    for name in _triggers(SHADOW_TABLE):
+        cursor.execute(f'DROP TRIGGER {name}')
+    for name in TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    cursor.execute(f'DROP TABLE {PROGRESS_TABLE}')
+    cursor.execute(f'ALTER TABLE {SHADOW_TABLE} RENAME TO {FTS_TABLE}')
+    for statement in TRIGGERS.values():
+        cursor.execute(statement)
+
+
+def restore_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Обработчик post_migrate: возвращает потерянные триггеры и
+    пересобирает индекс, который без них мог отстать."""
+    connection = connections[using]
+    if (connection.vendor != 'sqlite'
+            or FTS_TABLE not in connection.introspection.table_names()):
+        return
+    missing = missing_triggers(connection)
+    if not missing:
+        return
+    with connection.cursor() as cursor:
+        for name in missing:
+            cursor.execute(TRIGGERS[name])
+    rebuild_index(connection)
+
+
+def stem(word):
+    """Грубая основа русского слова: без возвратной частицы и самого
+    длинного окончания, но не короче MIN_STEM букв."""
+    for suffix in REFLEXIVE:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            word = word[:-len(suffix)]
+            break
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def match_expression(query, stemming=None):
+    """Выражение MATCH для FTS5: все слова запроса через AND.
+
+    Слова берутся как \\w+, так что синтаксис FTS5 из запроса
+    (кавычки, NEAR, OR, *) не проходит. Пустая строка — искать нечего.
+    """
+    if stemming is None:
+        stemming = settings.SEARCH_STEMMING
+    words = re.findall(r'\w+', query.lower().replace('ё', 'е'))
+    terms = []
+    for word in words[:MAX_TERMS]:
+        if stemming and word.isalpha():
+            terms.append(f'"{stem(word)}"*')
+        else:
+            terms.append(f'"{word}"')
+    return ' '.join(terms)
+
+
+def search(query, queryset=None):
+    """Посты, подходящие под запрос, от более к менее релевантным."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[expression],
+        select={'rank': f'bm25({FTS_TABLE})'},
+        order_by=['rank', '-id'],
+    )
+
+
+def filter_matching(queryset, query):
+    """Только подходящие посты, без сортировки по релевантности
+    (например, для админки)."""
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        where=[f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+               f'WHERE {FTS_TABLE} MATCH %s)'],
+        params=[match_expression(query)],
+    )
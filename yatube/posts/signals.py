@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import caching, counters, thumbnails, timeline
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+# что карточки и комментарии показывают об авторе
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_init, sender=Post)
+def post_remember_group(sender, instance, **kwargs):
+    # __dict__, чтобы не подгружать отложенные поля
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    instance._initial_image = str(instance.__dict__.get('image') or '')
+
+
+@receiver(post_init, sender=User)
+def user_remember_name(sender, instance, **kwargs):
+    instance._initial_name = tuple(instance.__dict__.get(field)
+                                   for field in AUTHOR_FIELDS)
+
+
+# счётчики — первыми: по followers_count решается, раскладывать ли посты
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Follow)
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.changed(instance, 1)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Follow)
+def count_deleted(sender, instance, **kwargs):
+    counters.changed(instance, -1)
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_retract(sender, instance, **kwargs):
+    timeline.retract(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_thumbnails(sender, instance, raw=False, **kwargs):
+    name = instance.image.name or ''
+    if not raw and name != instance._initial_image:
+        thumbnails.enqueue([instance])
+        instance._initial_image = name
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_prune(sender, instance, **kwargs):
+    timeline.prune(instance.user, instance.author)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_invalidate(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.invalidate_post(instance)
+
+
+@receiver(post_save, sender=User)
+def user_invalidate(sender, instance, created, raw=False, **kwargs):
+    # вход в систему тоже сохраняет пользователя (last_login): его
+    # пропускаем
+    name = tuple(getattr(instance, field) for field in AUTHOR_FIELDS)
+    if not raw and not created and name != instance._initial_name:
+        caching.invalidate_author(instance)
+    instance._initial_name = name
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_invalidate(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.invalidate_group(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_invalidate(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.invalidate_comment(instance)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_invalidate(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.invalidate_follow(instance)
@@ -0,0 +1,42 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import thumbnails
+from posts.caching import card_key
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, show_posts=True):
+    """HTML карточек постов страницы: кэш читается одним get_many,
+    рендерятся только отсутствующие."""
+    keys = {card_key(post, show_posts): post for post in posts}
+    cards = cache.get_many(keys)
+    thumbnails.prefetch(post for key, post in keys.items()
+                        if key not in cards)
+    rendered = {
+        key: render_to_string('includes/post_card.html',
+                              {'post': post, 'show_posts': show_posts})
+        for key, post in keys.items() if key not in cards
+    }
+    if rendered:
+        cache.set_many(rendered, settings.FRAGMENT_CACHE_TTL)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
+
+
+@register.simple_tag
+def post_picture(post):
+    """thumbnails.Picture картинки поста, если воркер уже сделал
+    миниатюры, иначе None; post.card_pending — показывать ли заглушку.
+
+    Заодно досылает задание в очередь, если прежнее потерялось. После
+    thumbnails.prefetch() берёт готовый результат.
+    """
+    if not hasattr(post, 'card_picture'):
+        thumbnails.prefetch([post])
+    return post.card_picture
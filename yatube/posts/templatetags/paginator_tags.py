@@ -0,0 +1,8 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def page_links(page):
+    return page.paginator.page_links(page)
@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, Post
+from posts.paginator import CommentPaginator
+
+
+User = get_user_model()
+
+
+@override_settings(CNT_COMMENT=10)
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        readers = [User.objects.create_user(username=f'reader{i}')
+                   for i in range(5)]
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=readers[i % 5], text=f'Ком {i}')
+            for i in range(25)
+        )
+        # одинаковое время у всех комментариев: порядок держится на id
+        Comment.objects.update(created=timezone.now())
+        cls.ordered = list(Comment.objects.order_by('created', 'id'))
+
+    def setUp(self):
+        cache.clear()
+        caches['feeds'].clear()
+        self.client = Client()
+
+    def test_pages_cover_comments_without_gaps(self):
+        """Курсоры обходят комментарии без пропусков и повторов"""
+        paginator = CommentPaginator(self.post.comments, 10)
+        comments, cursor = paginator.get_page()
+        seen = list(comments)
+        while cursor:
+            comments, cursor = paginator.get_page(cursor)
+            seen.extend(comments)
+        self.assertEqual(seen, self.ordered)
+
+    def test_broken_cursor_gives_first_page(self):
+        """Испорченный курсор открывает первую порцию"""
+        comments, _ = CommentPaginator(self.post.comments, 10).get_page('x')
+        self.assertEqual(comments, self.ordered[:10])
+
+    def test_post_detail_shows_first_page(self):
+        """На странице поста первая порция и ссылка на следующую"""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(response.context['comments'], self.ordered[:10])
+        self.assertContains(response, reverse(
+            'posts:post_comments', kwargs={'post_id': self.post.pk}))
+
+    def test_load_more_fragment(self):
+        """Фрагмент «показать ещё» отдаёт следующую порцию"""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        cursor = self.client.get(url).context['comments_cursor']
+        response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual(response.context['comments'], self.ordered[10:20])
+        self.assertTemplateNotUsed(response, 'base.html')
+
+    def test_queries_do_not_depend_on_comments(self):
+        """Число запросов страницы поста не растёт с комментариями"""
+        quiet = Post.objects.create(author=self.author, text='Тихий пост')
+        for post in (quiet, self.post):
+            cache.clear()
+            with self.assertNumQueries(2):
+                self.client.get(reverse('posts:post_detail',
+                                        kwargs={'post_id': post.pk}))
+
+    def test_missing_post(self):
+        """Фрагмент для несуществующего поста — 404"""
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 10 ** 6}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,109 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import counters
+from posts.models import AuthorStats, Comment, Follow, Post
+
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        cache.clear()
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_post_count_follows_create_and_delete(self):
+        """Счётчик постов автора меняется при создании и удалении"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Ещё пост')
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+
+    def test_comment_count(self):
+        """Счётчик комментариев поста"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_saving_loaded_post_keeps_comment_count(self):
+        """save() загруженного раньше поста не затирает счётчик"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        stale = Post.objects.get(pk=post.pk)
+        Comment.objects.create(post=post, author=self.reader, text='Первый')
+        Comment.objects.create(post=post, author=self.reader, text='Второй')
+        stale.text = 'Правка'
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual((post.text, post.comments_count), ('Правка', 2))
+
+    def test_drifted_counter_does_not_break_delete(self):
+        """Разошедшийся до нуля счётчик не мешает удалению и не уходит
+        в минус"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        AuthorStats.objects.filter(user=self.author).update(posts_count=0)
+        post.delete()
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_follow_counts(self):
+        """Подписка двигает счётчики подписчиков и подписок"""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_reconcile_fixes_drift(self):
+        """reconcile_counters исправляет счётчики после bulk_create"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}') for i in range(3))
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.reader, text='Комментарий')
+            for _ in range(2))
+        AuthorStats.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', chunk=1, stdout=StringIO())
+        self.assertEqual(self.stats(self.author).posts_count, 4)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+        self.assertEqual(counters.reconcile_users(), 0)
+        self.assertEqual(counters.reconcile_posts(), 0)
+
+    def test_post_detail_has_no_count_queries(self):
+        """Страница поста берёт счётчики из колонок, без COUNT"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Комментарий')
+        client = Client()
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in queries.captured_queries))
+        self.assertContains(response, 'Комментариев: <span>1</span>')
+        self.assertContains(response,
+                            'Всего постов автора: <span>1</span>')
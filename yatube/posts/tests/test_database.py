@@ -0,0 +1,17 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from core.db import apply_pragmas
+
+
+class SQLitePragmasTests(TestCase):
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -12345,
+                                       'busy_timeout': 1234})
+    def test_pragmas_are_applied_to_connection(self):
+        """Прагмы из SQLITE_PRAGMAS выполняются на соединении"""
+        apply_pragmas(None, connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -12345)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
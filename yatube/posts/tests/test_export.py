@@ -0,0 +1,102 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Пост',
+            image=SimpleUploadedFile('cat.gif', b'GIF89a',
+                                     content_type='image/gif'))
+        Post.objects.create(author=cls.user, text='Пост без картинки')
+        other = Post.objects.create(author=cls.author, text='Чужой пост')
+        Comment.objects.create(post=other, author=cls.user,
+                               text='Комментарий')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def download(self, **params):
+        response = self.client.get(reverse('posts:export_data'), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_requires_login(self):
+        """Выгрузка доступна только вошедшему пользователю"""
+        response = Client().get(reverse('posts:export_data'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_jsonl(self):
+        """JSONL: посты, комментарии и подписки только самого
+        пользователя"""
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line)
+                   for line in content.decode().splitlines()]
+        self.assertEqual([record['type'] for record in records],
+                         ['post', 'post', 'comment', 'follow'])
+        self.assertEqual(records[0]['text'], 'Пост')
+        self.assertEqual(records[0]['image'], self.post.image.name)
+        self.assertEqual(records[3]['author'], 'author')
+
+    def test_csv(self):
+        """CSV с общим заголовком для всех типов записей"""
+        response, content = self.download(format='csv')
+        self.assertIn('user.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[2]['post'], str(Comment.objects.get().post_id))
+
+    def test_zip_with_images(self):
+        """Архив содержит данные и картинки постов"""
+        response, content = self.download(images=1)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(
+                archive.namelist(),
+                ['data.jsonl', f'images/{self.post.image.name}'])
+            self.assertEqual(
+                archive.read(f'images/{self.post.image.name}'), b'GIF89a')
+
+    def test_command(self):
+        """Команда пишет ту же выгрузку в файл"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        path = os.path.join(tmp, 'user.jsonl')
+        call_command('export_user_data', 'user', output=path)
+        _, content = self.download()
+        with open(path, 'rb') as exported:
+            self.assertEqual(exported.read(), content)
@@ -0,0 +1,118 @@
+from array import array
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.cache.packed import PackedIdCache
+from posts.feed_cache import CachedTimelinePaginator, feed_ids
+from posts.models import Follow, Post
+
+
+User = get_user_model()
+
+
+class PackedIdCacheTests(TestCase):
+    def test_lru_eviction_by_bytes(self):
+        """Вытесняются давно не читанные массивы, когда превышен бюджет"""
+        cache = PackedIdCache('test-packed', {'OPTIONS': {'MAX_BYTES': 2500}})
+        cache.clear()
+        cache.set('a', range(100))
+        cache.set('b', range(100))
+        cache.get('a')
+        cache.set('c', range(100))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), array('q', range(100)))
+        self.assertLessEqual(cache.stats()['bytes'], 2500)
+
+    def test_stats_report_bytes_per_entry(self):
+        """Память на запись — порядка 8 байт на id"""
+        cache = PackedIdCache('test-stats', {})
+        cache.clear()
+        cache.set('feed:1', range(300))
+        self.assertLess(cache.stats()['bytes_per_entry'], 300 * 8 + 200)
+
+
+class FeedCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.author) for i in range(15)
+        )
+
+    def setUp(self):
+        cache.clear()
+        caches['feeds'].clear()
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_new_post_is_pushed_to_cached_feed(self):
+        """Новый пост попадает в начало закэшированной ленты"""
+        feed_ids(self.reader)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        with self.assertNumQueries(0):
+            self.assertEqual(feed_ids(self.reader)[0], post.pk)
+
+    def test_unfollow_refreshes_cached_feed(self):
+        """После отписки лента в кэше пуста"""
+        feed_ids(self.reader)
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(len(feed_ids(self.reader)), 0)
+
+    def test_write_in_other_process_invalidates_feed(self):
+        """Пост, разложенный другим процессом, виден и здесь: массив
+        этого процесса перечитывается по новой метке"""
+        feed_ids(self.reader)
+        other = PackedIdCache('other-process', {})
+        with mock.patch.dict(caches._caches.caches, {'feeds': other}):
+            post = Post.objects.create(author=self.author,
+                                       text='Новый пост')
+        self.assertEqual(feed_ids(self.reader)[0], post.pk)
+
+    def test_deleted_post_does_not_shorten_page(self):
+        """Удалённый пост из старого массива не укорачивает страницу"""
+        ids = feed_ids(self.reader)
+        Post.objects.get(pk=ids[0]).delete()
+        paginator = CachedTimelinePaginator(self.reader.timeline.all(),
+                                            settings.CNT_POST, ids=ids)
+        page = paginator.get_cursor_page()
+        self.assertEqual(list(page), list(
+            Post.objects.order_by('-pub_date', '-id')[:settings.CNT_POST]))
+        self.assertNotIn(ids[0], feed_ids(self.reader))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_pulled_author_delete_keeps_feeds(self):
+        """Удаление поста pull-автора не сбрасывает ленты подписчиков"""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        stamp = cache.get(f'feed_stamp:{self.reader.pk}')
+        post.delete()
+        self.assertEqual(cache.get(f'feed_stamp:{self.reader.pk}'), stamp)
+
+    def test_page_is_hydrated_with_one_query(self):
+        """Страница из кэша — один запрос id__in"""
+        ids = feed_ids(self.reader)
+        paginator = CachedTimelinePaginator(self.reader.timeline.all(),
+                                            settings.CNT_POST, ids=ids)
+        with self.assertNumQueries(1):
+            first = paginator.get_cursor_page()
+        with self.assertNumQueries(1):
+            second = paginator.get_cursor_page(first.next_cursor)
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        self.assertEqual(list(first) + list(second), expected)
+
+    def test_follow_index_uses_cache(self):
+        """Лента подписок отдаёт те же посты, что и без кэша"""
+        response = self.client.get(reverse('posts:follow_index'))
+        expected = list(Post.objects.order_by('-pub_date', '-id')[:10])
+        self.assertEqual(list(response.context['page_obj']), expected)
+        with self.assertNumQueries(0):
+            feed_ids(self.reader)
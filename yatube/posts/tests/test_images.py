@@ -0,0 +1,116 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image, JpegImagePlugin
+
+from posts.forms import PostForm
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def upload(name, fmt, size=(60, 40), **params):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (255, 0, 0)).save(buffer, fmt, **params)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def rotated_jpeg(size=(600, 400)):
+    exif = Image.Exif()
+    # повернуть на 90° по часовой, плюс модель телефона
+    exif.update({0x0112: 6, 0x0110: 'Phone'})
+    return upload('photo.jpg', 'JPEG', size, exif=exif)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIDE=200)
+class UploadNormalizationTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def clean(self, image):
+        form = PostForm({'text': 'Пост'}, {'image': image})
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.cleaned_data['image']
+
+    def test_small_image_is_kept(self):
+        """Небольшая картинка без метаданных сохраняется байт в байт"""
+        image = upload('small.png', 'PNG')
+        content = image.read()
+        image.seek(0)
+        cleaned = self.clean(image)
+        self.assertEqual(cleaned.name, 'small.png')
+        self.assertEqual(cleaned.read(), content)
+
+    def test_downscale_rotate_strip(self):
+        """Большое фото уменьшается, поворачивается по EXIF и теряет
+        EXIF"""
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Пост', 'image': rotated_jpeg()})
+        post = Post.objects.get()
+        self.assertEqual(post.image.name, 'posts/photo.jpg')
+        with Image.open(post.image.path) as saved:
+            self.assertEqual(saved.format, 'JPEG')
+            self.assertEqual(saved.size, (133, 200))
+            self.assertNotIn('exif', saved.info)
+
+    def test_jpeg_decoded_in_draft_mode(self):
+        """JPEG декодируется сразу уменьшенным"""
+        draft = JpegImagePlugin.JpegImageFile.draft
+        with mock.patch.object(JpegImagePlugin.JpegImageFile, 'draft',
+                               autospec=True, side_effect=draft) as called:
+            self.clean(rotated_jpeg((1600, 1200)))
+        called.assert_called_once_with(mock.ANY, 'RGB', (200, 150))
+
+    def test_other_format_becomes_png(self):
+        """Большой GIF пересохраняется в PNG"""
+        cleaned = self.clean(upload('anim.gif', 'GIF', (400, 100)))
+        self.assertEqual(cleaned.name, 'anim.png')
+        with Image.open(cleaned) as saved:
+            self.assertEqual((saved.format, saved.size), ('PNG', (200, 50)))
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        """Картинка больше POST_IMAGE_MAX_PIXELS отклоняется до
+        декодирования"""
+        with mock.patch('posts.images.ImageOps.exif_transpose') as decode:
+            response = self.client.post(
+                reverse('posts:post_create'),
+                {'text': 'Пост', 'image': upload('big.png', 'PNG')})
+        decode.assert_not_called()
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка 60×40 слишком большая: можно не больше 0.001 '
+            'мегапикселей.')
+        self.assertFalse(Post.objects.exists())
+
+    def test_bench(self):
+        """Отчёт сравнивает оригиналы с приведёнными картинками"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        with open(os.path.join(tmp, 'photo.jpg'), 'wb') as photo:
+            photo.write(rotated_jpeg().read())
+        out = io.StringIO()
+        call_command('bench_uploads', tmp, stdout=out)
+        report = out.getvalue()
+        self.assertTrue(report.startswith('1 картинок: оригиналы'))
+        self.assertIn('из приведённой', report)
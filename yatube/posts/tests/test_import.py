@@ -0,0 +1,191 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from posts.models import AuthorStats, Follow, Group, Post, TimelineEntry
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImportPostsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        caches['feeds'].clear()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write(content)
+        return path
+
+    def jsonl(self, records):
+        return self.write('posts.jsonl', ''.join(
+            json.dumps(record, ensure_ascii=False) + '\n'
+            for record in records))
+
+    def run_import(self, *args, **options):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_posts', *args, stdout=stdout, stderr=stderr,
+                     **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_jsonl_import(self):
+        """Посты из JSONL сохраняются с датой, группой и счётчиками"""
+        path = self.jsonl([
+            {'author': 'author', 'text': f'Пост {i}', 'group': 'group',
+             'pub_date': f'2020-01-0{i + 1}T12:00:00'}
+            for i in range(5)
+        ])
+        self.run_import(path, batch_size=2)
+        posts = Post.objects.order_by('pub_date')
+        self.assertEqual([post.text for post in posts],
+                         [f'Пост {i}' for i in range(5)])
+        self.assertEqual(posts[0].pub_date, timezone.make_aware(
+            datetime(2020, 1, 1, 12)))
+        self.assertTrue(all(post.group == self.group for post in posts))
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 5)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.reader)
+                .values_list('post_id', flat=True)),
+            set(posts.values_list('pk', flat=True)))
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_csv_import(self):
+        """CSV читается по заголовку"""
+        path = self.write('posts.csv', 'author,text,group\n'
+                                       'author,"Пост, с запятой",\n')
+        self.run_import(path)
+        post = Post.objects.get()
+        self.assertEqual(post.text, 'Пост, с запятой')
+        self.assertIsNone(post.group)
+
+    def test_stdin_import(self):
+        """«-» читает записи из stdin"""
+        record = json.dumps({'author': 'author', 'text': 'Пост'})
+        stdin = mock.Mock(buffer=io.BytesIO(record.encode()))
+        with mock.patch('sys.stdin', stdin):
+            self.run_import('-')
+        self.assertEqual(Post.objects.get().text, 'Пост')
+
+    def test_bad_records_are_skipped(self):
+        """Ошибочные записи пропускаются с сообщением, остальные
+        импортируются"""
+        path = self.write('posts.jsonl', '\n'.join([
+            json.dumps({'author': 'author', 'text': 'Пост'}),
+            '{broken',
+            json.dumps({'author': 'nobody', 'text': 'Пост'}),
+            json.dumps({'author': 'author', 'text': ''}),
+            json.dumps({'author': 'author', 'text': 'Пост',
+                        'group': 'missing'}),
+        ]))
+        stdout, stderr = self.run_import(path)
+        self.assertEqual(Post.objects.count(), 1)
+        for number in (2, 3, 4, 5):
+            self.assertIn(f'Запись {number}:', stderr)
+        self.assertIn('импортировано 1, пропущено 4', stdout)
+
+    def test_other_record_types_are_skipped(self):
+        """Комментарии и подписки из выгрузки не становятся постами"""
+        path = self.jsonl([
+            {'type': 'post', 'author': 'author', 'text': 'Пост'},
+            {'type': 'comment', 'author': 'author', 'post': 1,
+             'text': 'Комментарий'},
+            {'type': 'follow', 'author': 'author'},
+        ])
+        stdout, stderr = self.run_import(path)
+        self.assertEqual(Post.objects.get().text, 'Пост')
+        self.assertIn('импортировано 1, пропущено 2', stdout)
+
+    def test_pub_date_field_is_not_patched(self):
+        """Импорт не трогает auto_now_add поля даты публикации"""
+        field = Post._meta.get_field('pub_date')
+        bulk_create = Post.objects.bulk_create
+        seen = []
+
+        def spy(*args, **kwargs):
+            seen.append(field.auto_now_add)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Post.objects, 'bulk_create', spy):
+            self.run_import(self.jsonl([
+                {'author': 'author', 'text': 'Пост',
+                 'pub_date': '2020-01-01T12:00:00'}]))
+        self.assertEqual(seen, [True])
+        self.assertEqual(Post.objects.get().pub_date,
+                         timezone.make_aware(datetime(2020, 1, 1, 12)))
+
+    def test_create_authors(self):
+        """С --create-authors неизвестный автор заводится без пароля"""
+        path = self.jsonl([{'author': 'newcomer', 'text': 'Пост'}])
+        self.run_import(path, create_authors=True)
+        newcomer = User.objects.get(username='newcomer')
+        self.assertFalse(newcomer.has_usable_password())
+        self.assertEqual(newcomer.posts.count(), 1)
+
+    def test_resume_from_checkpoint(self):
+        """Импорт продолжается с записи после сохранённой"""
+        path = self.jsonl([{'author': 'author', 'text': f'Пост {i}'}
+                           for i in range(5)])
+        self.write('posts.jsonl.checkpoint', '3')
+        stdout, _ = self.run_import(path)
+        self.assertIn('Продолжаем с записи 4', stdout)
+        self.assertEqual(sorted(Post.objects.values_list('text', flat=True)),
+                         ['Пост 3', 'Пост 4'])
+
+    def test_checkpoint_after_each_batch(self):
+        """После каждой пачки в checkpoint пишется число записей"""
+        path = self.jsonl([{'author': 'author', 'text': f'Пост {i}'}
+                           for i in range(5)])
+        saved = []
+        with mock.patch('posts.management.commands.import_posts.'
+                        'save_checkpoint',
+                        side_effect=lambda path, done: saved.append(done)):
+            self.run_import(path, batch_size=2)
+        self.assertEqual(saved, [2, 4, 5])
+
+    def test_images(self):
+        """Картинки копируются из каталога --images"""
+        images = os.path.join(self.tmp, 'images')
+        os.mkdir(images)
+        with open(os.path.join(images, 'cat.gif'), 'wb') as image:
+            image.write(b'GIF89a')
+        path = self.jsonl([
+            {'author': 'author', 'text': 'Пост', 'image': 'cat.gif'},
+            {'author': 'author', 'text': 'Пост', 'image': '../posts.jsonl'},
+        ])
+        _, stderr = self.run_import(path, images=images)
+        post = Post.objects.get()
+        self.assertEqual(post.image.name, 'posts/cat.gif')
+        self.assertTrue(os.path.exists(post.image.path))
+        self.assertIn('Запись 2: картинка вне каталога', stderr)
@@ -0,0 +1,173 @@
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+
+from posts.models import Post
+from posts.paginator import KeysetPaginator, decode_cursor
+
+
+User = get_user_model()
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.author)
+            for i in range(25)
+        )
+        # одинаковая дата у всех постов: порядок держится на id
+        Post.objects.update(pub_date=timezone.now())
+        cls.ordered = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.paginator = KeysetPaginator(Post.objects.all(),
+                                         settings.CNT_POST)
+
+    def test_pages_cover_feed_without_gaps(self):
+        """Курсоры обходят ленту без пропусков и повторов"""
+        page = self.paginator.get_cursor_page()
+        seen = list(page)
+        while page.has_next():
+            page = self.paginator.get_cursor_page(page.next_cursor)
+            seen.extend(page)
+        self.assertEqual(seen, self.ordered)
+        self.assertEqual(page.number, 3)
+
+    def test_previous_cursor_returns_same_page(self):
+        """Предыдущая страница по курсору совпадает с исходной"""
+        first = self.paginator.get_cursor_page()
+        second = self.paginator.get_cursor_page(first.next_cursor)
+        back = self.paginator.get_cursor_page(second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_old_page_links_resolve(self):
+        """?page=N по-прежнему открывает N-ю страницу"""
+        page = self.paginator.get_cursor_page(page_number='2')
+        self.assertEqual(list(page), self.ordered[10:20])
+        self.assertEqual(page.number, 2)
+        number = decode_cursor(page.next_cursor)[1]
+        self.assertEqual(number, 3)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        """Испорченный курсор отдаёт первую страницу"""
+        page = self.paginator.get_cursor_page('не-курсор')
+        self.assertEqual(list(page), self.ordered[:10])
+
+    def test_forged_cursor_falls_back_to_first_page(self):
+        """Курсор без подписи сайта не принимается"""
+        post = self.ordered[12]
+        raw = f'a|5|{post.pub_date.isoformat()}|{post.pk}'
+        page = self.paginator.get_cursor_page(
+            urlsafe_base64_encode(raw.encode()))
+        self.assertEqual(list(page), self.ordered[:10])
+
+    def test_clean_drops_bad_params(self):
+        """Испорченные параметры приводятся к первой странице"""
+        cursor = self.paginator.get_cursor_page().next_cursor
+        clean = self.paginator.clean
+        self.assertEqual(clean('не-курсор'), (None, None))
+        self.assertEqual(clean(None, 'abc'), (None, None))
+        self.assertEqual(clean(None, '1'), (None, None))
+        self.assertEqual(clean(None, '2'), (None, 2))
+        self.assertEqual(clean(cursor, '2'), (cursor, None))
+
+    def test_fragment_key_ignores_junk(self):
+        """Мусорные параметры не дают новых ключей фрагмента ленты"""
+        # у вошедшего пользователя страница целиком не кэшируется
+        self.client.force_login(self.author)
+        keys = {self.client.get(reverse('posts:index'), params)
+                .context['page_key']
+                for params in ({}, {'page': 'x'}, {'cursor': 'мусор'},
+                               {'page': '0'}, {'x': '1'})}
+        self.assertEqual(keys, {'1'})
+        keys = {self.client.get(reverse('posts:index'), {'page': page})
+                .context['page_key'] for page in ('4', '50', '1000')}
+        self.assertEqual(keys, {'last'})
+
+    def test_last_page(self):
+        """Последняя страница без OFFSET совпадает с ?page=N по номеру
+        и составу, а предыдущая за ней — с ?page=N-1"""
+        page = self.paginator.get_cursor_page('last')
+        self.assertEqual(page.number, 3)
+        self.assertEqual(list(page), self.ordered[20:])
+        self.assertEqual(list(page),
+                         list(self.paginator.get_cursor_page(
+                             page_number='3')))
+        self.assertFalse(page.has_next())
+        previous = self.paginator.get_cursor_page(page.previous_cursor)
+        self.assertEqual(previous.number, 2)
+        self.assertEqual(list(previous), self.ordered[10:20])
+
+    def test_page_without_count_query(self):
+        """Страница по курсору — один запрос, без COUNT(*)"""
+        cursor = self.paginator.get_cursor_page().next_cursor
+        with self.assertNumQueries(1):
+            list(self.paginator.get_cursor_page(cursor))
+
+    def test_index_renders_cursor_links(self):
+        """Шаблон выводит ссылку на следующую страницу по курсору"""
+        response = self.client.get(reverse('posts:index'))
+        page = response.context['page_obj']
+        self.assertContains(response, f'?cursor={page.next_cursor}')
+
+    @override_settings(PGN_ON_EACH_SIDE=1, PGN_ON_ENDS=1)
+    def test_elided_page_range(self):
+        """Окно номеров ограничено краями и соседями текущей страницы"""
+        paginator = KeysetPaginator(Post.objects.all(), 2)
+        self.assertEqual(list(paginator.get_elided_page_range(7)),
+                         [1, '…', 6, 7, 8, '…', 13])
+        self.assertEqual(list(paginator.get_elided_page_range(2)),
+                         [1, 2, 3, '…', 13])
+
+    def test_count_is_cached(self):
+        """COUNT(*) выполняется один раз на PGN_COUNT_TTL"""
+        self.assertEqual(self.paginator.count, 25)
+        Post.objects.create(text='Новый пост', author=self.author)
+        paginator = KeysetPaginator(Post.objects.all(), settings.CNT_POST)
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.count, 25)
+
+    @override_settings(PGN_ON_EACH_SIDE=1, PGN_ON_ENDS=1)
+    def test_template_renders_bounded_window(self):
+        """Шаблон не выводит ссылки на все страницы подряд"""
+        Post.objects.bulk_create(
+            Post(text=f'Ещё пост {i}', author=self.author)
+            for i in range(100)
+        )
+        response = self.client.get(reverse('posts:index'))
+        numbers = [number for number, _ in
+                   response.context['page_obj'].paginator.page_links(
+                       response.context['page_obj'])]
+        self.assertEqual(numbers, [1, 2, '…', 13])
+        self.assertContains(response, '?cursor=last')
+        self.assertNotContains(response, '?page=')
+
+    def test_window_links_match_page_numbers(self):
+        """Ссылки окна ведут по курсорам на те же страницы, что и
+        ?page=N, ни одна не идёт через OFFSET"""
+        Post.objects.bulk_create(
+            Post(text=f'Ещё пост {i}', author=self.author)
+            for i in range(40)
+        )
+        paginator = KeysetPaginator(Post.objects.all(), settings.CNT_POST)
+        for number in range(1, 8):
+            page = paginator.get_cursor_page(page_number=number)
+            for i, query in paginator.page_links(page):
+                if query is None:
+                    continue
+                self.assertNotIn('page=', query)
+                cursor = query.partition('cursor=')[2] or None
+                linked = paginator.get_cursor_page(cursor)
+                expected = paginator.get_cursor_page(page_number=i)
+                self.assertEqual((linked.number, list(linked)),
+                                 (i, list(expected)), (number, query))
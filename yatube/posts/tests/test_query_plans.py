@@ -0,0 +1,104 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+# «SCAN posts_post» без индекса — полный проход по таблице
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+( AS \S+)?$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+class QueryPlanTests(TestCase):
+    """Каждый запрос ленточных страниц идёт по индексу и без
+    сортировки во временном B-дереве."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        for i in range(25):
+            cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                           text=f'Пост {i}')
+        for i in range(25):
+            Comment.objects.create(post=cls.post, author=cls.reader,
+                                   text=f'Комментарий {i}')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def plans(self, url):
+        cache.clear()
+        caches['feeds'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                yield query['sql'], [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, url):
+        for sql, details in self.plans(url):
+            for detail in details:
+                with self.subTest(url=url, sql=sql, plan=detail):
+                    self.assertNotIn(TEMP_SORT, detail)
+                    self.assertIsNone(FULL_SCAN.match(detail))
+
+    def cursor_url(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        return f'{url}?cursor={response.context["page_obj"].next_cursor}'
+
+    def test_index(self):
+        url = reverse('posts:index')
+        for page in (url, f'{url}?page=2', f'{url}?cursor=last',
+                     self.cursor_url(url)):
+            self.assertIndexed(page)
+
+    def test_group_list(self):
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        for page in (url, f'{url}?cursor=last', self.cursor_url(url)):
+            self.assertIndexed(page)
+
+    def test_profile(self):
+        url = reverse('posts:profile',
+                      kwargs={'username': self.author.username})
+        for page in (url, f'{url}?page=2', self.cursor_url(url)):
+            self.assertIndexed(page)
+
+    def test_post_detail(self):
+        self.assertIndexed(reverse('posts:post_detail',
+                                   kwargs={'post_id': self.post.pk}))
+
+    @override_settings(CNT_COMMENT=10)
+    def test_post_comments(self):
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        cursor = self.client.get(url).context['comments_cursor']
+        for page in (url, f'{url}?cursor={cursor}'):
+            self.assertIndexed(page)
+
+    def test_follow_index(self):
+        url = reverse('posts:follow_index')
+        for page in (url, f'{url}?page=2', self.cursor_url(url)):
+            self.assertIndexed(page)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_follow_index_with_pulled_authors(self):
+        url = reverse('posts:follow_index')
+        for page in (url, f'{url}?page=2', self.cursor_url(url)):
+            self.assertIndexed(page)
@@ -0,0 +1,170 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import router
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from sorl.thumbnail.models import KVStore
+
+from core import routers
+from core.cache import generations
+from core.cache.pages import tag_page
+from core.middleware import ReplicaMiddleware
+from posts.management.commands import refresh_replica
+from posts.models import Post
+
+User = get_user_model()
+
+
+@override_settings(REPLICA_MAX_LAG=30)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        patchers = [
+            mock.patch('core.routers.replica_configured', return_value=True),
+            mock.patch('core.routers.replica_refreshed_at',
+                       return_value=time.time() - 5),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.routed = []
+
+    def view(self, write=False):
+        def view(request):
+            self.routed.append(router.db_for_read(Post))
+            if write:
+                router.db_for_write(Post)
+                self.routed.append(router.db_for_read(Post))
+            return HttpResponse()
+        return view
+
+    def call(self, view, request=None):
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        middleware = ReplicaMiddleware(get_response)
+        return middleware(request or self.factory.get('/'))
+
+    def test_replica_safe_view_reads_replica(self):
+        """Помеченная вьюха читает с реплики"""
+        self.call(routers.replica_safe(self.view()))
+        self.assertEqual(self.routed, [routers.REPLICA])
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_other_views_read_primary(self):
+        """Непомеченные вьюхи читают с основной БД"""
+        self.call(self.view())
+        self.assertEqual(self.routed, ['default'])
+
+    def test_write_sticks_to_primary(self):
+        """После записи чтения запроса и клиента идут на основную БД"""
+        response = self.call(routers.replica_safe(self.view(write=True)))
+        self.assertEqual(self.routed, [routers.REPLICA, 'default'])
+        cookie = response.cookies[routers.PIN_COOKIE]
+        request = self.factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = cookie.value
+        self.routed.clear()
+        self.call(routers.replica_safe(self.view()), request)
+        self.assertEqual(self.routed, ['default'])
+
+    def test_pin_expires_after_refresh(self):
+        """Обновлённая после записи реплика снова обслуживает клиента"""
+        request = self.factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = str(time.time() - 10)
+        self.call(routers.replica_safe(self.view()), request)
+        self.assertEqual(self.routed, [routers.REPLICA])
+
+    @override_settings(REPLICA_MAX_LAG=1)
+    def test_lagging_replica_is_skipped(self):
+        """Реплика старше REPLICA_MAX_LAG не используется"""
+        self.call(routers.replica_safe(self.view()))
+        self.assertEqual(self.routed, ['default'])
+
+
+class RefreshReplicaTests(TestCase):
+    def test_backup_copies_primary(self):
+        """refresh_replica копирует основную БД в файл реплики"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        primary = os.path.join(tmp, 'primary.db')
+        replica = os.path.join(tmp, 'replica.db')
+        with sqlite3.connect(primary) as db:
+            db.execute('CREATE TABLE post (text TEXT)')
+            db.execute("INSERT INTO post VALUES ('Пост')")
+        databases = mock.Mock(databases={'default': {'NAME': primary},
+                                         routers.REPLICA: {'NAME': replica}})
+        started = time.time()
+        with mock.patch.object(refresh_replica, 'connections', databases), \
+                mock.patch('core.routers.connections', databases):
+            refresh_replica.refresh()
+            refreshed = routers.replica_refreshed_at()
+        with sqlite3.connect(replica) as db:
+            rows = db.execute('SELECT text FROM post').fetchall()
+        self.assertEqual(rows, [('Пост',)])
+        self.assertTrue(started <= refreshed <= time.time())
+
+
+@override_settings(REPLICA_SETTLE=1)
+class ReplicaCachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        routers.start_request()
+        routers.use_replica()
+        self.addCleanup(routers.start_request)
+        generations.bump('posts')
+
+    def tag(self, refreshed):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with mock.patch('core.routers.replica_refreshed_at',
+                        return_value=refreshed):
+            tag_page(request, 'posts')
+        return request
+
+    def test_lagging_replica_render_is_not_cached(self):
+        """Реплика, не догнавшая поколения, не попадает ни в кэш
+        страниц, ни в ETag, ни в кэш фрагментов"""
+        request = self.tag(time.time() - 5)
+        self.assertFalse(routers.reading_replica())
+        self.assertFalse(routers.caching_allowed())
+        self.assertIsNone(request.page_etag)
+        self.assertFalse(request.page_cache_versions)
+        template = Template('{% load fragment_cache %}'
+                            '{% cache 60 frag %}{{ text }}{% endcache %}')
+        self.assertEqual(template.render(Context({'text': 'старое'})),
+                         'старое')
+        routers.start_request()
+        self.assertEqual(template.render(Context({'text': 'новое'})),
+                         'новое')
+
+    def test_fresh_replica_render_is_cached(self):
+        """Реплика, обновлённая после сброса поколения, кэшируется"""
+        request = self.tag(time.time() + 5)
+        self.assertTrue(routers.reading_replica())
+        self.assertTrue(routers.caching_allowed())
+        self.assertIsNotNone(request.page_etag)
+
+    def test_related_managers_follow_primary(self):
+        """После use_primary() связанные менеджеры объекта, прочитанного
+        с реплики, читают и пишут в основную БД"""
+        author = User.objects.create_user(username='author')
+        # как будто автор прочитан с реплики
+        author._state.db = routers.REPLICA
+        routers.use_primary()
+        self.assertEqual(author.posts.all().db, 'default')
+        self.assertEqual(router.db_for_write(Post, instance=author),
+                         'default')
+
+    def test_thumbnail_state_reads_primary(self):
+        """Состояние миниатюр читается с основной БД и на реплике"""
+        self.assertEqual(router.db_for_read(KVStore), 'default')
+        self.assertEqual(router.db_for_read(Post), routers.REPLICA)
@@ -0,0 +1,157 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.management.commands._fixtures import fill_posts
+from posts.models import Post
+
+User = get_user_model()
+
+
+class StemTests(TestCase):
+    def test_stem(self):
+        """Окончания отбрасываются, короткие слова не трогаются"""
+        for word, stem in (('котами', 'кот'), ('коты', 'кот'),
+                           ('собака', 'собак'), ('учиться', 'учи'),
+                           ('дом', 'дом')):
+            with self.subTest(word=word):
+                self.assertEqual(search.stem(word), stem)
+
+    def test_match_expression(self):
+        """Синтаксис FTS5 из запроса не проходит, слова идут через AND"""
+        self.assertEqual(
+            search.match_expression('Котами" OR NEAR(', stemming=False),
+            '"котами" "or" "near"')
+        self.assertEqual(search.match_expression('ёлки 2020',
+                                                 stemming=True),
+                         '"елк"* "2020"')
+        self.assertEqual(search.match_expression('?!'), '')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.cats = Post.objects.create(author=self.author,
+                                        text='Коты и кот. Про котов')
+        self.cat = Post.objects.create(author=self.author,
+                                       text='Один кот гуляет')
+        self.tree = Post.objects.create(author=self.author,
+                                        text='Ёлка в лесу')
+        self.client = Client()
+
+    def found(self, query):
+        return list(search.search(query))
+
+    def test_ranking(self):
+        """Пост, где слово встречается чаще, выше"""
+        self.assertEqual(self.found('котами'), [self.cats, self.cat])
+
+    def test_yo(self):
+        """«ё» и «е» не различаются"""
+        self.assertEqual(self.found('елка'), [self.tree])
+        self.assertEqual(self.found('ЁЛКИ'), [self.tree])
+
+    @override_settings(SEARCH_STEMMING=False)
+    def test_without_stemming(self):
+        """Без стемминга ищется только точная словоформа"""
+        self.assertEqual(self.found('котами'), [])
+        self.assertEqual(self.found('кот'), [self.cat, self.cats])
+
+    def test_index_follows_changes(self):
+        """Триггеры обновляют индекс при правке, удалении и сырой
+        вставке"""
+        self.cat.text = 'Одна собака гуляет'
+        self.cat.save()
+        self.assertEqual(self.found('собаки'), [self.cat])
+        self.assertEqual(self.found('кот'), [self.cats])
+        self.cats.delete()
+        self.assertEqual(self.found('кот'), [])
+        fill_posts(3, author=self.author, text='Бегемот')
+        self.assertEqual(len(self.found('бегемоты')), 3)
+
+    def test_rebuild(self):
+        """Пересборка пачками восстанавливает индекс"""
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.FTS_TABLE}"
+                           f"({search.FTS_TABLE}) VALUES ('delete-all')")
+        self.assertEqual(self.found('кот'), [])
+        call_command('rebuild_search', chunk=1, stdout=StringIO())
+        self.assertEqual(self.found('кот'), [self.cats, self.cat])
+        self.assertEqual(self.found('ёлка'), [self.tree])
+
+    def test_rebuild_follows_concurrent_writes(self):
+        """Правки, удаления и новые посты во время пересборки попадают
+        в подменённый индекс"""
+        extra = Post.objects.create(author=self.author, text='Лиса')
+
+        def write(done, top):
+            if done != 1:
+                return
+            # cats уже в теневом индексе, extra — ещё нет
+            Post.objects.filter(pk=self.cats.pk).update(text='Жираф')
+            Post.objects.filter(pk=extra.pk).update(text='Волк')
+            self.tree.delete()
+            Post.objects.create(author=self.author, text='Сова')
+
+        search.rebuild_index(connection, chunk=1, report=write)
+        self.assertEqual(self.found('жираф'), [self.cats])
+        self.assertEqual(self.found('кот'), [self.cat])
+        self.assertEqual(self.found('волк'), [extra])
+        self.assertEqual(self.found('лиса'), [])
+        self.assertEqual(self.found('елка'), [])
+        self.assertEqual(len(self.found('сова')), 1)
+        self.assertEqual(search.missing_triggers(connection), [])
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+            cursor.execute(f"INSERT INTO {search.FTS_TABLE}"
+                           f"({search.FTS_TABLE}, rank) "
+                           f"VALUES ('integrity-check', 1)")
+        self.assertNotIn(search.SHADOW_TABLE, tables)
+
+    def test_triggers_exist(self):
+        """Триггеры индекса на месте после всех миграций"""
+        self.assertEqual(search.missing_triggers(connection), [])
+
+    def test_lost_triggers_are_restored(self):
+        """post_migrate возвращает потерянные триггеры и догоняет
+        индекс"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {search.FTS_TABLE}_update')
+        self.assertEqual(search.missing_triggers(connection),
+                         [f'{search.FTS_TABLE}_update'])
+        Post.objects.filter(pk=self.cat.pk).update(text='Собака гуляет')
+        emit_post_migrate_signal(0, False, 'default')
+        self.assertEqual(search.missing_triggers(connection), [])
+        self.assertEqual(self.found('собака'), [self.cat])
+        self.assertEqual(self.found('кот'), [self.cats])
+
+    def test_search_view(self):
+        """Страница поиска показывает найденные посты постранично"""
+        fill_posts(15, author=self.author, text='Бегемот')
+        url = reverse('posts:search')
+        response = self.client.get(url, {'q': 'бегемот'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, 15)
+        self.assertEqual(len(page_obj), 10)
+        self.assertContains(response, 'page=2')
+        response = self.client.get(url, {'q': 'бегемот', 'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 5)
+        response = self.client.get(url, {'q': '???'})
+        self.assertContains(response, 'Ничего не найдено')
+
+    def test_admin_uses_index(self):
+        """Поиск в админке идёт по FTS5, а не по LIKE"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'котов'})
+        self.assertEqual(set(response.context['cl'].result_list),
+                         {self.cats, self.cat})
@@ -0,0 +1,168 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from core.cache import generations
+from core.cache.sqlite import SQLiteCache
+from core.cache.tiered import TieredCache
+
+
+def bump(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'test.cache.sqlite3')
+        self.cache = SQLiteCache(self.path, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_values_are_shared_between_instances(self):
+        """Запись одного экземпляра видна другому, как другому воркеру"""
+        self.cache.set('fragment', {'html': '<p>пост</p>'})
+        other = SQLiteCache(self.path, {})
+        self.assertEqual(other.get('fragment'), {'html': '<p>пост</p>'})
+        other.delete('fragment')
+        self.assertIsNone(self.cache.get('fragment'))
+
+    def test_ttl(self):
+        """Просроченная запись не отдаётся, и add может её перезаписать"""
+        with mock.patch('core.cache.sqlite.time.time', return_value=1000):
+            self.cache.set('key', 'value', 10)
+            self.assertFalse(self.cache.add('key', 'other'))
+        with mock.patch('core.cache.sqlite.time.time', return_value=1011):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertFalse(self.cache.has_key('key'))
+            self.assertTrue(self.cache.add('key', 'other'))
+            self.assertEqual(self.cache.get('key'), 'other')
+
+    def test_lru_eviction_under_size_cap(self):
+        """При превышении MAX_BYTES вытесняются давно не читанные"""
+        cache = SQLiteCache(self.path, {'OPTIONS': {'MAX_BYTES': 2500,
+                                                    'CULL_BATCH': 1}})
+        with mock.patch('core.cache.sqlite.time.time') as now:
+            now.return_value = 1000
+            cache.set('a', 'x' * 1000)
+            cache.set('b', 'x' * 1000)
+            now.return_value = 1010
+            cache.get('a')
+            cache.set('c', 'x' * 1000)
+            self.assertIsNone(cache.get('b'))
+            self.assertIsNotNone(cache.get('a'))
+        self.assertLessEqual(cache.stats()['bytes'], 2500)
+
+    def test_get_many_and_set_many(self):
+        """Пакетные операции — по одному запросу на пачку ключей"""
+        self.cache.set_many({'a': 1, 'b': [2]})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': [2]})
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+    def test_incr_is_atomic_across_processes(self):
+        """incr из нескольких процессов не теряет приращений"""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=bump, args=(self.path, 200))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 800)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+
+class TieredCacheTests(TestCase):
+    OPTIONS = {'L2': 'default', 'L1_TTL': 5, 'POLL_INTERVAL': 1,
+               'L1_MAX_ENTRIES': 3, 'L1_EXCLUDE': ('stats:',)}
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('core.cache.tiered.time.monotonic',
+                             return_value=100.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        # два экземпляра над одним L2 — как два воркера
+        self.first = TieredCache('', {'OPTIONS': self.OPTIONS})
+        self.second = TieredCache('', {'OPTIONS': self.OPTIONS})
+
+    def test_hot_key_is_served_from_l1_not_longer_than_ttl(self):
+        """Запись читается из памяти процесса, но не дольше L1_TTL"""
+        self.first.set('card', 'html')
+        cache.delete('card')
+        self.assertEqual(self.first.get('card'), 'html')
+        self.clock.return_value = 106.0
+        self.assertIsNone(self.first.get('card'))
+
+    def test_incr_in_other_process_invalidates_l1(self):
+        """Сброс поколения в одном процессе виден другому не позже
+        чем через POLL_INTERVAL"""
+        self.first.add('gen:posts', 5, None)
+        self.assertEqual(self.second.get('gen:posts'), 5)
+        self.first.incr('gen:posts')
+        self.assertEqual(self.second.get('gen:posts'), 5)
+        self.clock.return_value = 101.5
+        self.assertEqual(self.second.get('gen:posts'), 6)
+        self.assertEqual(self.first.get('gen:posts'), 6)
+
+    def test_invalidation_is_scoped_to_changed_keys(self):
+        """Сброс одного ключа не выбрасывает из L1 других процессов
+        остальные ключи"""
+        self.second.set('card', 'html')
+        self.first.add('gen:posts', 5, None)
+        self.assertEqual(self.second.get('gen:posts'), 5)
+        cache.set('card', 'new html')
+        self.first.incr('gen:posts')
+        self.clock.return_value = 101.5
+        self.assertEqual(self.second.get('gen:posts'), 6)
+        self.assertEqual(self.second.get('card'), 'html')
+
+    def test_lost_log_entry_clears_l1(self):
+        """Если запись журнала пропала, L1 очищается целиком"""
+        self.second.set('card', 'html')
+        cache.set('card', 'new html')
+        self.first.delete('other')
+        cache.delete(f'l1_log:{cache.get("l1_log")}')
+        self.clock.return_value = 101.5
+        self.assertEqual(self.second.get('card'), 'new html')
+
+    def test_post_create_bound_is_poll_interval(self):
+        """Новый пост сбрасывает поколение ленты во всех процессах"""
+        with mock.patch.object(generations, 'cache', self.first):
+            before = generations.generation('posts')
+        with mock.patch.object(generations, 'cache', self.second):
+            self.assertEqual(generations.generation('posts'), before)
+            generations.bump('posts')
+        self.clock.return_value = 101.5
+        with mock.patch.object(generations, 'cache', self.first):
+            self.assertNotEqual(generations.generation('posts'), before)
+
+    def test_l1_is_bounded(self):
+        """L1 держит не больше L1_MAX_ENTRIES записей"""
+        self.first.set_many({f'key{i}': i for i in range(5)})
+        self.assertEqual(self.first.stats()['l1_entries'], 3)
+        self.assertEqual(self.first.get_many(['key0', 'key4']),
+                         {'key0': 0, 'key4': 4})
+
+    def test_excluded_keys_skip_l1(self):
+        """Счётчики статистики не кэшируются в процессе и не пишутся
+        в журнал сбросов"""
+        self.first.set('stats:hits', 1)
+        cache.incr('stats:hits')
+        self.assertEqual(self.first.get('stats:hits'), 2)
+        self.assertEqual(self.first.stats()['l1_entries'], 0)
+        log = cache.get('l1_log')
+        self.first.incr('stats:hits')
+        self.assertEqual(cache.get('l1_log'), log)
@@ -0,0 +1,99 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.cache import stampede
+from posts.models import Post
+
+
+User = get_user_model()
+
+
+class FetchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(return_value='новое')
+
+    def test_cached_value_is_not_recomputed(self):
+        """Свежая запись отдаётся без пересчёта"""
+        self.assertEqual(stampede.fetch('key', self.compute, 60), 'новое')
+        self.assertEqual(stampede.fetch('key', self.compute, 60), 'новое')
+        self.assertEqual(self.compute.call_count, 1)
+
+    def test_waiters_get_stale_value(self):
+        """Пока пересчитывает другой процесс, отдаётся старое значение"""
+        cache.set('key', stampede.envelope('старое', -1, 0))
+        stampede.acquire('key')
+        self.assertEqual(stampede.fetch('key', self.compute, 60), 'старое')
+        self.compute.assert_not_called()
+        stampede.release('key')
+        self.assertEqual(stampede.fetch('key', self.compute, 60), 'новое')
+
+    def test_new_version_falls_back_to_stale_key(self):
+        """Новую версию фрагмента ждут со старой версией"""
+        cache.set('stale', stampede.envelope('старое', 60, 0))
+        stampede.acquire('v2')
+        value = stampede.fetch('v2', self.compute, 60, stale_key='stale')
+        self.assertEqual(value, 'старое')
+        self.compute.assert_not_called()
+
+    @override_settings(STAMPEDE_WAIT=0)
+    def test_nothing_to_serve_computes_after_wait(self):
+        """Без старого значения ожидание ограничено STAMPEDE_WAIT"""
+        stampede.acquire('key')
+        self.assertEqual(stampede.fetch('key', self.compute, 60), 'новое')
+        self.assertTrue(cache.get(stampede.LOCK_PREFIX + 'key'))
+
+    def test_early_refresh_near_expiry(self):
+        """Ближе к концу срока запись пересчитывается заранее"""
+        entry = stampede.envelope('старое', 60, 1)
+        entry['expires'] = time.time() + 0.5
+        with mock.patch('core.cache.stampede.random.random',
+                        return_value=0.99):
+            self.assertTrue(stampede.should_refresh(entry))
+        with mock.patch('core.cache.stampede.random.random',
+                        return_value=0.0):
+            self.assertFalse(stampede.should_refresh(entry))
+
+
+class StaleWhileRevalidateTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.post = Post.objects.create(author=cls.author, text='Старый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    def test_fragment_rebuild_serves_previous_version(self):
+        """Пока новый фрагмент рендерит другой запрос, отдаётся прежний"""
+        url = reverse('posts:index')
+        self.authorized_client.get(url)
+        Post.objects.create(author=self.author, text='Новый пост')
+        with mock.patch('core.cache.stampede.acquire', return_value=False):
+            response = self.authorized_client.get(url)
+        self.assertContains(response, 'Старый пост')
+        self.assertNotContains(response, 'Новый пост')
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Новый пост')
+
+    def test_page_rebuild_serves_stale_page(self):
+        """Устаревшую страницу перерисовывает один запрос"""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        Post.objects.create(author=self.author, text='Новый пост')
+        with mock.patch('core.cache.stampede.acquire', return_value=False):
+            response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+        self.assertNotContains(response, 'Новый пост')
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Новый пост')
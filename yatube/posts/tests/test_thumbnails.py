@@ -0,0 +1,302 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts import caching, thumbnails
+from posts.models import Post, ThumbnailJob
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+PLACEHOLDER = 'Картинка обрабатывается'
+
+
+def png(name='image.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 50), (255, 0, 0)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=True)
+class ThumbnailQueueTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def create_post(self):
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Пост', 'image': png()})
+        return Post.objects.get()
+
+    def detail(self, post):
+        return self.client.get(reverse('posts:post_detail',
+                                       kwargs={'post_id': post.pk}))
+
+    def work(self):
+        call_command('thumbnail_worker', once=True, stdout=io.StringIO(),
+                     stderr=io.StringIO())
+
+    def test_upload_enqueues_and_shows_placeholder(self):
+        """Загрузка картинки ставит задание, а страница не делает
+        миниатюру сама"""
+        post = self.create_post()
+        self.assertTrue(ThumbnailJob.objects.filter(post=post).exists())
+        response = self.detail(post)
+        self.assertContains(response, PLACEHOLDER)
+        self.assertIsNone(thumbnails.ready(post.image))
+
+    def test_worker_makes_thumbnail(self):
+        """Воркер делает миниатюру, и страница её показывает"""
+        post = self.create_post()
+        self.detail(post)
+        self.work()
+        self.assertFalse(ThumbnailJob.objects.exists())
+        image = thumbnails.ready(post.image)
+        self.assertIsNotNone(image)
+        self.assertEqual((image.width, image.height), (960, 339))
+        self.assertGreater(Post.objects.get().updated_at, post.updated_at)
+        response = self.detail(post)
+        self.assertNotContains(response, PLACEHOLDER)
+        self.assertContains(response, image.url)
+
+    def test_picture_variants(self):
+        """Воркер делает все ширины и форматы, а страница отдаёт их
+        через <picture> и srcset"""
+        post = self.create_post()
+        self.work()
+        picture = thumbnails.pictures([post.image])[0]
+        self.assertEqual(picture.img.name, thumbnails.ready(post.image).name)
+        self.assertEqual(len(picture.srcset.split(', ')),
+                         len(thumbnails.WIDTHS))
+        self.assertIn(('image/webp', mock.ANY), picture.sources)
+        for _, srcset in picture.sources:
+            self.assertIn('320w', srcset)
+            self.assertIn('960w', srcset)
+        response = self.detail(post)
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, picture.srcset)
+
+    def test_old_picture_without_variants(self):
+        """Картинка, у которой есть только старая миниатюра CARD,
+        показывается без srcset новых форматов"""
+        post = self.create_post()
+        with mock.patch.object(thumbnails, 'SIZES', (thumbnails.CARD,)):
+            self.work()
+        picture = thumbnails.pictures([post.image])[0]
+        self.assertEqual(picture.sources, [])
+        self.assertEqual(picture.srcset, f'{picture.img.url} 960w')
+
+    def test_edit_without_new_image_does_not_enqueue(self):
+        """Правка текста без новой картинки задание не ставит"""
+        post = self.create_post()
+        self.work()
+        self.client.post(reverse('posts:post_edit',
+                                 kwargs={'post_id': post.pk}),
+                         {'text': 'Новый текст'})
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    def test_broken_image_gives_up(self):
+        """Битая картинка после MAX_ATTEMPTS попыток остаётся отметкой:
+        карточка выходит без заглушки, а GET ничего не пишет в очередь"""
+        post = Post.objects.create(
+            author=self.author, text='Пост',
+            image=SimpleUploadedFile('broken.png', b'not an image'))
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            self.work()
+        job = ThumbnailJob.objects.get(post=post)
+        self.assertEqual(job.attempts, thumbnails.MAX_ATTEMPTS)
+        self.assertIsNone(thumbnails.claim())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.detail(post)
+        self.assertNotContains(response, PLACEHOLDER)
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('INSERT')])
+        self.assertEqual(ThumbnailJob.objects.get(post=post).attempts,
+                         thumbnails.MAX_ATTEMPTS)
+        self.assertEqual(thumbnails.stats()['given_up'], 1)
+
+    def test_lost_job_is_requeued(self):
+        """Шаблон досылает задание, если миниатюры нет и задания тоже"""
+        post = self.create_post()
+        ThumbnailJob.objects.all().delete()
+        self.detail(post)
+        self.assertTrue(ThumbnailJob.objects.filter(post=post).exists())
+
+    def test_status(self):
+        """Глубина очереди и задержка видны на /status/"""
+        self.create_post()
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        data = json.loads(self.client.get(reverse('status')).content)
+        self.assertEqual(data['thumbnails']['depth'], 1)
+        self.work()
+        data = json.loads(self.client.get(reverse('status')).content)
+        self.assertEqual(data['thumbnails']['depth'], 0)
+        self.assertEqual(data['thumbnails']['done'], 1)
+        self.assertIsNotNone(data['thumbnails']['avg_latency_ms'])
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_sync_mode(self):
+        """С THUMBNAIL_ASYNC = False миниатюра делается в запросе, а
+        очередь не растёт"""
+        post = self.create_post()
+        self.assertNotContains(self.detail(post), PLACEHOLDER)
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_sync_mode_decodes_once(self):
+        """В синхронном режиме все SIZES делаются из одного
+        декодирования, а готовая карточка больше не декодируется"""
+        post = self.create_post()
+        engine = thumbnails.default.engine
+        with mock.patch.object(engine, 'get_image',
+                               wraps=engine.get_image) as decode:
+            picture = thumbnails.pictures([post.image])[0]
+            self.assertEqual(decode.call_count, 1)
+            self.assertIn(('image/webp', mock.ANY), picture.sources)
+            self.assertIsNotNone(thumbnails.ready(post.image))
+            self.assertEqual(decode.call_count, 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=True)
+class RegenerateThumbnailsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        self.posts = [Post.objects.create(author=author, text='Пост',
+                                          image=png())
+                      for _ in range(3)]
+        self.broken = Post.objects.create(
+            author=author, text='Пост',
+            image=SimpleUploadedFile('broken.png', b'not an image'))
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.checkpoint = os.path.join(tmp, 'regenerate.checkpoint')
+
+    def regenerate(self):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('regenerate_thumbnails', workers=2, batch_size=2,
+                     checkpoint=self.checkpoint, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_regenerate(self):
+        """Пул делает миниатюры всех постов, kvstore заполняется, очередь
+        и файл прогресса очищаются"""
+        out, err = self.regenerate()
+        for post in self.posts:
+            image = thumbnails.ready(post.image)
+            self.assertIsNotNone(image)
+            self.assertEqual((image.width, image.height), (960, 339))
+            self.assertTrue(image.exists())
+        self.assertIn('картинок/с', out)
+        self.assertIn(f'Пост {self.broken.pk}', err)
+        self.assertEqual(list(ThumbnailJob.objects.values_list(
+            'post_id', flat=True)), [self.broken.pk])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_new_size(self):
+        """Новый размер в SIZES появляется у всех картинок"""
+        size = ('40x40', {'crop': 'center'})
+        with mock.patch.object(thumbnails, 'SIZES', (thumbnails.CARD, size)):
+            self.regenerate()
+        image = thumbnails.ready(self.posts[0].image, size)
+        self.assertEqual((image.width, image.height), (40, 40))
+
+    def test_resume(self):
+        """После обрыва работа продолжается с поста после сохранённого"""
+        with open(self.checkpoint, 'w') as checkpoint:
+            checkpoint.write(str(self.posts[1].pk))
+        out, _ = self.regenerate()
+        self.assertIn(f'Продолжаем после поста {self.posts[1].pk}', out)
+        self.assertIsNone(thumbnails.ready(self.posts[0].image))
+        self.assertIsNotNone(thumbnails.ready(self.posts[2].image))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=True)
+class PrefetchTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        self.posts = [Post.objects.create(author=author, text='Пост',
+                                          image=png())
+                      for _ in range(settings.CNT_POST)]
+        call_command('thumbnail_worker', once=True, stdout=io.StringIO())
+        cache.clear()
+        self.client = Client()
+
+    def kvstore_queries(self):
+        caching.invalidate_posts(self.posts)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.content.decode().count('card-img my-2" src'),
+                         settings.CNT_POST)
+        return [query for query in queries.captured_queries
+                if 'thumbnail_kvstore' in query['sql']]
+
+    def test_one_lookup_per_page(self):
+        """Миниатюры всей страницы — один запрос к kvstore, дальше из
+        кэша"""
+        self.assertEqual(len(self.kvstore_queries()), 1)
+        self.assertEqual(self.kvstore_queries(), [])
+
+    def test_missing_is_not_cached(self):
+        """Отсутствие миниатюры не запоминается: миниатюру, записанную
+        другим процессом мимо нашего кэша, видно сразу"""
+        post = self.posts[0]
+        key = add_prefix(thumbnails.ready(post.image).key)
+        row = KVStore.objects.get(key=key)
+        row.delete()
+        cache.clear()
+        self.assertIsNone(thumbnails.ready(post.image))
+        KVStore.objects.create(key=key, value=row.value)
+        self.assertIsNotNone(thumbnails.ready(post.image))
+
+
+class BenchThumbnailsTests(TestCase):
+    def test_report(self):
+        """Отчёт сравнивает размеры всех форматов с нынешним JPEG"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        with open(os.path.join(tmp, 'image.png'), 'wb') as image:
+            image.write(png().read())
+        out = io.StringIO()
+        call_command('bench_thumbnails', tmp, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('1 картинок'))
+        self.assertTrue(lines[2].startswith('JPEG'))
+        self.assertIn('( 100%)', lines[2])
+        self.assertEqual(len(lines), 3 + len(thumbnails.FORMATS))
@@ -0,0 +1,127 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Follow, Post, TimelineEntry
+from posts.paginator import TimelinePaginator
+from posts.timeline import follow_feed, is_pulled, resumable
+
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(author=cls.author,
+                                           text='Старый пост')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed(self):
+        response = self.client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_backfills_timeline(self):
+        """Подписка досыпает в ленту старые посты автора"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=self.old_post).exists())
+        self.assertEqual(self.feed(), [self.old_post])
+
+    def test_new_post_fans_out(self):
+        """Новый пост раскладывается в ленты подписчиков"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.feed(), [post, self.old_post])
+
+    def test_unfollow_prunes_timeline(self):
+        """Отписка вычищает посты автора из ленты"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.filter(user=self.reader, author=self.author).delete()
+        self.assertFalse(self.reader.timeline.exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_popular_author_is_pulled_on_read(self):
+        """Посты популярного автора не раскладываются, а читаются
+        напрямую и сливаются с материализованной лентой"""
+        fan = User.objects.create_user(username='fan')
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=other)
+        other_post = Post.objects.create(author=other, text='Пост')
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            post=other_post).exists())
+        self.assertEqual(self.feed(), [post, other_post, self.old_post])
+
+    def test_feed_page_is_single_query(self):
+        """Страница ленты без pull-авторов — один запрос"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        entries, pulled = follow_feed(self.reader)
+        self.assertIsNone(pulled)
+        with self.assertNumQueries(1):
+            page = TimelinePaginator(
+                entries, settings.CNT_POST).get_cursor_page()
+            self.assertEqual(page[0].author, self.author)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=3, TIMELINE_FANOUT_GAP=1)
+    def test_author_back_under_limit_is_fanned_out(self):
+        """Отписка не досыпает ленты сама: автор остаётся в pull-режиме
+        до порога с запасом, а посты, опубликованные в нём, досыпает
+        timeline_worker"""
+        fans = [User.objects.create_user(username=f'fan{i}')
+                for i in range(2)]
+        for user in fans + [self.reader]:
+            Follow.objects.create(user=user, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        for fan in fans:
+            Follow.objects.filter(user=fan).delete()
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertTrue(is_pulled(self.author.pk))
+        self.assertEqual(self.feed(), [post, self.old_post])
+        call_command('timeline_worker', once=True, stdout=StringIO())
+        self.assertFalse(is_pulled(self.author.pk))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(self.feed(), [post, self.old_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=3, TIMELINE_FANOUT_GAP=1)
+    def test_author_at_limit_keeps_mode(self):
+        """Подписка и отписка у самого порога не переключают режим"""
+        fans = [User.objects.create_user(username=f'fan{i}')
+                for i in range(2)]
+        for user in fans + [self.reader]:
+            Follow.objects.create(user=user, author=self.author)
+        Follow.objects.filter(user=fans[0]).delete()
+        self.assertEqual(list(resumable()), [])
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_pulled_authors_use_stored_counter(self):
+        """Pull-авторы определяются по AuthorStats, без подсчёта
+        подписок при каждом чтении ленты"""
+        fan = User.objects.create_user(username='fan')
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            _, pulled = follow_feed(self.reader)
+        self.assertEqual(len(pulled), 1)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
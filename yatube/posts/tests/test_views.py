@@ -1,15 +1,21 @@
 import shutil
 import tempfile
+import time
+from http import HTTPStatus
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils.http import http_date
 from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.core.cache import cache
+from django.core.cache import cache, caches
 
+from posts import caching
 from posts.models import Post, Group, Follow, Comment
+from posts.templatetags.card_tags import post_cards
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -308,6 +314,7 @@ class CacheTest(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.guest_client = Client()
         self.user = User.objects.create_user(username='Name')
@@ -316,14 +323,275 @@ class CacheTest(TestCase):
 
     def test_cache_index_page(self):
         first_case = self.authorized_client.get(reverse('posts:index'))
-        post = Post.objects.get(id=self.post.id)
-        post.delete()
+        # update() не шлёт сигналов, поэтому версия кэша не меняется
+        Post.objects.filter(id=self.post.id).update(text='Другой текст')
         second_case = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(first_case.content, second_case.content)
         cache.clear()
         third_case = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(first_case.content, third_case.content)
 
+    def test_index_cache_hit_skips_feed_queries(self):
+        """При попадании в кэш фрагмента главной страницы остаются
+        только сессия и пользователь: ленивая страница не читается"""
+        self.authorized_client.get(reverse('posts:index'))
+        with self.assertNumQueries(2):
+            response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.text)
+
+    def test_group_cache_hit_skips_feed_queries(self):
+        """На странице группы при попадании в кэш фрагмента остаются
+        только сессия, пользователь и поиск самой группы"""
+        group = Group.objects.create(title='Группа', slug='group')
+        url = reverse('posts:group_list', kwargs={'slug': group.slug})
+        self.authorized_client.get(url)
+        with self.assertNumQueries(3):
+            self.authorized_client.get(url)
+
+    def test_post_delete_invalidates_index_cache(self):
+        """Удалённый пост сразу пропадает из закэшированной ленты"""
+        first_case = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(first_case, self.post.text)
+        Post.objects.get(id=self.post.id).delete()
+        second_case = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(second_case, self.post.text)
+
+    def test_post_edit_invalidates_group_and_profile_cache(self):
+        """Правка поста сразу видна на страницах групп и профиля"""
+        group = Group.objects.create(title='Группа', slug='group')
+        urls = (
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:group_list', kwargs={'slug': group.slug}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        post = Post.objects.get(id=self.post.id)
+        post.text = 'Исправленный текст'
+        post.group = group
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Исправленный текст')
+
+    def test_group_change_invalidates_previous_group_page(self):
+        """Пост, перенесённый в другую группу, пропадает со старой"""
+        old_group = Group.objects.create(title='Старая', slug='old')
+        new_group = Group.objects.create(title='Новая', slug='new')
+        post = Post.objects.create(author=self.author, text='Переезд',
+                                   group=old_group)
+        url = reverse('posts:group_list', kwargs={'slug': old_group.slug})
+        self.assertContains(self.authorized_client.get(url), 'Переезд')
+        post = Post.objects.get(id=post.id)
+        post.group = new_group
+        post.save()
+        self.assertNotContains(self.authorized_client.get(url), 'Переезд')
+
+    def test_post_card_cached_until_post_changes(self):
+        """Карточка поста берётся из кэша, пока пост не изменён"""
+        post_cards([Post.objects.get(id=self.post.id)])
+        Post.objects.filter(id=self.post.id).update(text='Другой текст')
+        post = Post.objects.get(id=self.post.id)
+        self.assertIn(self.post.text, post_cards([post])[0])
+        post.save()
+        self.assertIn('Другой текст', post_cards([post])[0])
+
+    def test_post_card_variants(self):
+        """show_posts — отдельный вариант карточки"""
+        post = Post.objects.get(id=self.post.id)
+        with_link, = post_cards([post], show_posts=True)
+        without_link, = post_cards([post], show_posts=False)
+        self.assertIn('все посты пользователя', with_link)
+        self.assertNotIn('все посты пользователя', without_link)
+
+    def test_author_rename_invalidates_lists(self):
+        """Новое имя автора сразу видно на главной, в группе и профиле,
+        а вход в систему кэш не сбрасывает"""
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.filter(id=self.post.id).update(group=group)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:group_list', kwargs={'slug': group.slug}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        version = caching.index_version()
+        self.client.login(username='test_name', password='test-pass')
+        self.assertEqual(caching.index_version(), version)
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Лев'
+        author.last_name = 'Толстой'
+        author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.authorized_client.get(url),
+                                    'Лев Толстой')
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.other_group = Group.objects.create(title='Другая', slug='other')
+        cls.post = Post.objects.create(author=cls.author, text='Текст',
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    def test_guest_gets_cached_page(self):
+        """Повторный анонимный запрос отдаётся из кэша страниц"""
+        url = reverse('posts:index')
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, self.post.text)
+
+    def test_page_key_ignores_host_and_junk_params(self):
+        """Хост и посторонние параметры не дают новых записей: такие
+        запросы получают каноническую страницу из кэша"""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        for params, host in (({'utm': 'x'}, 'localhost'),
+                             ({'utm': 'y'}, 'testserver')):
+            response = self.guest_client.get(url, params, HTTP_HOST=host)
+            self.assertEqual(response['X-Page-Cache'], 'HIT')
+
+    def test_unaccepted_params_are_not_cached(self):
+        """Значения, которые вьюха не приняла, не сохраняются"""
+        url = reverse('posts:index')
+        for params in ({'page': '999'}, {'cursor': 'мусор'}):
+            self.guest_client.get(url, params)
+            response = self.guest_client.get(url, params)
+            self.assertEqual(response['X-Page-Cache'], 'MISS')
+        detail = reverse('posts:post_detail',
+                         kwargs={'post_id': self.post.id})
+        self.guest_client.get(detail, {'page': '5'})
+        response = self.guest_client.get(detail, {'page': '5'})
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+
+    def test_authorized_user_is_not_cached(self):
+        """Страницы авторизованных пользователей не кэшируются целиком"""
+        url = reverse('posts:index')
+        self.authorized_client.get(url)
+        response = self.authorized_client.get(url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+    def test_comment_purges_post_detail(self):
+        """Новый комментарий сбрасывает страницу поста"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.guest_client.get(url)
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Новый комментарий')
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_purge_touches_only_dependent_pages(self):
+        """Пост в одной группе не сбрасывает страницу другой"""
+        urls = {
+            slug: reverse('posts:group_list', kwargs={'slug': slug})
+            for slug in (self.group.slug, self.other_group.slug)
+        }
+        for url in urls.values():
+            self.guest_client.get(url)
+        Post.objects.create(author=self.author, text='Ещё', group=self.group)
+        response = self.guest_client.get(urls[self.group.slug])
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        response = self.guest_client.get(urls[self.other_group.slug])
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+
+    def test_status_reports_counters(self):
+        """Счётчики попаданий доступны персоналу"""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        self.guest_client.get(url)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.authorized_client.force_login(staff)
+        stats = self.authorized_client.get(reverse('status')).json()
+        self.assertEqual(stats['page_cache']['hits'], 1)
+        self.assertEqual(stats['page_cache']['misses'], 1)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='test_name')
+        cls.post = Post.objects.create(author=cls.author, text='Текст')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+        self.url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.id})
+
+    def test_matching_etag_gets_304(self):
+        """Совпавший If-None-Match получает 304 без рендера шаблона"""
+        # первый ответ выставляет CSRF-cookie, которая входит в ETag
+        self.authorized_client.get(self.url)
+        etag = self.authorized_client.get(self.url)['ETag']
+        response = self.authorized_client.get(self.url,
+                                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response.templates, [])
+
+    def test_comment_changes_etag(self):
+        """Новый комментарий меняет валидатор страницы поста"""
+        etag = self.guest_client.get(self.url)['ETag']
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        response = self.guest_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_is_per_user(self):
+        """Гость и автор получают разные валидаторы"""
+        self.assertNotEqual(self.guest_client.get(self.url)['ETag'],
+                            self.authorized_client.get(self.url)['ETag'])
+
+    def test_follow_changes_profile_etag(self):
+        """Подписка меняет валидатор страницы профиля"""
+        reader = User.objects.create_user(username='reader')
+        self.authorized_client.force_login(reader)
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        etag = self.authorized_client.get(url)['ETag']
+        Follow.objects.create(user=reader, author=self.author)
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_if_modified_since_for_guest(self):
+        """Гость получает Last-Modified и 304 по If-Modified-Since"""
+        later = time.time() + 2
+        with mock.patch('core.cache.pages.time') as clock:
+            clock.time.return_value = later
+            response = self.guest_client.get(self.url)
+            last_modified = response['Last-Modified']
+            response = self.guest_client.get(
+                self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_no_last_modified_within_bump_second(self):
+        """Пока не кончилась секунда сброса, Last-Modified не отдаётся:
+        правка в ту же секунду не получит 304 по If-Modified-Since"""
+        response = self.guest_client.get(self.url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        since = http_date(time.time() + 1)
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        response = self.guest_client.get(self.url,
+                                         HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -341,6 +609,7 @@ class FollowTest(TestCase):
         )
 
     def setUp(self):
+        caches['feeds'].clear()
         self.client_user_follower = Client()
         self.client_author_following = Client()
         self.client_user_follower.force_login(self.user_follower)
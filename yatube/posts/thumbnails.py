@@ -0,0 +1,420 @@
+"""Миниатюры картинок постов вне запроса.
+
+Сохранение поста с новой картинкой ставит ThumbnailJob в очередь, а
+команда thumbnail_worker делает по ней миниатюры всех размеров из
+SIZES. Шаблоны берут миниатюру только из kvstore sorl (ready()) и,
+пока её нет, показывают заглушку, так что запрос никогда не декодирует
+и не пережимает картинку сам. Готовая миниатюра сдвигает updated_at
+поста и сбрасывает его области кэша: карточка и страницы с заглушкой
+перерисовываются.
+
+Задание, которое упало MAX_ATTEMPTS раз, остаётся в таблице как
+отметка и больше не берётся; новая картинка ставит его заново. Такая
+карточка выходит без картинки и без заглушки, а шаблон не пытается
+дослать задание. С THUMBNAIL_ASYNC = False воркера нет, и задания
+не ставятся вовсе.
+Счётчики задержки лежат в кэше: с общим кэшем (YATUBE_CACHE_PATH)
+их видно из любого процесса.
+
+Для массовой перегенерации (regenerate_thumbnails) миниатюры делятся на
+render() в процессах пула и store() в основном процессе: рендер не
+трогает базу, а kvstore пишется пачкой в одной транзакции.
+
+Картинка карточки — <picture> из нескольких ширин (WIDTHS) в WebP и,
+если Pillow умеет его писать, AVIF; JPEG CARD остаётся запасным src.
+Все варианты делаются из одного декодирования картинки.
+"""
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.parsers import parse_geometry
+from sorl.thumbnail.helpers import deserialize, serialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import caching
+from .models import Post, ThumbnailJob
+
+logger = logging.getLogger(__name__)
+
+# миниатюра карточки и страницы поста: JPEG для старых браузеров
+CARD_WIDTH, CARD_HEIGHT = 960, 339
+CARD = (f'{CARD_WIDTH}x{CARD_HEIGHT}', {'crop': 'center', 'upscale': True})
+# ширины для srcset, высота — в пропорции CARD
+WIDTHS = (320, 640, CARD_WIDTH)
+# AVIF пишет Pillow >= 11.3 или pillow-avif-plugin
+Image.init()
+FORMATS = tuple(fmt for fmt in ('AVIF', 'WEBP') if fmt in Image.SAVE)
+EXTENSIONS.setdefault('AVIF', 'avif')
+# при равном на глаз качестве новым форматам хватает меньшего quality
+QUALITY = {'AVIF': 60, 'WEBP': 80}
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp',
+              'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+
+def variant(width, format_=None):
+    geometry, options = CARD
+    options = dict(options)
+    if format_:
+        options.update(format=format_, quality=QUALITY[format_])
+    return f'{width}x{round(width * CARD_HEIGHT / CARD_WIDTH)}', options
+
+
+# CARD первым: по нему карточка считается готовой
+SIZES = ((CARD,)
+         + tuple(variant(width) for width in WIDTHS if width != CARD_WIDTH)
+         + tuple(variant(width, fmt) for fmt in FORMATS for width in WIDTHS))
+MAX_ATTEMPTS = 3
+DONE = 'thumbnails:done'
+FAILED = 'thumbnails:failed'
+LATENCY = 'thumbnails:latency_ms'
+
+
+class CachedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который умеет только смотреть в kvstore
+    или только рисовать миниатюру."""
+
+    def _options(self, source, options):
+        # те же умолчания, что в ThumbnailBackend.get_thumbnail:
+        # от них зависит имя миниатюры
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """ImageFile миниатюры без размера: имя и ключ в kvstore."""
+        source = ImageFile(file_)
+        options = self._options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_cached(self, file_, geometry_string, **options):
+        return ready_many([file_], (geometry_string, options),
+                          sync=False)[0]
+
+    def render(self, source, sizes):
+        """Рисует миниатюры всех sizes поверх старых из одного
+        декодирования картинки, не заглядывая в kvstore. Ошибки чтения
+        картинки не глотаются."""
+        source_image = default.engine.get_image(source)
+        try:
+            image_info = default.engine.get_image_info(source_image)
+            source.set_size(default.engine.get_image_size(source_image))
+            rendered = []
+            for geometry_string, options in sizes:
+                options = self._options(source, dict(options))
+                thumbnail = ImageFile(self._get_thumbnail_filename(
+                    source, geometry_string, options), default.storage)
+                options['image_info'] = image_info
+                self._create_thumbnail(source_image, geometry_string,
+                                       options, thumbnail)
+                self._create_alternative_resolutions(
+                    source_image, geometry_string, options, thumbnail.name)
+                rendered.append(thumbnail)
+        finally:
+            default.engine.cleanup(source_image)
+        return rendered
+
+    def encode(self, source, sizes):
+        """Байты миниатюр всех sizes в памяти, без записи в хранилище:
+        для сравнения размеров форматов."""
+        source_image = default.engine.get_image(source)
+        try:
+            image_info = default.engine.get_image_info(source_image)
+            encoded = []
+            for geometry_string, options in sizes:
+                options = self._options(source, dict(options))
+                ratio = default.engine.get_image_ratio(source_image, options)
+                image = default.engine.create(
+                    source_image, parse_geometry(geometry_string, ratio),
+                    options)
+                encoded.append(default.engine._get_raw_data(
+                    image, options['format'], options['quality'],
+                    image_info=image_info,
+                    progressive=options.get(
+                        'progressive', sorl_settings.THUMBNAIL_PROGRESSIVE)))
+        finally:
+            default.engine.cleanup(source_image)
+        return encoded
+
+
+backend = CachedThumbnailBackend()
+
+
+def _get_many(keys):
+    """Сырые значения kvstore: кэш одним get_many, промахи одним
+    запросом. Отсутствие не кэшируется, как в sorl: миниатюру пишет
+    другой процесс, и запомненный промах прятал бы её до истечения
+    THUMBNAIL_CACHE_TIMEOUT."""
+    if not isinstance(default.kvstore, KVStore):
+        return {key: default.kvstore._get_raw(key) for key in keys}
+    kv_cache = default.kvstore.cache
+    found = {key: value for key, value in kv_cache.get_many(keys).items()
+             if value is not EMPTY_VALUE}
+    missing = [key for key in keys if key not in found]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        kv_cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(stored)
+    return found
+
+
+def _render_now(image, sizes):
+    """Синхронный режим: все sizes из одного декодирования, как у
+    воркера. Битая картинка — миниатюр нет."""
+    source = ImageFile(image)
+    try:
+        rendered = backend.render(source, sizes)
+    except Exception:
+        logger.exception('Не удалось сделать миниатюры %s', image.name)
+        return [None] * len(sizes)
+    store([(source, thumbnail) for thumbnail in rendered])
+    return rendered
+
+
+def _lookup(images, sizes, sync=None):
+    """Миниатюры картинок во всех sizes за один поход в kvstore: по
+    списку на картинку в порядке sizes, None — миниатюры ещё нет.
+
+    С sync картинка без первой из sizes рисуется тут же во всех sizes;
+    недостающие варианты при готовой первой запрос не рисует."""
+    if sync is None:
+        sync = not settings.THUMBNAIL_ASYNC
+    keys = {}
+    for image in images:
+        if image:
+            for index, (geometry, options) in enumerate(sizes):
+                thumbnail = backend.thumbnail_file(image, geometry,
+                                                   **options)
+                keys[image.name, index] = add_prefix(thumbnail.key)
+    found = _get_many(list(keys.values()))
+    result = []
+    for image in images:
+        row = []
+        for index in range(len(sizes)):
+            value = found.get(keys.get((getattr(image, 'name', None),
+                                        index)))
+            row.append(deserialize_image_file(value) if value else None)
+        if image and sync and row[0] is None:
+            row = _render_now(image, sizes)
+        result.append(row)
+    return result
+
+
+def ready_many(images, size=CARD, sync=None):
+    """ready() для нескольких картинок за один поход в kvstore.
+
+    Список в порядке images; для пустых картинок — None.
+    """
+    return [row[0] for row in _lookup(images, [size], sync)]
+
+
+Picture = namedtuple('Picture', 'img srcset sources')
+
+
+def _srcset(files):
+    return ', '.join(f'{file_.url} {file_.width}w'
+                     for file_ in sorted(files, key=lambda f: f.width))
+
+
+def pictures(images):
+    """Всё для <picture> каждой картинки: img — запасной JPEG CARD,
+    srcset — его ширины, sources — пары (MIME-тип, srcset) новых
+    форматов. None, пока нет CARD; вариантов, которых ещё нет
+    (картинки до появления WIDTHS), просто нет в srcset."""
+    result = []
+    for row in _lookup(images, SIZES):
+        if row[0] is None:
+            result.append(None)
+            continue
+        formats = {}
+        for (_, options), thumbnail in zip(SIZES, row):
+            if thumbnail is not None:
+                fmt = options.get('format', sorl_settings.THUMBNAIL_FORMAT)
+                formats.setdefault(fmt, []).append(thumbnail)
+        result.append(Picture(
+            img=row[0],
+            srcset=_srcset(formats.pop(
+                sorl_settings.THUMBNAIL_FORMAT, [row[0]])),
+            sources=[(MIME_TYPES[fmt], _srcset(formats[fmt]))
+                     for fmt in FORMATS if fmt in formats],
+        ))
+    return result
+
+
+def ready(image, size=CARD):
+    """Готовая миниатюра или None, пока воркер её не сделал.
+
+    С THUMBNAIL_ASYNC = False миниатюра делается тут же, как раньше.
+    """
+    return ready_many([image], size)[0]
+
+
+def prefetch(posts):
+    """Картинки карточек целой страницы: один поход в kvstore вместо
+    отдельного на каждую миниатюру. Результат pictures() лежит в
+    post.card_picture, а post.card_pending — ждать ли её: задание,
+    брошенное после MAX_ATTEMPTS, уже ничего не сделает. Потерянные
+    задания досылаются одной пачкой."""
+    posts = list(posts)
+    missing = {}
+    for post, picture in zip(posts, pictures([post.image
+                                              for post in posts])):
+        post.card_picture = picture
+        post.card_pending = False
+        if picture is None and post.image:
+            missing[post.pk] = post
+    if not missing or not settings.THUMBNAIL_ASYNC:
+        return
+    attempts = dict(ThumbnailJob.objects.filter(
+        post_id__in=missing).values_list('post_id', 'attempts'))
+    for pk, post in missing.items():
+        post.card_pending = attempts.get(pk, 0) < MAX_ATTEMPTS
+    enqueue([post for pk, post in missing.items() if pk not in attempts],
+            reset=False)
+
+
+def enqueue(posts, reset=True):
+    """Ставит посты с картинками в очередь.
+
+    С reset=False уже стоящие (и упавшие) задания не трогаются — так
+    шаблон досылает потерянные задания, не перезапуская упавшие.
+    С THUMBNAIL_ASYNC = False ничего не делает: очередь некому разбирать.
+    """
+    ids = [post.pk for post in posts if post.image]
+    if not ids or not settings.THUMBNAIL_ASYNC:
+        return
+    now = timezone.now()
+    if reset:
+        ThumbnailJob.objects.filter(post_id__in=ids).update(
+            created=now, started=None, attempts=0)
+    ThumbnailJob.objects.bulk_create(
+        [ThumbnailJob(post_id=pk, created=now) for pk in ids],
+        ignore_conflicts=True)
+
+
+def pending():
+    return ThumbnailJob.objects.filter(attempts__lt=MAX_ATTEMPTS)
+
+
+def claim():
+    """Берёт самое старое свободное задание (или брошенное упавшим
+    воркером дольше THUMBNAIL_JOB_TIMEOUT назад)."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.THUMBNAIL_JOB_TIMEOUT)
+    free = pending().filter(Q(started__isnull=True) | Q(started__lt=stale))
+    for job in free.order_by('created', 'pk')[:10]:
+        # условный UPDATE: из нескольких воркеров задание получит один
+        if ThumbnailJob.objects.filter(
+                pk=job.pk, started=job.started).update(started=now):
+            job.started = now
+            return job
+    return None
+
+
+def store(rendered):
+    """Записывает пары (картинка, миниатюра) из render() в kvstore.
+
+    Для kvstore в базе (по умолчанию) это одна транзакция на всю пачку
+    вместо нескольких запросов на каждую миниатюру.
+    """
+    if not isinstance(default.kvstore, KVStore):
+        for source, thumbnail in rendered:
+            default.kvstore.set(source)
+            default.kvstore.set(thumbnail, source)
+        return
+    values = {}
+    lists = {}
+    for source, thumbnail in rendered:
+        values[add_prefix(source.key)] = source.serialize()
+        values[add_prefix(thumbnail.key)] = thumbnail.serialize()
+        lists.setdefault(add_prefix(source.key, 'thumbnails'),
+                         set()).add(thumbnail.key)
+    with transaction.atomic():
+        for key, value in KVStoreModel.objects.filter(
+                key__in=lists).values_list('key', 'value'):
+            lists[key].update(deserialize(value))
+        values.update((key, serialize(sorted(keys)))
+                      for key, keys in lists.items())
+        KVStoreModel.objects.filter(key__in=values).delete()
+        KVStoreModel.objects.bulk_create(
+            [KVStoreModel(key=key, value=value)
+             for key, value in values.items()])
+    default.kvstore.cache.set_many(values,
+                                   sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+
+
+def _counter(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+
+
+def process(job):
+    """Делает миниатюры задания; True, если получилось."""
+    post = (Post.objects.select_related('author')
+            .filter(pk=job.post_id).first())
+    try:
+        if post is not None and post.image:
+            source = ImageFile(post.image)
+            store([(source, thumbnail)
+                   for thumbnail in backend.render(source, SIZES)])
+    except Exception:
+        logger.exception('Не удалось сделать миниатюры поста %s',
+                         job.post_id)
+        ThumbnailJob.objects.filter(pk=job.pk).update(
+            attempts=job.attempts + 1, started=None)
+        _counter(FAILED)
+        return False
+    latency = timezone.now() - job.created
+    with transaction.atomic():
+        # задание могли перезапустить новой картинкой, пока шла работа
+        ThumbnailJob.objects.filter(pk=job.pk,
+                                    created=job.created).delete()
+        if post is not None:
+            Post.objects.filter(pk=post.pk).update(
+                updated_at=timezone.now())
+            caching.invalidate_post(post)
+    _counter(DONE)
+    _counter(LATENCY, int(latency.total_seconds() * 1000))
+    return True
+
+
+def stats():
+    now = timezone.now()
+    queue = pending().aggregate(depth=Count('pk'), oldest=Min('created'))
+    counters = cache.get_many([DONE, FAILED, LATENCY])
+    done = counters.get(DONE, 0)
+    return {
+        'depth': queue['depth'],
+        'oldest_age': (round((now - queue['oldest']).total_seconds(), 3)
+                       if queue['oldest'] else None),
+        'given_up': ThumbnailJob.objects.filter(
+            attempts__gte=MAX_ATTEMPTS).count(),
+        'done': done,
+        'failed': counters.get(FAILED, 0),
+        'avg_latency_ms': (round(counters.get(LATENCY, 0) / done)
+                           if done else None),
+    }
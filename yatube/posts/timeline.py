@@ -0,0 +1,192 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост автора раскладывается в TimelineEntry каждого подписчика,
+подписка досыпает последние посты автора, отписка их вычищает.
+Автор, набравший TIMELINE_FANOUT_LIMIT подписчиков, переводится в
+pull-режим (AuthorStats.pulled): его посты не раскладываются, а лента
+подтягивает их при чтении (pull on read). Сигналы сдвигают
+followers_count раньше, чем срабатывает подписка.
+
+Обратно автор возвращается, только когда подписчиков меньше
+TIMELINE_FANOUT_LIMIT - TIMELINE_FANOUT_GAP: автор у самого порога не
+переключается туда-обратно на каждой паре подписка-отписка. Досыпка
+его последних постов всем подписчикам — миллионы строк, поэтому её
+делает timeline_worker, а не запрос с отпиской. Пока она идёт, автор
+остаётся в pull-режиме, и ленты ничего не теряют: пагинатор сливает
+записи ленты и выборки pull-авторов без повторов.
+"""
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from . import feed_cache
+from .models import AuthorStats, Follow, Post, TimelineEntry
+
+BATCH_SIZE = 1000
+# строк TimelineEntry на транзакцию досыпки в timeline_worker
+RESUME_ROWS = 20000
+
+
+def is_pulled(author_id):
+    return AuthorStats.objects.filter(user_id=author_id,
+                                      pulled=True).exists()
+
+
+def pulled_authors(user):
+    """Авторы из подписок пользователя, чьи посты читаются напрямую."""
+    return (AuthorStats.objects
+            .filter(user__in=Follow.objects.filter(user=user)
+                    .values('author'),
+                    pulled=True)
+            .values_list('user_id', flat=True))
+
+
+def _pull_if_popular(author_id):
+    """Переводит автора, набравшего порог, в pull-режим; True, если
+    автор в нём."""
+    AuthorStats.objects.filter(
+        user_id=author_id, pulled=False,
+        followers_count__gte=settings.TIMELINE_FANOUT_LIMIT,
+    ).update(pulled=True)
+    return is_pulled(author_id)
+
+
+def resumable():
+    """pull-авторы, которых пора вернуть к раскладке."""
+    return AuthorStats.objects.filter(
+        pulled=True,
+        followers_count__lt=(settings.TIMELINE_FANOUT_LIMIT
+                             - settings.TIMELINE_FANOUT_GAP),
+    ).values_list('user_id', flat=True)
+
+
+def _insert(entries):
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE,
+                                      ignore_conflicts=True)
+
+
+@transaction.atomic
+def fan_out(post):
+    if is_pulled(post.author_id):
+        return
+    followers = (Follow.objects.filter(author=post.author)
+                 .values_list('user', flat=True).iterator())
+    while True:
+        user_ids = list(islice(followers, BATCH_SIZE))
+        if not user_ids:
+            break
+        _insert([TimelineEntry(user_id=user_id, post=post,
+                               pub_date=post.pub_date)
+                 for user_id in user_ids])
+        feed_cache.push(post, user_ids)
+
+
+@transaction.atomic
+def fan_out_many(posts):
+    """Раскладывает пачку постов (например, импортированных).
+
+    Подписчики читаются один раз на автора. Посты могут быть старыми,
+    поэтому закэшированные ленты перечитываются, а не дописываются.
+    """
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    for author_id, author_posts in by_author.items():
+        if is_pulled(author_id):
+            continue
+        followers = (Follow.objects.filter(author_id=author_id)
+                     .values_list('user', flat=True).iterator())
+        while True:
+            user_ids = list(islice(followers, BATCH_SIZE))
+            if not user_ids:
+                break
+            for post in author_posts:
+                _insert([TimelineEntry(user_id=user_id, post=post,
+                                       pub_date=post.pub_date)
+                         for user_id in user_ids])
+            feed_cache.invalidate(user_ids)
+
+
+@transaction.atomic
+def backfill(user, author):
+    if _pull_if_popular(author.pk):
+        return
+    posts = _recent(author).values_list('id', 'pub_date')
+    _insert(TimelineEntry(user=user, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts)
+    feed_cache.invalidate([user.pk])
+
+
+@transaction.atomic
+def prune(user, author):
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+    feed_cache.invalidate([user.pk])
+
+
+def resume(author_id):
+    """Возвращает pull-автора к раскладке; False, если он снова набрал
+    подписчиков и остаётся в pull-режиме.
+
+    Последние посты досыпаются подписчикам пачками по RESUME_ROWS
+    строк, каждая — своей транзакцией. Флаг снимается в последней,
+    вместе с раскладкой постов, вышедших за время досыпки.
+    """
+    posts = list(_recent(author_id).values_list('id', 'pub_date'))
+    last = (Post.objects.filter(author_id=author_id)
+            .aggregate(last=Max('id'))['last'] or 0)
+    followers = (Follow.objects.filter(author_id=author_id)
+                 .values_list('user', flat=True).iterator())
+    chunk = max(1, RESUME_ROWS // max(1, len(posts)))
+    while True:
+        user_ids = list(islice(followers, chunk))
+        if not user_ids:
+            break
+        with transaction.atomic():
+            _insert([TimelineEntry(user_id=user_id, post_id=post_id,
+                                   pub_date=pub_date)
+                     for user_id in user_ids
+                     for post_id, pub_date in posts])
+    with transaction.atomic():
+        if not AuthorStats.objects.filter(
+                user_id=author_id, pk__in=resumable()).update(pulled=False):
+            return False
+        fan_out_many(Post.objects.filter(author_id=author_id, pk__gt=last)
+                     .only('id', 'author_id', 'pub_date'))
+    return True
+
+
+def _recent(author):
+    return (Post.objects.filter(author=author)
+            .order_by('-pub_date')[:settings.TIMELINE_BACKFILL])
+
+
+def retract(post):
+    """Удалённый пост: записи лент ушли каскадом, а закэшированные
+    массивы подписчиков перечитываются. У pull-автора подписчиков
+    слишком много, чтобы сбрасывать ленты всем в запросе: его посты
+    в массивы и так попадают только с прежних времён, а на удалённый
+    id CachedTimelinePaginator ответит seek'ом."""
+    if is_pulled(post.author_id):
+        return
+    followers = (Follow.objects.filter(author_id=post.author_id)
+                 .values_list('user', flat=True).iterator())
+    while True:
+        user_ids = list(islice(followers, BATCH_SIZE))
+        if not user_ids:
+            break
+        feed_cache.invalidate(user_ids)
+
+
+def follow_feed(user):
+    """Записи ленты и посты pull-авторов для TimelinePaginator.
+
+    Посты каждого pull-автора — отдельная выборка: так каждая читается
+    по индексу (author, pub_date, id) без сортировки, а с author__in
+    SQLite сортировал бы все посты этих авторов.
+    """
+    authors = list(pulled_authors(user))
+    pulled = [Post.objects.filter(author_id=author) for author in authors]
+    return user.timeline.all(), pulled or None
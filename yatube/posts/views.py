@@ -1,39 +1,107 @@
 from django.core.paginator import Paginator
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
+from core.cache.pages import page_params, tag_page
+from core.routers import replica_safe
 
+
+from . import caching, counters, export, search
+from .feed_cache import CachedTimelinePaginator, feed_ids
 from .forms import PostForm, CommentForm
 from .models import Follow, Post, Group, User
+from .paginator import (LAST, CommentPaginator, KeysetPaginator,
+                        TimelinePaginator, decode_comment_cursor)
+from .timeline import follow_feed
 
 
-def numeration(queryset, request):
-    paginator = Paginator(queryset, settings.CNT_POST)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+def numeration(queryset, request, paginator_class=KeysetPaginator,
+               lazy=False, **kwargs):
+    """Страница ленты по ?cursor= или ?page= и часть ключа фрагмента,
+    которая её определяет.
 
+    Ключ строится из параметров, приведённых пагинатором (clean()),
+    поэтому чужие курсоры и номера страниц не плодят записей в кэше.
+    Страница по старой ссылке ?page=N читается сразу: номер за концом
+    ленты отдаёт последнюю страницу, и ключ берётся уже по ней.
+    С lazy=True запросы ленты выполняются при первом обращении к
+    странице: если фрагмент шаблона уже в кэше, до них дело не доходит.
+    """
+    paginator = paginator_class(queryset, settings.CNT_POST, **kwargs)
+    cursor, number = paginator.clean(request.GET.get('cursor'),
+                                     request.GET.get('page'))
+    if number is not None:
+        page = paginator.get_cursor_page(page_number=number)
+        if page.cursor == LAST:
+            cursor, number = LAST, None
+        else:
+            number = page.number if page.number > 1 else None
+    elif lazy:
+        page = SimpleLazyObject(lambda: paginator.get_cursor_page(cursor))
+    else:
+        page = paginator.get_cursor_page(cursor)
+    page_params(request, cursor=cursor, page=number)
+    return page, cursor or str(number or 1)
 
+
+@replica_safe
 def index(request):
+    not_modified = tag_page(request, caching.INDEX)
+    if not_modified is not None:
+        return not_modified
     post_list = Post.objects.all().select_related('author', 'group')
+    page_obj, key = numeration(post_list, request, lazy=True)
     context = {
-        'page_obj': numeration(post_list, request)
+        'page_obj': page_obj,
+        'page_key': key,
+        'cache_ttl': settings.FRAGMENT_CACHE_TTL,
+        'cache_version': caching.index_version(),
     }
     return render(request, 'posts/index.html', context)
 
 
+@replica_safe
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
+    not_modified = tag_page(request, caching.group_scope(group.pk),
+                            caching.GROUPS)
+    if not_modified is not None:
+        return not_modified
     post_list = group.posts.select_related('author')
+    page_obj, key = numeration(post_list, request, lazy=True)
     context = {
         'group': group,
-        'page_obj': numeration(post_list, request),
+        'page_obj': page_obj,
+        'page_key': key,
+        'cache_ttl': settings.FRAGMENT_CACHE_TTL,
+        'cache_version': caching.group_version(group),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@replica_safe
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    not_modified = tag_page(request, caching.INDEX)
+    if not_modified is not None:
+        return not_modified
+    posts = search.search(query, Post.objects.select_related('author',
+                                                             'group'))
+    page_obj = Paginator(posts, settings.CNT_POST).get_page(
+        request.GET.get('page'))
+    page_params(request, q=query,
+                page=page_obj.number if page_obj.number > 1 else None)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
@@ -67,33 +135,75 @@ def post_edit(request, post_id):
         return redirect('posts:post_detail', post.pk)
 
 
+@replica_safe
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    not_modified = tag_page(request, caching.author_scope(author.pk),
+                            caching.GROUPS,
+                            caching.followers_scope(author.pk))
+    if not_modified is not None:
+        return not_modified
     author_post = author.posts.select_related('group')
     following = (request.user.is_authenticated
                  and Follow.objects.filter(user=request.user,
                                            author=author).exists())
+    page_obj, key = numeration(author_post, request, lazy=True)
     context = {
         'author': author,
+        'stats': counters.user_stats(author),
         'following': following,
-        'page_obj': numeration(author_post, request),
+        'page_obj': page_obj,
+        'page_key': key,
+        'cache_ttl': settings.FRAGMENT_CACHE_TTL,
+        'cache_version': caching.profile_version(author),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@replica_safe
 def post_detail(request, post_id):
-    post = get_object_or_404(Post.objects.select_related('author', 'group'),
-                             id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    not_modified = tag_page(request, caching.post_scope(post.pk),
+                            caching.author_scope(post.author_id),
+                            caching.GROUPS)
+    if not_modified is not None:
+        return not_modified
     form = CommentForm()
-    comments = post.comments.all()
+    comments, comments_cursor = CommentPaginator(
+        post.comments, settings.CNT_COMMENT).get_page()
     context = {
         'post': post,
+        'author_stats': counters.user_stats(post.author),
         'form': form,
         'comments': comments,
+        'comments_cursor': comments_cursor,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@replica_safe
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки «показать ещё»."""
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    not_modified = tag_page(request, caching.post_scope(post.pk))
+    if not_modified is not None:
+        return not_modified
+    cursor = request.GET.get('cursor')
+    if cursor and decode_comment_cursor(cursor) is None:
+        cursor = None
+    page_params(request, cursor=cursor)
+    comments, comments_cursor = CommentPaginator(
+        post.comments, settings.CNT_COMMENT).get_page(cursor)
+    context = {
+        'post': post,
+        'comments': comments,
+        'comments_cursor': comments_cursor,
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -106,11 +216,35 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post.pk)
 
 
+@login_required
+def export_data(request):
+    """Выгрузка своих постов, комментариев и подписок потоком;
+    с ?images=1 — zip-архив вместе с картинками."""
+    fmt = request.GET.get('format')
+    if fmt not in export.FORMATS:
+        fmt = 'jsonl'
+    if request.GET.get('images'):
+        chunks, extension = export.zip_chunks(request.user, fmt), 'zip'
+    else:
+        chunks, extension = export.lines(request.user, fmt), fmt
+    response = StreamingHttpResponse(
+        chunks, content_type=export.CONTENT_TYPES[extension])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{request.user.username}.{extension}"')
+    return response
+
+
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    entries, pulled = follow_feed(request.user)
+    if pulled is None:
+        page_obj, _ = numeration(entries, request, CachedTimelinePaginator,
+                                 ids=feed_ids(request.user))
+    else:
+        page_obj, _ = numeration(entries, request, TimelinePaginator,
+                                 pulled=pulled)
     context = {
-        'page_obj': numeration(post_list, request)
+        'page_obj': page_obj
     }
     return render(request, 'posts/follow.html', context)
 
@@ -69,6 +69,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 #     'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
@@ -110,6 +112,36 @@ DATABASES = {
     }
 }
 
+# YATUBE_SQLITE_PRODUCTION=1: WAL, прагмы и постоянные соединения,
+# см. core.db
+SQLITE_PRODUCTION = os.environ.get('YATUBE_SQLITE_PRODUCTION') == '1'
+SQLITE_PRAGMAS = {}
+
+if SQLITE_PRODUCTION:
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    }
+
+# YATUBE_REPLICA_PATH: файл реплики для читающих вьюх, см. core.routers
+REPLICA_PATH = os.environ.get('YATUBE_REPLICA_PATH')
+REPLICA_MAX_LAG: int = 30
+# запас на транзакцию между сбросом поколения и её фиксацией
+REPLICA_SETTLE: float = 1
+# по состоянию миниатюр GET решает, ставить ли задание, — только основная БД
+REPLICA_PRIMARY_MODELS: tuple = ('thumbnail.kvstore', 'posts.thumbnailjob')
+
+if REPLICA_PATH:
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=REPLICA_PATH,
+                                TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -152,13 +184,71 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# YATUBE_CACHE_PATH включает общий для всех воркеров кэш в файле SQLite
+SHARED_CACHE_PATH = os.environ.get('YATUBE_CACHE_PATH')
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'feeds': {
+        'BACKEND': 'core.cache.packed.PackedIdCache',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_BYTES': 32 * 1024 * 1024,
+        },
+    },
 }
 
+if SHARED_CACHE_PATH:
+    CACHES['shared'] = {
+        'BACKEND': 'core.cache.sqlite.SQLiteCache',
+        'LOCATION': SHARED_CACHE_PATH,
+        'OPTIONS': {
+            'MAX_BYTES': 256 * 1024 * 1024,
+        },
+    }
+    # горячие ключи читаются из памяти процесса, см. core.cache.tiered
+    CACHES['default'] = {
+        'BACKEND': 'core.cache.tiered.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 2000,
+            'L1_TTL': 5,
+            'POLL_INTERVAL': 1,
+            'L1_EXCLUDE': ('page_cache:', 'lock:', 'thumbnails:'),
+        },
+    }
+
 CNT_POST: int = 10
+CNT_COMMENT: int = 20
+SEARCH_STEMMING: bool = True
+THUMBNAIL_ASYNC: bool = True
+THUMBNAIL_JOB_TIMEOUT: int = 5 * 60
+# загруженные картинки постов: больше POST_IMAGE_MAX_PIXELS не
+# принимаются, больше POST_IMAGE_MAX_SIDE по длинной стороне уменьшаются
+POST_IMAGE_MAX_PIXELS: int = 50_000_000
+POST_IMAGE_MAX_SIDE: int = 2048
+POST_IMAGE_QUALITY: int = 88
 POST_MOD: int = 15
 PGN_1_PAGE: int = 10
 PGN_RANGE: int = 13
+PGN_ON_EACH_SIDE: int = 2
+PGN_ON_ENDS: int = 1
+PGN_COUNT_TTL: int = 60
+TIMELINE_FANOUT_LIMIT: int = 10000
+# к раскладке автор возвращается, когда подписчиков меньше LIMIT - GAP
+TIMELINE_FANOUT_GAP: int = 1000
+TIMELINE_BACKFILL: int = 500
+FEED_CACHE_LENGTH: int = 300
+FEED_CACHE_TTL: int = 10 * 60
+# поколения кэша живут в кэше default: без общего кэша воркер не видит
+# чужих сбросов, и долгий TTL держал бы чужие правки часами
+FRAGMENT_CACHE_TTL: int = 3 * 60 * 60 if SHARED_CACHE_PATH else 20
+PAGE_CACHE_TTL: int = 3 * 60 * 60 if SHARED_CACHE_PATH else 20
+# параметры запроса, которые входят в ключ кэша страниц
+PAGE_CACHE_PARAMS: tuple = ('q', 'page', 'cursor')
+STALE_TTL: int = 10 * 60
+STAMPEDE_LOCK_TIMEOUT: int = 30
+STAMPEDE_WAIT: float = 2
+STAMPEDE_BETA: float = 1.0
@@ -2,6 +2,8 @@ from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
+
+from core.views import status
 # import debug_toolbar
 
 
@@ -9,6 +11,7 @@ urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls),
+    path('status/', status, name='status'),
     path('about/', include('about.urls', namespace='about')),
     path('', include('posts.urls', namespace='posts'))
 ]